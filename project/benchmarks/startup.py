@@ -0,0 +1,105 @@
+"""
+Measures the startup cost of nango: how long it takes a fresh
+interpreter to set up django and import the nango modules, and how
+long it takes to look up the classes which nango's modules build
+on demand (e.g. nango.views.generic.edit.UpdateView), with and
+without memoizing them.
+
+Run from the project directory:
+
+    python benchmarks/startup.py [--repeat N]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import timeit
+from pathlib import Path
+
+PROJECT = Path(__file__).resolve().parent.parent
+
+IMPORT_STATEMENT = """
+import django
+django.setup()
+import nango.contrib.admin
+import nango.db.models
+import nango.forms
+import nango.views.generic.edit
+"""
+
+LOOKUPS = """
+edit.UpdateView
+edit.CreateView
+admin.TabularInline
+admin.StackedInline
+"""
+
+
+def setup_django() -> None:
+    sys.path.insert(0, str(PROJECT))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+    import django
+
+    django.setup()
+
+
+def time_imports(repeat: int) -> float:
+    """
+    The fastest of several fresh interpreters, in seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", IMPORT_STATEMENT],
+            cwd=PROJECT,
+            env={"DJANGO_SETTINGS_MODULE": "project.settings", **os.environ},
+            check=True,
+        )
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def time_lookups(repeat: int, *, memoized: bool) -> float:
+    """
+    The fastest time for a thousand lookups of each name, in seconds
+    """
+    from nango import common
+    from nango.contrib import admin
+    from nango.views.generic import edit
+
+    original = common._mixin_class
+    if not memoized:
+        common._mixin_class = original.__wrapped__  # type: ignore
+    try:
+        return min(
+            timeit.repeat(
+                LOOKUPS,
+                globals=dict(admin=admin, edit=edit),
+                number=1000,
+                repeat=repeat,
+            )
+        )
+    finally:
+        common._mixin_class = original  # type: ignore
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    results = {
+        "import (s)": time_imports(args.repeat),
+        "1000 lookups, rebuilt (s)": time_lookups(args.repeat, memoized=False),
+        "1000 lookups, memoized (s)": time_lookups(args.repeat, memoized=True),
+    }
+    width = max(map(len, results))
+    for name, seconds in results.items():
+        print(f"{name:<{width}}  {seconds:.6f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+"""
+Load and latency benchmark of the live-update path.
+
+Connects a number of simulated clients to LiveUpdatesConsumer, using
+WebsocketCommunicator and the in-memory channel layer, each
+registering some fields. It then makes a stream of saves, Cleans and
+Submits and reports:
+
+- the latency from an event to each client being notified (or,
+  for Cleans and Submits, to the reply), as percentiles
+- database queries per event
+- frames and bytes sent to the clients per event
+- memory used per connection
+
+Run from the project directory, for example:
+
+    python benchmarks/websocket.py --clients 100 --fields 4 --events 500
+
+Results can be saved with --output and compared with those from
+another commit with --compare.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import zlib
+from collections import Counter
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+PROJECT = Path(__file__).resolve().parent.parent
+
+# Words which pass the demo Customer.clean() rules
+WORDS = [
+    "Alice",
+    "Bertie",
+    "Carla",
+    "Donna",
+    "Eric",
+    "Fiona",
+    "Gary",
+    "Helen",
+    "Ivan",
+    "Julia",
+]
+
+
+def setup_django() -> None:
+    sys.path.insert(0, str(PROJECT))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+    import django
+
+    django.setup()
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    values = sorted(values)
+    return {
+        **{
+            f"p{p}": values[min(len(values) - 1, int(len(values) * p / 100))] * 1000
+            for p in (50, 90, 99)
+        },
+        "max": values[-1] * 1000,
+    }
+
+
+def decode_frame(output: Dict[str, Any]) -> Tuple[str, int]:
+    """
+    The action of a frame sent by the consumer, and its size
+    """
+    if output.get("text") is not None:
+        return json.loads(output["text"])["action"], len(output["text"])
+    data = output["bytes"]
+    payload = zlib.decompress(data[1:]) if data[0] == 1 else data[1:]
+    action = json.loads(payload).get("a")
+    return {"b": "modifyBatch", "c": "clean", "s": "submit"}.get(action, action), len(
+        data
+    )
+
+
+class QueryCounter:
+    def __init__(self) -> None:
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from asgiref.sync import sync_to_async
+    from channels.testing import WebsocketCommunicator
+    from demo.models import Customer
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+    from nango.consumers import LiveUpdatesConsumer
+    from nango.protocol import COMPACT_PROTOCOL
+
+    rng = random.Random(args.seed)
+    queries = QueryCounter()
+
+    def count_queries(sender, connection, **kw):
+        connection.execute_wrappers.append(queries)
+
+    connection_created.connect(count_queries)
+    for connection in connections.all():
+        connection.execute_wrappers.append(queries)
+
+    names = [f"{a} {b}" for a in WORDS for b in WORDS]
+    customers = await sync_to_async(
+        lambda: [
+            Customer.objects.create(name=names[i % len(names)], notes="Notes")
+            for i in range(args.instances)
+        ]
+    )()
+    current = {customer.pk: customer.name for customer in customers}
+
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    application = LiveUpdatesConsumer.as_asgi()
+    clients: List[WebsocketCommunicator] = []
+    subscribers: Dict[Any, List[int]] = defaultdict(list)
+    for index in range(args.clients):
+        communicator = WebsocketCommunicator(
+            application,
+            "/ws/liveupdates/",
+            subprotocols=[COMPACT_PROTOCOL] if args.compact else None,
+        )
+        connected, _ = await communicator.connect()
+        assert connected
+        fields = []
+        for offset in range(args.fields):
+            customer = customers[(index + offset) % len(customers)]
+            subscribers[customer.pk].append(index)
+            fields.append(
+                dict(
+                    appLabel="demo",
+                    model="customer",
+                    pk=str(customer.pk),
+                    attr="name",
+                    value=current[customer.pk],
+                )
+            )
+        message = dict(
+            action="Register",
+            nangoTabId=f"tab-{index}",
+            features=["modifyBatch"],
+            fields=fields,
+        )
+        if args.compact:
+            await communicator.send_to(
+                text_data=json.dumps(
+                    dict(
+                        a="r",
+                        t=message["nangoTabId"],
+                        f=message["features"],
+                        r=[
+                            [f["appLabel"], f["model"], f["pk"], f["attr"], f["value"]]
+                            for f in fields
+                        ],
+                    )
+                )
+            )
+        else:
+            await communicator.send_json_to(message)
+        clients.append(communicator)
+    # let the registrations (and their reconciliation) finish
+    await asyncio.sleep(0.5)
+    memory_per_connection = (
+        tracemalloc.get_traced_memory()[0] - memory_before
+    ) / args.clients
+    tracemalloc.stop()
+
+    mix = [(kind, int(weight)) for kind, weight in (p.split("=") for p in args.mix)]
+    kinds = [kind for kind, weight in mix for _ in range(weight)]
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    frames: Counter = Counter()
+    frame_bytes = 0
+    queries.count = 0
+    timeouts = 0
+    request_id = 0
+    started = time.perf_counter()
+
+    for event in range(args.events):
+        kind = rng.choice(kinds)
+        customer = rng.choice(customers)
+        listeners = subscribers[customer.pk]
+        new_name = rng.choice([n for n in names if n != current[customer.pk]])
+        expected: Counter = Counter()
+        if kind == "save":
+            expected.update(listeners)
+        else:
+            # one of the clients interested in this instance does it
+            sender = rng.choice(listeners) if listeners else 0
+            expected[sender] += 1
+            if kind == "submit":
+                expected.update(listeners)
+        start = time.perf_counter()
+        if kind == "save":
+
+            def save(pk=customer.pk, name=new_name):
+                instance = Customer.objects.get(pk=pk)
+                instance.name = name
+                instance.save(update_fields=["name"])
+
+            await sync_to_async(save, thread_sensitive=False)()
+        else:
+            request_id += 1
+            data = dict(
+                action=kind.title(),
+                nangoTabId=f"tab-{sender}",
+                dataset=dict(
+                    appLabel="demo",
+                    modelName="customer",
+                    instancePk=str(customer.pk),
+                    originalName="name",
+                ),
+                currentValue=new_name,
+                originalValue=current[customer.pk],
+            )
+            if args.compact:
+                await clients[sender].send_to(
+                    text_data=json.dumps(
+                        dict(
+                            a=kind[0],
+                            i=request_id,
+                            t=data["nangoTabId"],
+                            d=["demo", "customer", str(customer.pk), "name"],
+                            cv=new_name,
+                            ov=current[customer.pk],
+                        )
+                    )
+                )
+            else:
+                await clients[sender].send_json_to(data)
+        if kind in ("save", "submit"):
+            current[customer.pk] = new_name
+
+        async def receive(index: int, count: int) -> None:
+            nonlocal frame_bytes, timeouts
+            for _ in range(count):
+                try:
+                    output = await clients[index].receive_output(timeout=args.timeout)
+                except asyncio.TimeoutError:
+                    timeouts += 1
+                    return
+                action, size = decode_frame(output)
+                frames[action] += 1
+                frame_bytes += size
+                latencies["notify" if action == "modifyBatch" else action].append(
+                    time.perf_counter() - start
+                )
+
+        await asyncio.gather(
+            *(receive(index, count) for index, count in expected.items())
+        )
+        if args.rate:
+            await asyncio.sleep(
+                max(0, started + (event + 1) / args.rate - time.perf_counter())
+            )
+
+    elapsed = time.perf_counter() - started
+    for communicator in clients:
+        await communicator.disconnect()
+
+    return dict(
+        settings={
+            key: getattr(args, key)
+            for key in (
+                "clients",
+                "fields",
+                "instances",
+                "events",
+                "mix",
+                "rate",
+                "seed",
+                "compact",
+            )
+        },
+        events_per_second=args.events / elapsed,
+        latency_ms={kind: percentiles(values) for kind, values in latencies.items()},
+        queries_per_event=queries.count / args.events,
+        frames_per_event=sum(frames.values()) / args.events,
+        bytes_per_event=frame_bytes / args.events,
+        frames=dict(frames),
+        timeouts=timeouts,
+        memory_per_connection_kb=memory_per_connection / 1024,
+    )
+
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict) and key != "settings":
+            flat.update(flatten(value, prefix=f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def report(results: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    current = flatten(results)
+    previous = flatten(baseline) if baseline else {}
+    width = max(map(len, current))
+    for key, value in current.items():
+        line = f"{key:<{width}}  {value:12.3f}"
+        if isinstance(previous.get(key), (int, float)) and previous[key]:
+            change = (value - previous[key]) / previous[key] * 100
+            line += f"  ({previous[key]:.3f}, {change:+.1f}%)"
+        print(line)
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PROJECT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--fields", type=int, default=4, help="per client")
+    parser.add_argument("--instances", type=int, default=20)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument(
+        "--mix",
+        nargs="+",
+        default=["save=2", "clean=1", "submit=1"],
+        help="relative weights of each kind of event",
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0, help="events per second, 0 for no limit"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--compact", action="store_true", help="use the subprotocol")
+    parser.add_argument("--timeout", type=float, default=5)
+    parser.add_argument("--output", type=Path, help="save the results as JSON")
+    parser.add_argument("--compare", type=Path, help="results saved by --output")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import override_settings
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        with override_settings(
+            CHANNEL_LAYERS={
+                "default": {
+                    "BACKEND": "channels.layers.InMemoryChannelLayer",
+                    "CONFIG": {"capacity": 10000},
+                }
+            },
+            DEBUG=False,
+        ):
+            assert settings.CHANNEL_LAYERS
+            results = asyncio.run(run(args))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    results["commit"] = commit()
+    baseline = json.loads(args.compare.read_text()) if args.compare else {}
+    if baseline:
+        print(f"compared with {baseline.get('commit')}, in brackets")
+    report(results, baseline)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
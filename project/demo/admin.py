@@ -20,3 +20,5 @@ class CompanyAdmin(ModelAdmin):
 @admin.register(Customer)
 class CustomerAdmin(ModelAdmin):
     auto_clean_fields = ["name"]
+    list_display = ["name", "notes"]
+    list_editable = ["notes"]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.2 on 2026-10-18 20:30
+import nango.db.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("demo", "0004_alter_customer_name"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="company",
+            name="version",
+            field=nango.db.models.VersionField(default=0, editable=False),
+        ),
+    ]
@@ -12,6 +12,7 @@ class Company(models.Model):
 
     name = models.CharField(max_length=100)
     notes = models.TextField()
+    version = models.VersionField()
 
     def __str__(self) -> str:
         return self.name.title()
@@ -33,13 +34,16 @@ def has_vowel_in_each_word(words: str):
     return True
 
 
-class Customer(models.Model):
+class Customer(models.LockableMixin, models.Model):
     name = models.CharField(max_length=100)
     notes = models.TextField()
     company = models.ForeignKey(
         Company, null=True, default=None, on_delete=models.PROTECT
     )
 
+    # lets the index page list the customers of a company
+    subscription_fields = ["company"]
+
     def clean(self):
         self.name = self.name.title()
         if len(self.name) < 5:
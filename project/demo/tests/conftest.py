@@ -13,3 +13,50 @@ def freddy(db, company):
     result = Customer.objects.create(name="Freddy", notes="note", company=company)
     print(f"freddy = {result!r} {result.pk!r}")
     return result
+
+
+@pytest.fixture
+def channel_layer(settings):
+    """
+    Use the in-memory channel layer, so tests do not need redis
+    """
+    from channels.layers import get_channel_layer
+
+    settings.CHANNEL_LAYERS = {
+        "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}
+    }
+    return get_channel_layer()
+
+
+@pytest.fixture(autouse=True)
+def clear_snapshots():
+    """
+    Primary keys are reused between tests, whose changes are rolled back
+    """
+    from nango.snapshots import snapshots
+
+    snapshots.clear()
+    yield
+    snapshots.clear()
+
+
+@pytest.fixture(autouse=True)
+def lock_backend(monkeypatch):
+    """
+    A fresh set of leases for each test
+    """
+    from nango import locks
+
+    backend = locks.InMemoryLockBackend()
+    monkeypatch.setattr(locks, "_backend", backend)
+    return backend
+
+
+@pytest.fixture
+def fanout_hub(monkeypatch):
+    """
+    Have consumers share their group memberships through nango.hub
+    """
+    from nango import consumers
+
+    monkeypatch.setattr(consumers, "ENABLE_FANOUT_HUB", True)
@@ -2,11 +2,12 @@ from typing import Any
 from typing import Dict
 
 from bs4 import BeautifulSoup
+from demo.models import Customer
 
 
 def parse_form(*, form) -> Dict[str, Any]:
     inputs = {
-        element["name"]: element["value"]
+        element["name"]: element.get("value", "")
         for element in form.find_all("input")
         if element.get("type") != "submit"
     }
@@ -88,3 +89,76 @@ def test_conflicting_modify(admin_client, freddy):
     assert errors
     assert "object has changed" in str(errors)
     assert reloaded(freddy).notes == new_note_value1.title()
+
+
+def test_conflicting_modify_with_cas_on_save(admin_client, freddy, monkeypatch):
+    monkeypatch.setattr(Customer, "cas_on_save", True)
+    inputs1 = load_admin_form(client=admin_client, instance=freddy)
+    inputs2 = load_admin_form(client=admin_client, instance=freddy)
+    inputs1["notes"] = "first notes"
+    inputs2["notes"] = "second notes"
+
+    response = save_admin_form(client=admin_client, instance=freddy, inputs=inputs1)
+    assert response.status_code == 302
+    assert reloaded(freddy).notes == "First Notes"
+
+    response = save_admin_form(client=admin_client, instance=freddy, inputs=inputs2)
+    assert response.status_code == 200
+    errors = get_errors(BeautifulSoup(response.content, "html.parser"))
+    assert "object has changed" in str(errors)
+    assert reloaded(freddy).notes == "First Notes"
+
+
+def test_conflicting_modify_with_a_version(admin_client, company):
+    inputs1 = load_admin_form(client=admin_client, instance=company)
+    inputs2 = load_admin_form(client=admin_client, instance=company)
+    inputs1["notes"] = "Anvils"
+    inputs2["notes"] = "Rockets"
+
+    response = save_admin_form(client=admin_client, instance=company, inputs=inputs1)
+    assert response.status_code == 302
+    assert reloaded(company).version == 1
+
+    # the second has a stale version
+    response = save_admin_form(client=admin_client, instance=company, inputs=inputs2)
+    assert response.status_code == 200
+    errors = get_errors(BeautifulSoup(response.content, "html.parser"))
+    assert "object has changed" in str(errors)
+    assert (reloaded(company).notes, reloaded(company).version) == ("Anvils", 1)
+
+
+def load_changelist(*, client):
+    response = client.get("/admin/demo/customer/")
+    assert response.status_code == 200
+    form = BeautifulSoup(response.content, "html.parser").find(
+        "form", {"id": "changelist-form"}
+    )
+    # the rows, without the actions
+    inputs = {
+        element["name"]: element.get("value", "")
+        for element in form.find_all("input", type=["hidden", "text"])
+    }
+    for element in form.find_all("textarea"):
+        inputs[element["name"]] = element.text.lstrip("\n")
+    return inputs
+
+
+def test_changelist_conflicts_are_found_together(
+    admin_client, company, django_assert_max_num_queries
+):
+    customers = [
+        Customer.objects.create(name=name, notes="Some Notes", company=company)
+        for name in ["Alice Smith", "Bertie Wooster"]
+    ]
+    inputs = load_changelist(client=admin_client)
+    rows = {inputs[f"form-{i}-id"]: i for i in range(2)}
+    for customer in customers:
+        inputs[f"form-{rows[str(customer.pk)]}-notes"] = "My Notes"
+    Customer.objects.filter(pk__in=[c.pk for c in customers]).update(
+        notes="Their Notes"
+    )
+    inputs["_save"] = "Save"
+    response = admin_client.post("/admin/demo/customer/", inputs)
+    assert response.status_code == 200
+    assert str(response.content).count("object has changed") == 2
+    assert {c.notes for c in Customer.objects.all()} == {"Their Notes"}
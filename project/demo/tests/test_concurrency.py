@@ -0,0 +1,159 @@
+import pytest
+from demo.models import Company
+from demo.models import Customer
+from django.core import serializers
+from django.db import models as django_models
+from django.db import transaction
+from nango import common
+from nango.common import can_deserialise
+from nango.common import register_serialiser
+from nango.common import serialise_model_attr
+from nango.db.models import ConcurrentModificationError
+
+"""
+Tests for the detection of changes made by someone
+else while a form was being edited
+"""
+
+
+@pytest.fixture
+def cas_on_save(monkeypatch):
+    monkeypatch.setattr(Customer, "cas_on_save", True)
+
+
+def original_values(customer: Customer):
+    return {
+        attr: serialise_model_attr(customer, attr)
+        for attr in ["name", "notes", "company"]
+    }
+
+
+def test_cas_save_is_a_single_update(
+    cas_on_save, freddy: Customer, django_assert_num_queries
+):
+    freddy = Customer.objects.get(pk=freddy.pk)
+    freddy._original_form_values = original_values(freddy)
+    freddy.notes = "Changed"
+    with django_assert_num_queries(1):
+        freddy.clean()
+        freddy.save()
+    assert Customer.objects.get(pk=freddy.pk).notes == "Changed"
+
+
+def test_cas_save_rejects_conflicts(cas_on_save, freddy: Customer):
+    editing = Customer.objects.get(pk=freddy.pk)
+    editing._original_form_values = original_values(editing)
+    Customer.objects.filter(pk=freddy.pk).update(name="Roger")
+    editing.notes = "changed"
+    with pytest.raises(ConcurrentModificationError) as info:
+        with transaction.atomic():
+            editing.save()
+    assert "Field name was Freddy" in str(info.value)
+    assert Customer.objects.get(pk=freddy.pk).notes == "note"
+
+
+@pytest.fixture
+def upper_case_text(monkeypatch):
+    """
+    A serialiser deserialise_value cannot undo, as with JSONField
+    """
+    monkeypatch.setattr(common, "SERIALISERS", dict(common.SERIALISERS))
+    register_serialiser(django_models.TextField, lambda value: value.upper())
+    yield
+    common.get_serialisation_plan.cache_clear()
+
+
+def test_cas_save_compares_other_values_in_python(
+    cas_on_save, upper_case_text, freddy: Customer
+):
+    assert not can_deserialise(Customer, "notes")
+    editing = Customer.objects.get(pk=freddy.pk)
+    editing._original_form_values = original_values(editing)
+    assert editing._original_form_values["notes"] == "NOTE"
+    editing.name = "Roger"
+    editing.save()
+    assert Customer.objects.get(pk=freddy.pk).name == "Roger"
+
+    editing = Customer.objects.get(pk=freddy.pk)
+    editing._original_form_values = original_values(editing)
+    Customer.objects.filter(pk=freddy.pk).update(notes="Other notes")
+    editing.name = "Ajax"
+    with pytest.raises(ConcurrentModificationError) as info:
+        with transaction.atomic():
+            editing.save()
+    assert "Field notes was NOTE" in str(info.value)
+    assert Customer.objects.get(pk=freddy.pk).name == "Roger"
+
+
+def test_cas_save_compares_nulls(cas_on_save, freddy: Customer):
+    freddy.company = None
+    freddy.save()
+    freddy._original_form_values = original_values(freddy)
+    freddy.notes = "changed"
+    freddy.save()
+    assert Customer.objects.get(pk=freddy.pk).notes == "changed"
+
+
+def test_version_is_compared_and_incremented(db, django_assert_num_queries):
+    company = Company.objects.create(name="Acme", notes="Anvils")
+    assert company.version == 0
+    editing = Company.objects.get(pk=company.pk)
+    editing._original_form_values = {"version": "0"}
+    editing.notes = "Rockets"
+    with django_assert_num_queries(1):
+        editing.clean()
+        editing.save()
+    assert editing.version == 1
+    assert Company.objects.get(pk=company.pk).version == 1
+
+
+def test_saving_some_fields_keeps_the_version_current(db):
+    company = Company.objects.create(name="Acme", notes="Anvils")
+    company.name = "Ajax"
+    company.save(update_fields=["name"])
+    assert company.version == 1
+    # so the next save does not announce a change of version
+    assert company.get_changed_fields() == set()
+
+
+def test_stale_version_is_rejected(db):
+    company = Company.objects.create(name="Acme", notes="Anvils")
+    editing = Company.objects.get(pk=company.pk)
+    editing._original_form_values = {"version": "0"}
+    Company.objects.filter(pk=company.pk).update(notes="Rockets")
+    editing.name = "Acme Inc"
+    with pytest.raises(ConcurrentModificationError):
+        with transaction.atomic():
+            editing.save()
+    company.refresh_from_db()
+    assert (company.name, company.version) == ("Acme", 1)
+
+
+def test_bulk_update_increments_versions(db):
+    companies = [
+        Company.objects.create(name=name, notes="Anvils") for name in ["Acme", "Ajax"]
+    ]
+    for company in companies:
+        company.notes = "Rockets"
+    Company.objects.bulk_update(companies, ["notes"])
+    assert set(Company.objects.values_list("version", flat=True)) == {1}
+    assert companies[0].version == 1
+
+
+def test_new_rows_with_a_pk_are_inserted(db):
+    Company(pk=999, name="Acme", notes="Anvils").save()
+    assert Company.objects.get(pk=999).version == 0
+
+
+def test_loaddata_inserts_and_overwrites_rows(db):
+    company = Company.objects.create(name="Acme", notes="Anvils")
+    company.notes = "Rockets"
+    company.save()
+    dumped = serializers.serialize("json", [company])
+    Company.objects.all().delete()
+    for fixture in serializers.deserialize("json", dumped):
+        fixture.save()
+    for fixture in serializers.deserialize("json", dumped):
+        fixture.save()
+    company = Company.objects.get()
+    assert (company.notes, company.version) == ("Rockets", 1)
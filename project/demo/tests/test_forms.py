@@ -0,0 +1,134 @@
+from bs4 import BeautifulSoup
+from demo.models import Company
+from demo.models import Customer
+from nango import forms
+
+"""
+Tests for the hidden inputs rendered alongside each widget
+"""
+
+
+class CustomerForm(forms.ModelForm):
+    class Meta:
+        model = Customer
+        fields = ["name", "notes"]
+
+
+def hidden_inputs(form) -> dict:
+    soup = BeautifulSoup(str(form), "html.parser")
+    return {
+        element["name"]: element for element in soup.find_all("input", type="hidden")
+    }
+
+
+def test_original_values_are_rendered(freddy: Customer):
+    inputs = hidden_inputs(CustomerForm(instance=freddy, prefix="f"))
+    assert inputs["__original-f-name"]["value"] == "Freddy"
+    assert inputs["__original-f-notes"]["data-instance-pk"] == str(freddy.pk)
+    assert inputs["__original-f-notes"]["data-related-form-id"] == "id_f-notes"
+
+
+def test_widgets_are_patched_without_binding_methods(freddy: Customer):
+    first, second = CustomerForm(instance=freddy), CustomerForm(instance=freddy)
+    first_widget = first.fields["name"].widget
+    assert type(first_widget) is type(second.fields["name"].widget)
+    assert "_render" not in vars(first_widget)
+    assert type(CustomerForm.base_fields["name"].widget) is forms.TextInput
+
+
+def test_forms_share_a_hidden_input_plan(freddy: Customer):
+    str(CustomerForm(instance=freddy))
+    plan = forms.get_hidden_input_plan(Customer, "name")
+    str(CustomerForm(instance=freddy))
+    assert forms.get_hidden_input_plan(Customer, "name") is plan
+
+
+def test_views_set_the_debounce_periods(client, freddy: Customer):
+    soup = BeautifulSoup(client.get(f"/demo/{freddy.pk}/").content, "html.parser")
+    name, notes = (
+        soup.find("input", {"name": f"__original-foo-{field_name}"})
+        for field_name in ["name", "notes"]
+    )
+    assert name["data-auto-clean-debounce-period-ms"] == "1"
+    assert not name.has_attr("data-auto-submit-debounce-period-ms")
+    assert notes["data-auto-submit-debounce-period-ms"] == "1"
+    # which other forms for the model do not share
+    inputs = hidden_inputs(CustomerForm(instance=freddy))
+    assert not inputs["__original-notes"].has_attr(
+        "data-auto-submit-debounce-period-ms"
+    )
+
+
+def test_version_is_rendered(db):
+    company = Company.objects.create(name="Acme", notes="Anvils")
+    CompanyForm = forms.modelform_factory(
+        Company, form=forms.ModelForm, fields=["name"]
+    )
+    inputs = hidden_inputs(CompanyForm(instance=company))
+    assert inputs["__version"]["value"] == "0"
+
+
+def test_wrapper_classes_are_only_built_once():
+    from nango.contrib import admin
+    from nango.views.generic import edit
+
+    assert edit.UpdateView is edit.UpdateView
+    assert admin.TabularInline is admin.TabularInline
+    assert admin.TabularInline.form is admin.StackedInline.form
+
+
+CustomerFormSet = forms.modelformset_factory(
+    Customer, fields=["name", "notes"], extra=0
+)
+
+
+def formset_data(formset) -> dict:
+    soup = BeautifulSoup(
+        str(formset.management_form) + "".join(map(str, formset)), "html.parser"
+    )
+    data = {element["name"]: element.get("value", "") for element in soup("input")}
+    for element in soup("textarea"):
+        data[element["name"]] = element.text.lstrip("\n")
+    return data
+
+
+def test_formsets_compare_every_instance_at_once(db, django_assert_num_queries):
+    customers = [
+        Customer.objects.create(name=name, notes="Some Notes")
+        for name in ["Alice Smith", "Bertie Wooster", "Carla Jones"]
+    ]
+    queryset = Customer.objects.order_by("pk")
+    data = formset_data(CustomerFormSet(queryset=queryset))
+    Customer.objects.filter(pk__in=[customers[0].pk, customers[2].pk]).update(
+        notes="Other Notes"
+    )
+    formset = CustomerFormSet(data, queryset=queryset)
+    # django looks up the instance of each form, then
+    # nango locks and compares them all with one query
+    with django_assert_num_queries(len(customers) + 1) as captured:
+        assert not formset.is_valid()
+    assert " IN (" in captured.captured_queries[-1]["sql"]
+    assert [bool(form.non_field_errors()) for form in formset] == [True, False, True]
+    assert "2 of these objects" in str(formset.non_form_errors())
+
+
+def test_a_single_conflict_is_reported_in_the_singular(db):
+    customer = Customer.objects.create(name="Alice Smith", notes="Some Notes")
+    queryset = Customer.objects.order_by("pk")
+    data = formset_data(CustomerFormSet(queryset=queryset))
+    Customer.objects.filter(pk=customer.pk).update(notes="Other Notes")
+    formset = CustomerFormSet(data, queryset=queryset)
+    assert not formset.is_valid()
+    assert "1 of these objects has changed while you were editing it." in str(
+        formset.non_form_errors()
+    )
+
+
+def test_formset_factories_and_inlines_compare_in_bulk():
+    from demo.admin import CustomerInline
+
+    assert issubclass(CustomerFormSet, forms.FormSetMixin)
+    assert issubclass(CustomerFormSet.form, forms.FormMixin)
+    InlineFormSet = forms.inlineformset_factory(Company, Customer, fields=["name"])
+    assert issubclass(InlineFormSet, forms.FormSetMixin)
+    assert issubclass(CustomerInline.formset, forms.FormSetMixin)
@@ -0,0 +1,744 @@
+import asyncio
+import json
+import threading
+from typing import Any
+from typing import List
+
+import pytest
+from asgiref.sync import async_to_sync
+from asgiref.sync import sync_to_async
+from demo.models import Company
+from demo.models import Customer
+from django.db import models
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Concat
+from nango import common
+from nango import hub
+from nango.common import register_serialiser
+from nango.common import serialise_instance_values
+from nango.common import serialise_model_attr
+from nango.common import SERIALISERS
+from nango.consumers import LiveUpdatesConsumer
+from nango.db import notifications
+from nango.executor import database_executor
+from nango.snapshots import snapshots
+
+"""
+Tests for the messages exchanged between TrackableMixin,
+the channel layer and LiveUpdatesConsumer
+"""
+
+
+def receive(channel_layer, channel: str) -> Any:
+    return async_to_sync(channel_layer.receive)(channel)
+
+
+def make_consumer() -> LiveUpdatesConsumer:
+    """
+    A consumer which is not connected to anything,
+    recording whatever it would have sent to the client
+    """
+    consumer = LiveUpdatesConsumer()
+    consumer.sent: List[Any] = []  # type: ignore
+
+    async def send(text_data=None, bytes_data=None) -> None:
+        if bytes_data is not None:
+            consumer.sent.append(bytes_data)  # type: ignore
+        else:
+            consumer.sent.append(json.loads(text_data))  # type: ignore
+
+    def no_database(*args, **kw):
+        raise AssertionError("The database should not have been used")
+
+    consumer.send = send  # type: ignore
+    consumer._retrieve_instance_values = no_database  # type: ignore
+    return consumer
+
+
+@pytest.mark.django_db(transaction=True)
+def test_saved_message_includes_values(channel_layer, freddy: Customer):
+    async_to_sync(channel_layer.group_add)(f"demo.customer.{freddy.pk}", "watcher")
+    freddy.name = "Roger"
+    freddy.save(update_fields=["name"])
+    message = receive(channel_layer, "watcher")["message"]
+    assert message["values"] == {"name": "Roger"}
+
+
+def test_large_values_are_not_inlined(freddy: Customer, monkeypatch):
+    monkeypatch.setattr(common, "MAX_INLINE_VALUE_SIZE", 10)
+    freddy.notes = "x" * 11
+    values = serialise_instance_values(freddy)
+    assert "notes" not in values
+    assert values["name"] == "Freddy"
+    assert values["company"] == str(freddy.company.pk)
+
+
+@pytest.mark.asyncio
+async def test_saved_uses_inlined_values():
+    consumer = make_consumer()
+    consumer.fields_for_instance[("demo", "customer", 1)] = {"name": "Freddy"}
+    await consumer.saved(
+        info=dict(
+            message=dict(
+                app="demo",
+                model="customer",
+                pk=1,
+                tab_id=None,
+                values={"name": "Roger", "notes": "note"},
+            )
+        )
+    )
+    assert [frame["message"]["new_value"] for frame in consumer.sent] == ["Roger"]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_saves_in_a_transaction_are_coalesced(channel_layer, freddy: Customer):
+    async_to_sync(channel_layer.group_add)(f"demo.customer.{freddy.pk}", "watcher")
+    with transaction.atomic():
+        for name in ["Roger", "Ramjet", "Rupert"]:
+            freddy.name = name
+            freddy.save(update_fields=["name"])
+        freddy.notes = "Noted"
+        freddy.save(update_fields=["notes"])
+    message = receive(channel_layer, "watcher")["message"]
+    assert message["fields"] == ["name", "notes"]
+    assert message["values"] == {"name": "Rupert", "notes": "Noted"}
+    with pytest.raises(asyncio.TimeoutError):
+        async_to_sync(asyncio.wait_for)(channel_layer.receive("watcher"), 0.1)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_rolled_back_saves_are_not_announced(channel_layer, freddy: Customer):
+    async_to_sync(channel_layer.group_add)(f"demo.customer.{freddy.pk}", "watcher")
+    with transaction.atomic():
+        freddy.notes = "Noted"
+        freddy.save(update_fields=["notes"])
+        try:
+            with transaction.atomic():
+                freddy.name = "Roger"
+                freddy.save(update_fields=["name"])
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+    message = receive(channel_layer, "watcher")["message"]
+    assert message["values"] == {"notes": "Noted"}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_notifications_survive_other_savepoints(channel_layer, freddy: Customer):
+    async_to_sync(channel_layer.group_add)(f"demo.customer.{freddy.pk}", "watcher")
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                freddy.name = "Roger"
+                freddy.save(update_fields=["name"])
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        with transaction.atomic():
+            freddy.name = "Ramjet"
+            freddy.save(update_fields=["name"])
+        # later saves win, whichever savepoint they were made in
+        freddy.name = "Rupert"
+        freddy.save(update_fields=["name"])
+    message = receive(channel_layer, "watcher")["message"]
+    assert message["values"] == {"name": "Rupert"}
+
+    try:
+        with transaction.atomic():
+            freddy.notes = "Lost"
+            freddy.save(update_fields=["notes"])
+            raise RuntimeError()
+    except RuntimeError:
+        pass
+    with transaction.atomic():
+        freddy.notes = "Noted"
+        freddy.save(update_fields=["notes"])
+    message = receive(channel_layer, "watcher")["message"]
+    assert message["values"] == {"notes": "Noted"}
+    with pytest.raises(asyncio.TimeoutError):
+        async_to_sync(asyncio.wait_for)(channel_layer.receive("watcher"), 0.1)
+
+
+@pytest.mark.asyncio
+async def test_batched_modify_frame():
+    consumer = make_consumer()
+    consumer._features.add("modifyBatch")
+    consumer.fields_for_instance[("demo", "customer", 1)] = {
+        "name": "Freddy",
+        "notes": "note",
+    }
+    await consumer.saved(
+        info=dict(
+            message=dict(
+                app="demo",
+                model="customer",
+                pk=1,
+                tab_id="tab",
+                values={"name": "Roger", "notes": "Noted"},
+            )
+        )
+    )
+    assert len(consumer.sent) == 1
+    (instance,) = consumer.sent[0]["message"]["instances"]
+    assert instance["nangoTabId"] == "tab"
+    assert [change["attr"] for change in instance["changes"]] == ["name", "notes"]
+
+
+def test_registered_values_are_retrieved_in_bulk(
+    freddy: Customer, company, django_assert_num_queries
+):
+    others = [Customer.objects.create(name=f"Other {i}", notes="") for i in range(3)]
+    consumer = make_consumer()
+    pks = {freddy.pk, *(other.pk for other in others)}
+    for pk in pks:
+        consumer.fields_for_instance[("demo", "customer", pk)] = {
+            "name": "",
+            "company": "",
+        }
+    with django_assert_num_queries(1):
+        retrieved = consumer._retrieve_bulk_values(
+            registered={("demo", "customer"): pks}
+        )
+    assert retrieved[("demo", "customer", freddy.pk)] == (
+        {"name": "Freddy", "company": str(company.pk)},
+        None,
+    )
+    assert retrieved[("demo", "customer", others[0].pk)][0]["company"] == "None"
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_register_reconciles_in_one_reply(channel_layer, freddy: Customer):
+    other = await sync_to_async(Customer.objects.create)(name="Other", notes="")
+    consumer = make_consumer()
+    consumer.channel_layer = channel_layer
+    consumer.channel_name = "watcher"
+    await consumer.register(
+        text_data_json=dict(
+            nangoTabId="tab",
+            features=["modifyBatch"],
+            fields=[
+                dict(
+                    appLabel="demo",
+                    model="customer",
+                    pk=str(pk),
+                    attr="name",
+                    value="Stale",
+                )
+                for pk in [freddy.pk, other.pk]
+            ],
+        )
+    )
+    (frame,) = consumer.sent
+    assert {
+        instance["pk"]: instance["changes"][0]["new_value"]
+        for instance in frame["message"]["instances"]
+    } == {freddy.pk: "Freddy", other.pk: "Other"}
+    assert set(channel_layer.groups) == {
+        f"demo.customer.{freddy.pk}",
+        f"demo.customer.{other.pk}",
+    }
+
+
+@pytest.mark.django_db(transaction=True)
+def test_only_changed_fields_are_announced(channel_layer, freddy: Customer):
+    async_to_sync(channel_layer.group_add)(f"demo.customer.{freddy.pk}", "watcher")
+    freddy = Customer.objects.get(pk=freddy.pk)
+    freddy.save()
+    freddy.name = "Roger"
+    freddy.notes = "Not saved"
+    freddy.save(update_fields=["name", "company"])
+    message = receive(channel_layer, "watcher")["message"]
+    assert message["fields"] == ["name"]
+    assert message["values"] == {"name": "Roger"}
+    assert freddy.get_changed_fields() == {"notes"}
+
+
+@pytest.mark.asyncio
+async def test_saves_of_other_fields_are_ignored():
+    consumer = make_consumer()
+    consumer.fields_for_instance[("demo", "customer", 1)] = {"name": "Freddy"}
+    await consumer.saved(
+        info=dict(
+            message=dict(
+                app="demo", model="customer", pk=1, tab_id=None, fields=["notes"]
+            )
+        )
+    )
+    assert consumer.sent == []
+
+
+@pytest.mark.django_db(transaction=True)
+def test_queryset_update_is_announced(channel_layer, freddy: Customer):
+    other = Customer.objects.create(name="Other", notes="")
+    for customer in [freddy, other]:
+        async_to_sync(channel_layer.group_add)(
+            f"demo.customer.{customer.pk}", f"watcher{customer.pk}"
+        )
+    Customer.objects.filter(pk__in=[freddy.pk, other.pk]).update(
+        name="Roger", notes=Concat("notes", Value("!"))
+    )
+    for customer in [freddy, other]:
+        message = receive(channel_layer, f"watcher{customer.pk}")["message"]
+        assert message["fields"] == ["name", "notes"]
+        # the new notes can only be known by asking the database
+        assert message["values"] == {"name": "Roger"}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_queryset_update_announces_the_new_version(channel_layer, company):
+    async_to_sync(channel_layer.group_add)(f"demo.company.{company.pk}", "watcher")
+    Company.objects.filter(pk=company.pk).update(name="Ajax")
+    message = receive(channel_layer, "watcher")["message"]
+    assert (message["values"], message["version"]) == ({"name": "Ajax"}, 1)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_bulk_update_announces_changed_instances(channel_layer, freddy: Customer):
+    other = Customer.objects.create(name="Other", notes="")
+    for customer in [freddy, other]:
+        async_to_sync(channel_layer.group_add)(
+            f"demo.customer.{customer.pk}", "watcher"
+        )
+    customers = list(Customer.objects.all())
+    customers[0].name = "Roger"
+    Customer.objects.bulk_update(customers, ["name", "notes"])
+    message = receive(channel_layer, "watcher")["message"]
+    assert (message["pk"], message["values"]) == (customers[0].pk, {"name": "Roger"})
+    with pytest.raises(asyncio.TimeoutError):
+        async_to_sync(asyncio.wait_for)(channel_layer.receive("watcher"), 0.1)
+
+
+@pytest.mark.asyncio
+async def test_stale_versions_are_ignored():
+    consumer = make_consumer()
+    consumer.fields_for_instance[("demo", "company", 1)] = {"name": "Acme"}
+    for version, name in [(2, "Ajax"), (1, "Acme Inc")]:
+        await consumer.saved(
+            info=dict(
+                message=dict(
+                    app="demo",
+                    model="company",
+                    pk=1,
+                    tab_id=None,
+                    fields=["name"],
+                    values={"name": name},
+                    version=version,
+                )
+            )
+        )
+    assert [frame["message"]["new_value"] for frame in consumer.sent] == ["Ajax"]
+
+
+def test_foreign_keys_are_serialised_without_a_query(
+    freddy: Customer, company, django_assert_num_queries
+):
+    freddy = Customer.objects.get(pk=freddy.pk)
+    with django_assert_num_queries(0):
+        assert serialise_model_attr(freddy, "company") == str(company.pk)
+
+
+def test_serialisers_can_be_registered(freddy: Customer, monkeypatch):
+    monkeypatch.setattr(common, "SERIALISERS", dict(SERIALISERS))
+    register_serialiser(models.TextField, lambda value: value.upper())
+    try:
+        assert serialise_instance_values(freddy, attrs=["name", "notes"]) == {
+            "name": "Freddy",
+            "notes": "NOTE",
+        }
+    finally:
+        common.get_serialisation_plan.cache_clear()
+
+
+def test_instance_values_are_retrieved_with_only_their_columns(
+    freddy: Customer, company, django_assert_num_queries
+):
+    with django_assert_num_queries(1) as captured:
+        values = LiveUpdatesConsumer()._retrieve_instance_values(
+            app="demo", model="customer", pk=freddy.pk, attrs=["company"]
+        )
+    assert values == {"company": str(company.pk)}
+    assert '"notes"' not in captured.captured_queries[0]["sql"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_queued_cleans_are_superseded():
+    consumer = make_consumer()
+    processed = []
+
+    def clean_or_submit_sync(data, *, save):
+        processed.append((data["currentValue"], save))
+
+    consumer.clean_or_submit_sync = clean_or_submit_sync  # type: ignore
+    dataset = dict(appLabel="demo", modelName="customer", instancePk="1")
+    for value in ["R", "Ro", "Rog"]:
+        await consumer.receive(
+            json.dumps(
+                dict(
+                    action="Clean",
+                    dataset=dict(dataset, originalName="name"),
+                    currentValue=value,
+                )
+            )
+        )
+    await consumer.receive(
+        json.dumps(
+            dict(
+                action="Clean",
+                dataset=dict(dataset, originalName="notes"),
+                currentValue="Noted",
+            )
+        )
+    )
+    await consumer.receive(
+        json.dumps(
+            dict(
+                action="Submit",
+                dataset=dict(dataset, originalName="name"),
+                currentValue="Roger",
+            )
+        )
+    )
+    await consumer._worker
+    assert processed == [("Noted", False), ("Roger", True)]
+    assert [frame["action"] for frame in consumer.sent] == [
+        "superseded",
+        "superseded",
+        "superseded",
+        "clean",
+        "submit",
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_database_work_is_ordered_per_connection_only():
+    slow, fast = make_consumer(), make_consumer()
+    release = threading.Event()
+    calls = []
+
+    def block(name):
+        calls.append(name)
+        release.wait(timeout=5)
+
+    def record(name):
+        calls.append(name)
+
+    blocked = asyncio.ensure_future(slow.run_database(block, name="slow"))
+    queued = asyncio.ensure_future(slow.run_database(record, name="queued"))
+    while not calls:
+        await asyncio.sleep(0.001)
+    # another connection is not held up by the slow one
+    await asyncio.wait_for(fast.run_database(record, name="fast"), timeout=5)
+    assert calls == ["slow", "fast"]
+    assert database_executor.queue_depth == 1
+    release.set()
+    await asyncio.gather(blocked, queued)
+    assert calls == ["slow", "fast", "queued"]
+    assert database_executor.queue_depth == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_asave_publishes_from_the_event_loop(
+    channel_layer, freddy: Customer, monkeypatch
+):
+    await channel_layer.group_add(f"demo.customer.{freddy.pk}", "watcher")
+    monkeypatch.setattr(notifications, "async_to_sync", None)
+    freddy.name = "Roger"
+    await freddy.asave(update_fields=["name"])
+    message = (await channel_layer.receive("watcher"))["message"]
+    assert message["values"] == {"name": "Roger"}
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_batch_is_saved_and_announced_once(channel_layer, freddy: Customer):
+    await channel_layer.group_add(f"demo.customer.{freddy.pk}", "watcher")
+    consumer = make_consumer()
+    dataset = dict(appLabel="demo", modelName="customer", instancePk=str(freddy.pk))
+    await consumer.receive(
+        json.dumps(
+            dict(
+                action="Batch",
+                nangoTabId="tab",
+                operations=[
+                    dict(
+                        action="Submit",
+                        dataset=dict(dataset, originalName="name"),
+                        originalValue="Freddy",
+                        currentValue="roger",
+                    ),
+                    dict(
+                        action="Submit",
+                        dataset=dict(dataset, originalName="notes"),
+                        originalValue="note",
+                        currentValue="noted",
+                    ),
+                ],
+            )
+        )
+    )
+    await consumer._worker
+    [reply] = consumer.sent
+    assert reply["action"] == "batch"
+    assert [
+        result["message"]["cleanedValue"] for result in reply["message"]["results"]
+    ] == [
+        "Roger",
+        "Noted",
+    ]
+    message = (await channel_layer.receive("watcher"))["message"]
+    assert message["fields"] == ["name", "notes"]
+    assert message["tab_id"] == "tab"
+    saved = await sync_to_async(Customer.objects.get)(pk=freddy.pk)
+    assert (saved.name, saved.notes) == ("Roger", "Noted")
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_batched_cleans_do_not_block_submits(channel_layer, freddy: Customer):
+    await channel_layer.group_add(f"demo.customer.{freddy.pk}", "watcher")
+    consumer = make_consumer()
+    dataset = dict(appLabel="demo", modelName="customer", instancePk=str(freddy.pk))
+    operations = [
+        # still being typed
+        dict(
+            action="Clean",
+            dataset=dict(dataset, originalName="name"),
+            originalValue="Freddy",
+            currentValue="Fr",
+        ),
+        dict(
+            action="Submit",
+            dataset=dict(dataset, originalName="notes"),
+            originalValue="note",
+            currentValue="noted",
+        ),
+    ]
+    await consumer.receive(
+        json.dumps(dict(action="Batch", nangoTabId="tab", operations=operations))
+    )
+    await consumer._worker
+    name, notes = (
+        result["message"] for result in consumer.sent[0]["message"]["results"]
+    )
+    assert name["validationErrors"] == ["Too short"]
+    assert notes["cleanedValue"] == "Noted"
+    message = (await channel_layer.receive("watcher"))["message"]
+    assert message["fields"] == ["notes"]
+    saved = await sync_to_async(Customer.objects.get)(pk=freddy.pk)
+    assert (saved.name, saved.notes) == ("Freddy", "Noted")
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_conflicts_found_by_the_save_are_validation_errors(
+    channel_layer, freddy: Customer, monkeypatch
+):
+    # compared by the UPDATE rather than by clean()
+    monkeypatch.setattr(Customer, "cas_on_save", True)
+    consumer = make_consumer()
+    del consumer._retrieve_instance_values
+    dataset = dict(appLabel="demo", modelName="customer", instancePk=str(freddy.pk))
+    await consumer.receive(
+        json.dumps(
+            dict(
+                action="Submit",
+                nangoTabId="tab",
+                dataset=dict(dataset, originalName="notes"),
+                originalValue="someone else's note",
+                currentValue="noted",
+            )
+        )
+    )
+    await consumer._worker
+    (frame,) = consumer.sent
+    result = frame["message"]
+    assert "error" not in result and "cleanedValue" not in result
+    assert "This object has changed" in result["validationErrors"][0]
+    saved = await sync_to_async(Customer.objects.get)(pk=freddy.pk)
+    assert saved.notes == "note"
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_snapshots_are_invalidated_once_the_batch_commits(
+    channel_layer, freddy: Customer, monkeypatch
+):
+    key = ("demo", "customer", freddy.pk)
+    save = Customer._save
+
+    def save_and_read(instance, **kwargs):
+        saved = save(instance, **kwargs)
+        # read by another process before the transaction commits
+        snapshots.store(key, {"notes": "note"}, None, since=snapshots.generation())
+        return saved
+
+    monkeypatch.setattr(Customer, "_save", save_and_read)
+    consumer = make_consumer()
+    dataset = dict(appLabel="demo", modelName="customer", instancePk=str(freddy.pk))
+    await consumer.receive(
+        json.dumps(
+            dict(
+                action="Submit",
+                nangoTabId="tab",
+                dataset=dict(dataset, originalName="notes"),
+                originalValue="note",
+                currentValue="noted",
+            )
+        )
+    )
+    await consumer._worker
+    assert consumer.sent[0]["message"]["cleanedValue"] == "Noted"
+    assert snapshots.get(key, ["notes"]) is None
+
+
+@pytest.mark.asyncio
+async def test_hub_joins_each_group_once(fanout_hub, channel_layer):
+    consumers = [make_consumer() for _ in range(3)]
+    for consumer in consumers:
+        consumer.channel_layer = channel_layer
+        consumer._my_groups = {"demo.customer.1"}
+        consumer.fields_for_instance[("demo", "customer", 1)] = {"name": "Freddy"}
+        await consumer.join_groups({"demo.customer.1"})
+    assert len(channel_layer.groups["demo.customer.1"]) == 1
+
+    await notifications.apublish(
+        [
+            dict(
+                tab_id=None,
+                app="demo",
+                model="customer",
+                pk=1,
+                fields=["name"],
+                values={"name": "Roger"},
+            )
+        ]
+    )
+    for _ in range(10):
+        await asyncio.sleep(0)
+    assert [len(consumer.sent) for consumer in consumers] == [1, 1, 1]
+
+    for consumer in consumers[:2]:
+        await consumer.disconnect(close_code=None)
+    assert len(channel_layer.groups["demo.customer.1"]) == 1
+    await consumers[2].disconnect(close_code=None)
+    assert "demo.customer.1" not in channel_layer.groups
+
+
+@pytest.mark.asyncio
+async def test_each_channel_layer_has_its_own_hub(channel_layer):
+    from channels.layers import InMemoryChannelLayer
+
+    first = hub.get_hub(channel_layer)
+    other = hub.get_hub(InMemoryChannelLayer())
+    assert other is not first
+    assert hub.get_hub(channel_layer) is first
+
+
+@pytest.mark.asyncio
+async def test_hub_reads_again_after_a_failure(
+    fanout_hub, channel_layer, monkeypatch, caplog
+):
+    monkeypatch.setattr(hub, "HUB_RESTART_DELAY", 0)
+    original_receive = channel_layer.receive
+    failures = [ConnectionError("Lost the connection")]
+
+    async def receive(channel: str) -> Any:
+        if failures:
+            raise failures.pop()
+        return await original_receive(channel)
+
+    monkeypatch.setattr(channel_layer, "receive", receive)
+    consumer = make_consumer()
+    consumer.channel_layer = channel_layer
+    consumer._my_groups = {"demo.customer.1"}
+    consumer.fields_for_instance[("demo", "customer", 1)] = {"name": "Freddy"}
+    await consumer.join_groups({"demo.customer.1"})
+    await notifications.apublish(
+        [
+            dict(
+                tab_id=None,
+                app="demo",
+                model="customer",
+                pk=1,
+                fields=["name"],
+                values={"name": "Roger"},
+            )
+        ]
+    )
+    for _ in range(10):
+        await asyncio.sleep(0)
+    assert len(consumer.sent) == 1
+    assert "The hub stopped reading events" in caplog.text
+    await consumer.disconnect(close_code=None)
+
+
+@pytest.mark.asyncio
+async def test_hub_adds_its_groups_again_before_they_expire(
+    fanout_hub, channel_layer, monkeypatch
+):
+    monkeypatch.setattr(channel_layer, "group_expiry", 0.02)
+    consumer = make_consumer()
+    consumer.channel_layer = channel_layer
+    consumer._my_groups = {"demo.customer.1"}
+    consumer.fields_for_instance[("demo", "customer", 1)] = {"name": "Freddy"}
+    await consumer.join_groups({"demo.customer.1"})
+    (added,) = channel_layer.groups["demo.customer.1"].values()
+    await asyncio.sleep(0.05)
+    (refreshed,) = channel_layer.groups["demo.customer.1"].values()
+    assert refreshed > added
+    await consumer.disconnect(close_code=None)
+    assert "demo.customer.1" not in channel_layer.groups
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_model_subscription_joins_one_group(
+    fanout_hub, channel_layer, freddy: Customer, monkeypatch
+):
+    other = await sync_to_async(Customer.objects.create)(name="Other", notes="")
+    monkeypatch.setattr(notifications, "_MODEL_CHANNELS", set())
+    notifications.enable_model_channel(Customer)
+    consumer = make_consumer()
+    consumer.channel_layer = channel_layer
+    consumer.channel_name = "watcher"
+    await consumer.register(
+        text_data_json=dict(
+            nangoTabId="tab",
+            features=["modifyBatch"],
+            subscription="model",
+            fields=[
+                dict(
+                    appLabel="demo",
+                    model="customer",
+                    pk=str(freddy.pk),
+                    attr="name",
+                    value="Freddy",
+                )
+            ],
+        )
+    )
+    assert set(channel_layer.groups) == {"demo.customer"}
+
+    def message(pk: int) -> dict:
+        return dict(
+            tab_id=None,
+            app="demo",
+            model="customer",
+            pk=pk,
+            fields=["name"],
+            values={"name": "Roger"},
+        )
+
+    await notifications.apublish([message(freddy.pk), message(other.pk)])
+    for _ in range(10):
+        await asyncio.sleep(0)
+    # only the instance which was registered is sent to the client
+    (frame,) = consumer.sent
+    assert [instance["pk"] for instance in frame["message"]["instances"]] == [freddy.pk]
+    assert set(consumer.fields_for_instance) == {("demo", "customer", freddy.pk)}
@@ -0,0 +1,142 @@
+import json
+
+import pytest
+from asgiref.sync import async_to_sync
+from demo.models import Company
+from demo.models import Customer
+from nango.db.models import InstanceLockedError
+from nango.forms import get_hidden_input_plan
+from nango.locks import LockKey
+from nango.protocol import CompactCodec
+
+from .test_live_updates import make_consumer
+
+"""
+Tests for the leases which stop people editing the same thing at once
+"""
+
+INSTANCE = LockKey("demo", "customer", 1)
+NAME = LockKey("demo", "customer", 1, "name")
+NOTES = LockKey("demo", "customer", 1, "notes")
+
+
+def lock_request(pk, attr="name", tab="tab"):
+    return dict(
+        action="Lock",
+        id=1,
+        nangoTabId=tab,
+        dataset=dict(
+            appLabel="demo",
+            modelName="customer",
+            instancePk=str(pk),
+            originalName=attr,
+        ),
+    )
+
+
+def test_field_and_instance_leases_conflict(lock_backend):
+    acquire = async_to_sync(lock_backend.acquire)
+    assert acquire(NAME, owner="alice", ttl=30) == "alice"
+    # renewing
+    assert acquire(NAME, owner="alice", ttl=30) == "alice"
+    assert acquire(NOTES, owner="bob", ttl=30) == "bob"
+    assert acquire(NAME, owner="bob", ttl=30) == "alice"
+    assert acquire(INSTANCE, owner="carol", ttl=30) in ("alice", "bob")
+    assert lock_backend.holder_sync(NAME) == "alice"
+
+    async_to_sync(lock_backend.release)(NAME, owner="bob")
+    assert lock_backend.holder_sync(NAME) == "alice"
+    async_to_sync(lock_backend.release)(NAME, owner="alice")
+    async_to_sync(lock_backend.release)(NOTES, owner="bob")
+    assert acquire(INSTANCE, owner="carol", ttl=30) == "carol"
+    assert lock_backend.holder_sync(NOTES) == "carol"
+
+
+def test_leases_expire(lock_backend):
+    acquire = async_to_sync(lock_backend.acquire)
+    assert acquire(NAME, owner="alice", ttl=0) == "alice"
+    assert lock_backend.holder_sync(NAME) is None
+    assert acquire(NAME, owner="bob", ttl=30) == "bob"
+
+
+def test_clean_respects_the_leases_of_others(freddy: Customer, lock_backend):
+    async_to_sync(lock_backend.acquire)(
+        LockKey("demo", "customer", freddy.pk, "name"), owner="alice", ttl=30
+    )
+    freddy.notes = "Other notes"
+    freddy.full_clean()
+    freddy.name = "Roger"
+    with pytest.raises(InstanceLockedError):
+        freddy.clean()
+    freddy._lock_owner = "alice"
+    freddy.full_clean()
+
+
+def test_leases_are_checked_together(freddy: Customer, lock_backend, monkeypatch):
+    async_to_sync(lock_backend.acquire)(
+        LockKey("demo", "customer", freddy.pk, "notes"), owner="alice", ttl=30
+    )
+    checked = []
+    holders_sync = lock_backend.holders_sync
+
+    def check(keys):
+        checked.append(keys)
+        return holders_sync(keys)
+
+    monkeypatch.setattr(lock_backend, "holders_sync", check)
+    with pytest.raises(InstanceLockedError):
+        freddy.check_locks(["name", "notes"])
+    assert [[key.attr for key in keys] for keys in checked] == [["name", "notes"]]
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_leases_are_taken_over_the_websocket(channel_layer):
+    alice, bob = make_consumer(), make_consumer()
+    for consumer in (alice, bob):
+        consumer.channel_layer = channel_layer
+    await channel_layer.group_add("demo.customer.1", "watcher")
+
+    await alice.receive(text_data=json.dumps(lock_request(1, tab="alice")))
+    assert alice.sent[-1]["message"]["granted"] is True
+    leased = await channel_layer.receive("watcher")
+    assert leased["message"] == dict(
+        app="demo", model="customer", pk=1, attr="name", holder="alice"
+    )
+
+    await bob.receive(text_data=json.dumps(lock_request(1, tab="bob")))
+    assert bob.sent[-1]["message"]["granted"] is False
+    assert bob.sent[-1]["message"]["holder"] == "alice"
+
+    await alice.disconnect(close_code=None)
+    assert (await channel_layer.receive("watcher"))["message"]["holder"] is None
+    await bob.receive(text_data=json.dumps(lock_request(1, tab="bob")))
+    assert bob.sent[-1]["message"]["granted"] is True
+
+
+@pytest.mark.asyncio
+async def test_only_lockable_models_are_leased(channel_layer, lock_backend):
+    consumer = make_consumer()
+    consumer.channel_layer = channel_layer
+    request = lock_request(1)
+    request["dataset"]["modelName"] = "company"
+    await consumer.receive(text_data=json.dumps(request))
+    assert consumer.sent[-1]["message"]["error"] == "demo.company cannot be locked"
+    assert lock_backend.holder_sync(LockKey("demo", "company", 1, "name")) is None
+    # nor does ws.js try to take them
+    assert "data-nango-lockable" not in get_hidden_input_plan(Company, "name").prefix
+    assert "data-nango-lockable" in get_hidden_input_plan(Customer, "name").prefix
+
+
+def test_compact_lock_requests():
+    data = CompactCodec().decode(
+        text_data=json.dumps(
+            dict(a="l", i=3, t="tab", d=["demo", "customer", "1", "name"])
+        ),
+        bytes_data=None,
+    )
+    assert data == lock_request(1, tab="tab") | dict(id=3)
+    _, frame = CompactCodec().encode(
+        dict(action="lock", message=dict(data, granted=True, holder="tab", ttl=30))
+    )
+    assert json.loads(frame[1:]) == dict(a="l", i=3, g=True, h="tab", ttl=30)
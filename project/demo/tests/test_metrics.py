@@ -0,0 +1,69 @@
+import pytest
+from demo.models import Company
+from django.db import transaction
+from django.test import Client
+from nango import metrics
+from nango.db.models import ConcurrentModificationError
+from nango.executor import run_in_thread
+
+"""
+Tests for the metrics nango records, and their exposition
+"""
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = metrics.InMemoryBackend()
+    monkeypatch.setattr(metrics, "_backend", backend)
+    return backend
+
+
+def test_counters_and_histograms_are_rendered(backend):
+    metrics.increment("nango_things_total", kind="a")
+    metrics.increment("nango_things_total", 2, kind="a")
+    metrics.observe("nango_request_seconds", 0.02, action="clean")
+    metrics.observe("nango_request_seconds", 20, action="clean")
+    text = metrics.render()
+    assert 'nango_things_total{kind="a"} 3' in text
+    assert 'nango_request_seconds_bucket{action="clean",le="0.025"} 1' in text
+    assert 'nango_request_seconds_bucket{action="clean",le="+Inf"} 2' in text
+    assert 'nango_request_seconds_count{action="clean"} 2' in text
+
+
+def test_label_values_are_escaped(backend):
+    metrics.increment("nango_things_total", kind='a "b"\\c\nd')
+    assert 'nango_things_total{kind="a \\"b\\"\\\\c\\nd"} 1' in metrics.render()
+
+
+def test_conflicts_are_counted(backend, db):
+    company = Company.objects.create(name="Acme", notes="Anvils")
+    editing = Company.objects.get(pk=company.pk)
+    editing._original_form_values = {"version": "0"}
+    Company.objects.filter(pk=company.pk).update(notes="Rockets")
+    with pytest.raises(ConcurrentModificationError):
+        with transaction.atomic():
+            editing.save()
+    assert backend.counters["nango_conflicts_total"] == {(("check", "save"),): 1}
+
+
+def test_database_calls_are_measured(backend, db):
+    def lookup():
+        return Company.objects.count()
+
+    run_in_thread(lookup)
+    histogram = backend.histograms["nango_database_queries"][(("call", "lookup"),)]
+    assert (histogram.count, histogram.sum) == (1, 1)
+
+
+def test_metrics_view(backend, admin_client):
+    metrics.increment("nango_notifications_published_total")
+    response = admin_client.get("/metrics/")
+    assert response["Content-Type"] == "text/plain; version=0.0.4"
+    assert b"nango_notifications_published_total 1" in response.content
+    assert b"nango_database_queue_depth 0" in response.content
+
+
+def test_metrics_view_needs_staff(backend, db):
+    response = Client().get("/metrics/")
+    assert response.status_code == 302
+    assert response["Location"].startswith("/admin/login/")
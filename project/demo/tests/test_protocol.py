@@ -0,0 +1,221 @@
+import json
+import zlib
+
+import pytest
+from nango import protocol
+from nango.consumers import LiveUpdatesConsumer
+from nango.protocol import CompactCodec
+from nango.protocol import JsonCodec
+
+"""
+Tests for the compact websocket subprotocol
+"""
+
+
+def unframe(bytes_data: bytes):
+    flag, payload = bytes_data[0], bytes_data[1:]
+    if flag == protocol.DEFLATED:
+        payload = zlib.decompress(payload)
+    return json.loads(payload)
+
+
+def test_compact_requests_are_expanded():
+    data = CompactCodec().decode(
+        text_data=json.dumps(
+            dict(
+                a="c",
+                i=7,
+                t="tab",
+                d=["demo", "customer", "1", "name"],
+                cv="Roger",
+                ov="Freddy",
+            )
+        ),
+        bytes_data=None,
+    )
+    assert data == dict(
+        action="Clean",
+        id=7,
+        nangoTabId="tab",
+        dataset=dict(
+            appLabel="demo",
+            modelName="customer",
+            instancePk="1",
+            originalName="name",
+        ),
+        currentValue="Roger",
+        originalValue="Freddy",
+    )
+
+
+def test_replies_only_carry_the_results():
+    request = CompactCodec().decode(
+        text_data=json.dumps(
+            dict(
+                a="s", i=3, t="tab", d=["demo", "customer", "1", "name"], cv="x", ov="y"
+            )
+        ),
+        bytes_data=None,
+    )
+    request["cleanedValue"] = "X"
+    text_data, bytes_data = CompactCodec().encode(
+        dict(action="submit", message=request)
+    )
+    assert text_data is None
+    assert unframe(bytes_data) == dict(a="s", i=3, cv="X")
+
+
+def test_large_frames_are_compressed(monkeypatch):
+    monkeypatch.setattr(protocol, "COMPRESSION_THRESHOLD", 100)
+    instance = dict(
+        app="demo",
+        model="customer",
+        pk=1,
+        nangoTabId=None,
+        changes=[dict(attr="notes", original_value="", new_value="x" * 1000)],
+    )
+    message = dict(action="modifyBatch", message=dict(instances=[instance]))
+    _, bytes_data = CompactCodec().encode(message)
+    assert bytes_data[0] == protocol.DEFLATED
+    assert len(bytes_data) < 100
+    assert unframe(bytes_data)["n"][0]["c"] == [["notes", "", "x" * 1000]]
+    assert len(JsonCodec().encode(message)[0]) > 1000
+
+
+@pytest.mark.asyncio
+async def test_consumer_accepts_the_compact_protocol():
+    consumer = LiveUpdatesConsumer()
+    consumer.scope = dict(subprotocols=["other", protocol.COMPACT_PROTOCOL])
+    accepted = []
+
+    async def accept(subprotocol=None):
+        accepted.append(subprotocol)
+
+    consumer.accept = accept  # type: ignore
+    await consumer.connect()
+    assert accepted == [protocol.COMPACT_PROTOCOL]
+    assert isinstance(consumer._codec, CompactCodec)
+
+
+def test_compact_batches():
+    codec = CompactCodec()
+    operation = dict(d=["demo", "customer", "1", "name"], cv="x", ov="y")
+    data = codec.decode(
+        text_data=json.dumps(
+            dict(
+                a="B",
+                t="tab",
+                o=[dict(operation, a="c", i=1), dict(operation, a="s", i=2)],
+            )
+        ),
+        bytes_data=None,
+    )
+    assert [(o["action"], o["id"], o["nangoTabId"]) for o in data["operations"]] == [
+        ("Clean", 1, "tab"),
+        ("Submit", 2, "tab"),
+    ]
+    results = [
+        dict(action=o["action"].lower(), message=dict(o, cleanedValue="X"))
+        for o in data["operations"]
+    ]
+    _, bytes_data = codec.encode(dict(action="batch", message=dict(results=results)))
+    assert unframe(bytes_data) == dict(
+        a="B", r=[dict(a="c", i=1, cv="X"), dict(a="s", i=2, cv="X")]
+    )
+
+
+def test_edit_scripts_count_utf16_code_units():
+    original = "😀" + "x" * 2000 + "hello world"
+    new = "😀" + "x" * 2000 + "hello brave world"
+    delta = protocol.make_delta(original, new)
+    assert (delta["start"], delta["deleted"], delta["text"]) == (2008, 0, "brave ")
+    assert delta["base"] == zlib.crc32(original.encode("utf-16-le"))
+    assert delta["hash"] == zlib.crc32(new.encode("utf-16-le"))
+    # not worth it
+    assert protocol.make_delta("x" * 100, "y" * 100) is None
+
+
+def test_common_prefixes_across_chunks():
+    value = "x" * 10000
+    for length in (0, 1, 4095, 4096, 4097, 9999):
+        changed = value[:length] + "y" + value[length + 1 :]
+        assert protocol._common_prefix_length(value, changed) == length
+    assert protocol._common_prefix_length(value, value) == 10000
+    assert protocol._common_prefix_length(value, value[:5000]) == 5000
+
+
+def test_edit_scripts_are_cached_up_to_a_size(monkeypatch):
+    deltas = protocol.DeltaCache(max_size=5000)
+    monkeypatch.setattr(protocol, "_deltas", deltas)
+    first, second = "x" * 2000, "y" * 2000
+    delta = protocol.make_delta(first, first + "!")
+    assert protocol.make_delta(first, first + "!") is delta
+    protocol.make_delta(second, second + "!")
+    # the least recently used no longer fits
+    assert list(deltas.entries) == [(second, second + "!")]
+    assert deltas.size == 4001
+    # too large to keep at all
+    protocol.make_delta("z" * 5000, "z" * 5000 + "!")
+    assert list(deltas.entries) == [(second, second + "!")]
+
+
+@pytest.mark.asyncio
+async def test_long_values_are_sent_as_edit_scripts(monkeypatch):
+    from .test_live_updates import make_consumer
+
+    monkeypatch.setattr(protocol, "DELTA_MIN_SIZE", 1000)
+    notes = "Notes " * 1000
+    consumer = make_consumer()
+    consumer._features.update(["modifyBatch", "delta"])
+    consumer.fields_for_instance[("demo", "customer", 1)] = {
+        "name": "Freddy",
+        "notes": notes,
+    }
+    await consumer.saved(
+        info=dict(
+            message=dict(
+                app="demo",
+                model="customer",
+                pk=1,
+                tab_id=None,
+                fields=["name", "notes"],
+                values={"name": "Roger", "notes": notes + "!"},
+            )
+        )
+    )
+    (frame,) = consumer.sent
+    name, notes_change = frame["message"]["instances"][0]["changes"]
+    assert name == dict(attr="name", original_value="Freddy", new_value="Roger")
+    assert notes_change == dict(
+        attr="notes", delta=protocol.make_delta(notes, notes + "!")
+    )
+    assert notes_change["delta"]["text"] == "!"
+    # the whole value is still what the client is now known to hold
+    assert consumer.fields_for_instance[("demo", "customer", 1)]["notes"] == (
+        notes + "!"
+    )
+
+
+def test_cleaned_values_are_sent_as_edit_scripts(monkeypatch):
+    monkeypatch.setattr(protocol, "DELTA_MIN_SIZE", 1000)
+    current = "notes " * 1000
+    codec = CompactCodec()
+    codec.delta = True
+    request = dict(id=3, currentValue=current, cleanedValue=current.title())
+    _, bytes_data = codec.encode(dict(action="clean", message=request))
+    # every word changed
+    assert unframe(bytes_data) == dict(a="c", i=3, cv=current.title())
+
+    request["cleanedValue"] = current.strip()
+    _, bytes_data = codec.encode(dict(action="clean", message=request))
+    assert unframe(bytes_data) == dict(
+        a="c",
+        i=3,
+        cd=[
+            protocol.value_hash(current),
+            5999,
+            1,
+            "",
+            protocol.value_hash(current.strip()),
+        ],
+    )
@@ -0,0 +1,81 @@
+from demo.models import Customer
+from nango.consumers import LiveUpdatesConsumer
+from nango.snapshots import SnapshotCache
+
+"""
+Tests for the cache of serialised instance values
+"""
+
+
+def retrieve(freddy: Customer):
+    consumer = LiveUpdatesConsumer()
+    consumer.fields_for_instance[("demo", "customer", freddy.pk)] = {"name": ""}
+    return consumer._retrieve_bulk_values(
+        registered={("demo", "customer"): {freddy.pk}}
+    )
+
+
+def test_registrations_are_served_from_the_cache(
+    freddy: Customer, django_assert_num_queries
+):
+    with django_assert_num_queries(1):
+        retrieve(freddy)
+    with django_assert_num_queries(0):
+        retrieved = retrieve(freddy)
+    assert retrieved[("demo", "customer", freddy.pk)] == ({"name": "Freddy"}, None)
+
+
+def test_saves_invalidate_the_cache(freddy: Customer, django_assert_num_queries):
+    retrieve(freddy)
+    freddy.name = "Roger"
+    freddy.save(update_fields=["name"])
+    with django_assert_num_queries(1):
+        retrieved = retrieve(freddy)
+    assert retrieved[("demo", "customer", freddy.pk)][0] == {"name": "Roger"}
+
+
+def test_reads_overtaken_by_a_save_are_not_stored():
+    cache = SnapshotCache(max_size=10, ttl=60)
+    key = ("demo", "customer", 1)
+    generation = cache.generation()
+    cache.invalidate([key])
+    cache.store(key, {"name": "Freddy"}, None, since=generation)
+    assert cache.get(key, ["name"]) is None
+    cache.store(key, {"name": "Roger"}, None, since=cache.generation())
+    assert cache.get(key, ["name"]) == ({"name": "Roger"}, None)
+
+
+def test_entries_are_evicted_and_discarded():
+    cache = SnapshotCache(max_size=2, ttl=60)
+    for pk in range(3):
+        cache.store(("demo", "customer", pk), {"name": str(pk)}, None, since=0)
+    assert cache.get(("demo", "customer", 0), ["name"]) is None
+    cache.discard(["demo.customer.1"])
+    assert cache.get(("demo", "customer", 1), ["name"]) is None
+    assert cache.get(("demo", "customer", 2), ["name"]) == ({"name": "2"}, None)
+
+
+def test_newer_versions_are_not_served_from_the_cache():
+    cache = SnapshotCache(max_size=10, ttl=60)
+    key = ("demo", "company", 1)
+    cache.store(key, {"name": "Acme"}, 3, since=0)
+    assert cache.get(key, ["name"], min_version=3) == ({"name": "Acme"}, 3)
+    assert cache.get(key, ["name"], min_version=4) is None
+    cache.refresh(key, fields=["name"], values={"name": "Ajax"}, version=4)
+    assert cache.get(key, ["name"], min_version=4) == ({"name": "Ajax"}, 4)
+
+
+def test_the_shared_tier_is_used_by_other_workers(settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+    key = ("demo", "customer", 1)
+    SnapshotCache(max_size=10, ttl=60, alias="default").store(
+        key, {"name": "Freddy"}, None, since=0
+    )
+    other = SnapshotCache(max_size=10, ttl=60, alias="default")
+    assert other.get(key, ["name"]) == ({"name": "Freddy"}, None)
+    other.invalidate([key])
+    assert (
+        SnapshotCache(max_size=10, ttl=60, alias="default").get(key, ["name"]) is None
+    )
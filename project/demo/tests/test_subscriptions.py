@@ -0,0 +1,236 @@
+import asyncio
+import json
+
+import pytest
+from asgiref.sync import async_to_sync
+from asgiref.sync import sync_to_async
+from demo.models import Company
+from demo.models import Customer
+from nango.db import notifications
+from nango.protocol import CompactCodec
+from nango.snapshots import snapshots
+from nango.subscriptions import make_subscription
+from nango.subscriptions import SubscriptionIndex
+
+from .test_live_updates import make_consumer
+from .test_live_updates import receive
+
+"""
+Tests for the queryset subscriptions of list pages
+"""
+
+
+def subscription(id, **filter):
+    return make_subscription(
+        subscriber="consumer",
+        id=id,
+        app="demo",
+        model="customer",
+        filter=filter,
+        attrs=["name"],
+    )
+
+
+def test_rows_are_routed_by_their_keys():
+    index = SubscriptionIndex()
+    first, second, everyone = (
+        subscription(1, company="1"),
+        subscription(2, company_id="2"),
+        subscription(3),
+    )
+    for each in [first, second, everyone]:
+        index.add(each)
+
+    def match(**message):
+        return {
+            (each.id, kind)
+            for each, kind in index.match(
+                {"created": False, "deleted": False, **message}
+            )
+        }
+
+    assert match(keys={"company": "1"}, created=True) == {(1, "insert"), (3, "insert")}
+    assert match(keys={"company": "2"}, previous_keys={"company": "1"}) == {
+        (1, "delete"),
+        (2, "insert"),
+        (3, "update"),
+    }
+    assert match(keys={"company": "2"}, deleted=True) == {(2, "delete"), (3, "delete")}
+    # not a model with subscription_fields
+    assert index.match(dict(fields=["name"], values={})) == []
+
+    index.remove(second)
+    assert match(keys={"company": "2"}) == {(3, "update")}
+
+
+def test_only_subscription_fields_can_be_filtered_on():
+    with pytest.raises(ValueError):
+        subscription(1, name="Freddy")
+    with pytest.raises(ValueError):
+        make_subscription(
+            subscriber="consumer",
+            id=1,
+            app="demo",
+            model="company",
+            filter={},
+            attrs=[],
+        )
+
+
+@pytest.mark.django_db(transaction=True)
+def test_saves_and_deletions_are_announced_to_the_model(channel_layer, freddy, company):
+    async_to_sync(channel_layer.group_add)("demo.customer", "watcher")
+    other = Company.objects.create(name="Other")
+    freddy.company = other
+    freddy.save()
+    message = receive(channel_layer, "watcher")["message"]
+    assert message["keys"] == {"company": str(other.pk)}
+    assert message["previous_keys"] == {"company": str(company.pk)}
+
+    Customer.objects.filter(pk=freddy.pk).delete()
+    message = receive(channel_layer, "watcher")["message"]
+    assert message["deleted"]
+    assert message["keys"] == {"company": str(other.pk)}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_queryset_update_announces_previous_keys(channel_layer, freddy, company):
+    async_to_sync(channel_layer.group_add)("demo.customer", "watcher")
+    other = Company.objects.create(name="Other")
+    Customer.objects.filter(company=company).update(company=other)
+    message = receive(channel_layer, "watcher")["message"]
+    assert message["keys"] == {"company": str(other.pk)}
+    assert message["previous_keys"] == {"company": str(company.pk)}
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_subscriber_is_told_about_matching_rows(
+    fanout_hub, channel_layer, company
+):
+    consumer = make_consumer()
+    # rows which move into the filter have the rest of their values retrieved
+    del consumer._retrieve_instance_values
+    consumer.channel_layer = channel_layer
+    await consumer.subscribe(
+        data=dict(
+            id=7,
+            appLabel="demo",
+            model="customer",
+            filter={"company": str(company.pk)},
+            attrs=["name"],
+        )
+    )
+    assert consumer.sent.pop() == dict(
+        action="subscribe",
+        message=dict(
+            id=7,
+            appLabel="demo",
+            model="customer",
+            filter={"company": str(company.pk)},
+            attrs=["name"],
+        ),
+    )
+
+    async def events():
+        for _ in range(10):
+            await asyncio.sleep(0)
+        if consumer._delivery is not None:
+            # which may be retrieving values from the database
+            await consumer._delivery
+        sent = [
+            (event["event"], event["values"])
+            for frame in consumer.sent
+            for event in frame["message"]["events"]
+        ]
+        consumer.sent.clear()
+        return sent
+
+    other = await sync_to_async(Company.objects.create)(name="Other")
+    elsewhere = Customer(name="Elsewhere", notes="", company=other)
+    await elsewhere.asave()
+    assert await events() == []
+
+    elsewhere.company = company
+    await elsewhere.asave()
+    assert await events() == [("insert", {"name": "Elsewhere"})]
+
+    elsewhere.notes = "Unlisted"
+    await elsewhere.asave()
+    assert await events() == []
+
+    elsewhere.name = "Renamed"
+    await elsewhere.asave()
+    assert await events() == [("update", {"name": "Renamed"})]
+
+    await sync_to_async(elsewhere.delete)()
+    assert await events() == [("delete", {})]
+
+    await consumer.disconnect(close_code=None)
+    assert "demo.customer" not in channel_layer.groups
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_rows_events_invalidate_snapshots(fanout_hub, channel_layer, company):
+    consumer = make_consumer()
+    consumer.channel_layer = channel_layer
+    await consumer.subscribe(
+        data=dict(
+            id=7,
+            appLabel="demo",
+            model="customer",
+            filter={"company": str(company.pk)},
+            attrs=["name"],
+        )
+    )
+    # read for the subscription, in a process which is not in the group
+    # of the instance itself
+    key = ("demo", "customer", 1)
+    snapshots.store(key, {"name": "Freddy"}, None, since=snapshots.generation())
+    # saved by another process
+    await notifications.apublish(
+        [
+            dict(
+                tab_id=None,
+                app="demo",
+                model="customer",
+                pk=1,
+                fields=["name"],
+                values={"name": "Roger"},
+                keys={"company": str(company.pk)},
+            )
+        ]
+    )
+    for _ in range(10):
+        await asyncio.sleep(0)
+    assert snapshots.get(key, ["name"]) is None
+    await consumer.disconnect(close_code=None)
+
+
+@pytest.mark.asyncio
+async def test_subscription_ids_must_be_hashable():
+    consumer = make_consumer()
+    request = dict(id=[7], appLabel="demo", model="customer", attrs=["name"])
+    await consumer.subscribe(data=dict(request))
+    (frame,) = consumer.sent
+    assert frame["message"]["error"] == "Subscription ids must be strings or integers"
+    await consumer.unsubscribe(data=dict(request))
+    assert consumer._subscriptions == {}
+
+
+def test_compact_subscribe_is_expanded():
+    data = CompactCodec().decode(
+        text_data=json.dumps(
+            dict(a="q", i=3, d=["demo", "customer"], w={"company": "1"}, f=["name"])
+        ),
+        bytes_data=None,
+    )
+    assert data == dict(
+        action="Subscribe",
+        id=3,
+        appLabel="demo",
+        model="customer",
+        filter={"company": "1"},
+        attrs=["name"],
+    )
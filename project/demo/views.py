@@ -1,6 +1,6 @@
 from django.urls import reverse_lazy
-from django.views.generic import ListView
 from nango.views.generic import edit
+from nango.views.generic.list import ListView
 
 from .models import Customer
 
@@ -9,8 +9,15 @@ class IndexView(ListView):
     template_name = "demo/index.html"
     context_object_name = "customers"
 
+    subscription_attrs = ["name"]
+
     def get_queryset(self):
-        return Customer.objects.all()
+        return Customer.objects.filter(**self.get_subscription_filter())
+
+    def get_subscription_filter(self):
+        if company := self.request.GET.get("company"):
+            return {"company": company}
+        return {}
 
 
 class UpdateView(edit.UpdateView):
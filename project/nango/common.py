@@ -1,15 +1,49 @@
 import json
 import logging
+from functools import lru_cache
 from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+from typing import Type
 
+from django.apps import apps
 from django.conf import settings
+from django.db.models import BinaryField
+from django.db.models import Field
+from django.db.models import JSONField
 from django.db.models import Model
+from django.db.models.fields.related import RelatedField
 
 DELIMITER = "."
 LOGGER = logging.getLogger(__file__)
 
 ENABLE_WEBSOCKET: bool = getattr(settings, "NANGO_WEBSOCKET_CONNECTION_DELAY", -1) > -1
 
+# Serialised values longer than this are left out of the live-update
+# messages; receivers retrieve them from the database instead.
+MAX_INLINE_VALUE_SIZE: int = getattr(settings, "NANGO_MAX_INLINE_VALUE_SIZE", 4096)
+
+
+def mixin_class(mixin: type, original: type, **attrs: type) -> type:
+    """
+    A subclass of original with the mixin added in front of it, and
+    these class attributes (such as the form of a ModelAdmin).
+    It is only created once for each combination, so looking up
+    the same name in a nango module always returns the same class.
+    """
+    # mypy only accepts classes as the Hashable arguments of
+    # the cache when they are typed as type, as they are here
+    return _mixin_class(mixin, original, **attrs)
+
+
+@lru_cache(maxsize=None)
+def _mixin_class(mixin: type, original: type, **attrs: type) -> type:
+    return type(original.__name__, (mixin, original), attrs)
+
 
 def encode_pk(pk: Any) -> str:
     return json.dumps(pk)
@@ -23,11 +57,78 @@ def instance_ref_to_channel_group_key(app_label: str, model: str, pk: Any) -> st
     return ".".join([app_label, model, str(pk)])
 
 
+def model_channel_group_key(app_label: str, model: str) -> str:
+    """
+    The channel group announcing the saves of every instance of a model
+    """
+    return ".".join([app_label, model])
+
+
+@lru_cache(maxsize=None)
+def get_model(app_label: str, model_name: str) -> Type[Model]:
+    """
+    A memoized apps.get_model, as models are looked up
+    by name for every websocket message
+    """
+    return apps.get_model(app_label, model_name)
+
+
+Serialiser = Callable[[Any], str]
+
+# Field classes with their own string representation. Whatever
+# they return must be accepted by the field's to_python().
+SERIALISERS: Dict[Type[Field], Serialiser] = {}
+
+
+def register_serialiser(field_class: Type[Field], serialiser: Serialiser) -> None:
+    """
+    Use this serialiser for the values of fields of this
+    class (or a subclass of it) instead of str()
+    """
+    SERIALISERS[field_class] = serialiser
+    get_serialisation_plan.cache_clear()
+
+
+class FieldPlan(NamedTuple):
+    name: str
+    # relations are read through their attname, so the related
+    # object is not retrieved just to find its pk
+    attname: str
+    serialise: Serialiser
+
+
+def _default_serialiser(value: Any) -> str:
+    return serialise_value(value=value)
+
+
+@lru_cache(maxsize=None)
+def get_serialisation_plan(model: Type[Model]) -> Dict[str, FieldPlan]:
+    """
+    How to serialise each concrete field of this model, keyed by field name
+    """
+    plan: Dict[str, FieldPlan] = {}
+    for field in model._meta.concrete_fields:
+        serialiser = next(
+            (
+                SERIALISERS[klass]
+                for klass in type(field).__mro__
+                if klass in SERIALISERS
+            ),
+            _default_serialiser,
+        )
+        plan[field.name] = FieldPlan(
+            name=field.name, attname=field.attname, serialise=serialiser
+        )
+    return plan
+
+
 def serialise_model_attr(instance: Model, attr: str) -> str:
     """
     Returns a string representation of the value of
     this instance.
     """
+    if field_plan := get_serialisation_plan(type(instance)).get(attr):
+        return field_plan.serialise(getattr(instance, field_plan.attname))
     value = getattr(instance, attr)
     return serialise_value(value=value)
 
@@ -40,3 +141,55 @@ def serialise_value(*, value: Any) -> str:
     if isinstance(value, Model):
         return str(value.pk)
     return str(value)
+
+
+def deserialise_value(*, field: Field, value: str) -> Any:
+    """
+    Convert a string from serialise_value back into a
+    value which can be used in a lookup on this field.
+    """
+    if field.null and value == serialise_value(value=None):
+        return None
+    if isinstance(field, RelatedField):
+        field = field.target_field
+    return field.to_python(value)
+
+
+def can_deserialise(model: Type[Model], name: str) -> bool:
+    """
+    Whether deserialise_value turns the serialised values of this field
+    back into what was serialised. Not if they are serialised by a
+    registered serialiser, or are structured (such as JSON) and so
+    written by str(), which to_python cannot parse.
+    """
+    field = model._meta.get_field(name)
+    if isinstance(field, (BinaryField, JSONField)):
+        return False
+    return get_serialisation_plan(model)[field.name].serialise is _default_serialiser
+
+
+def serialise_instance_values(
+    instance: Model, *, attrs: Optional[Iterable[str]] = None
+) -> Dict[str, str]:
+    """
+    Returns the string representation of each of the given attrs
+    (by default, every concrete field which has been loaded), keyed
+    by field name.
+
+    Values longer than MAX_INLINE_VALUE_SIZE are omitted, so they
+    are not copied into every live-update message.
+    """
+    deferred = instance.get_deferred_fields()
+    fields: Sequence[Field]
+    if attrs is None:
+        fields = instance._meta.concrete_fields
+    else:
+        fields = [instance._meta.get_field(attr) for attr in attrs]
+    result: Dict[str, str] = {}
+    for field in fields:
+        if field.attname in deferred:
+            continue
+        value = serialise_model_attr(instance, field.name)
+        if len(value) <= MAX_INLINE_VALUE_SIZE:
+            result[field.name] = value
+    return result
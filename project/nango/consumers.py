@@ -1,23 +1,66 @@
-import json
+import asyncio
 import logging
+import time
 from collections import defaultdict
+from collections import deque
+from collections import OrderedDict
+from itertools import count
 from typing import Any
+from typing import Callable
+from typing import Deque
 from typing import Dict
+from typing import List
+from typing import Optional
 from typing import Set
 from typing import Tuple
+from typing import TypeVar
+from typing import Union
 
-from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from django.apps import apps
+from django.core.exceptions import ObjectDoesNotExist
 from django.core.exceptions import ValidationError
+from django.db import router
+from django.db import transaction
+from django.db.models import F
 
 from .common import decode_pk
+from .common import get_model
+from .common import get_serialisation_plan
 from .common import instance_ref_to_channel_group_key
-from .common import serialise_value
+from .common import model_channel_group_key
+from .common import serialise_model_attr
+from .db.models import get_version_field
+from .db.models import LockableMixin
+from .db.notifications import apublish
+from .db.notifications import has_model_channel
+from .db.notifications import instance_key
+from .db.notifications import Message
+from .executor import database_executor
+from .hub import ENABLE_FANOUT_HUB
+from .hub import get_hub
+from .locks import get_lock_backend
+from .locks import LOCK_TTL
+from .locks import LockKey
+from .metrics import increment
+from .metrics import observe
+from .protocol import COMPACT_PROTOCOL
+from .protocol import CompactCodec
+from .protocol import encode_change
+from .protocol import JsonCodec
+from .snapshots import snapshots
+from .subscriptions import DELETE
+from .subscriptions import make_subscription
+from .subscriptions import Subscription
+from .subscriptions import SubscriptionId
+from .subscriptions import SubscriptionIndex
+from .subscriptions import UPDATE
 
 LOGGER = logging.getLogger(__file__)
 
 MessageType = Tuple[str, str, Any]
+T = TypeVar("T")
+# app, model, encoded pk, attr and action, or a batch number and "Batch"
+PendingKey = Tuple[Any, ...]
 
 
 class LiveUpdatesConsumer(AsyncWebsocketConsumer):  # type: ignore
@@ -25,14 +68,71 @@ class LiveUpdatesConsumer(AsyncWebsocketConsumer):  # type: ignore
         super().__init__(**kw)
         self._my_groups: Set[str] = set()
         self.fields_for_instance: Dict[MessageType, Dict[str, Any]] = defaultdict(dict)
+        # optional protocol features the client has said it understands
+        self._features: Set[str] = set()
+        # the latest version seen of each instance with a VersionField
+        self._versions: Dict[MessageType, int] = {}
+        # Clean/Submit requests waiting to be processed, at most one
+        # per (app, model, pk, attr, action), and Batches of them,
+        # in the order received
+        self._pending: "OrderedDict[PendingKey, Any]" = OrderedDict()
+        self._batch_ids = count()
+        self._worker: Optional["asyncio.Future[None]"] = None
+        # database work for this connection is done one call at a time,
+        # in the order it was asked for
+        self._database_lock = asyncio.Lock()
+        # events from the hub, waiting to be handled
+        self._hub_events: Deque[Dict[str, Any]] = deque()
+        self._delivery: Optional["asyncio.Future[None]"] = None
+        # replaced by connect() if the client offers the compact protocol
+        self._codec: Union[JsonCodec, CompactCodec] = JsonCodec()
+        # the leases taken through this connection, and their owners,
+        # which are given up when it closes
+        self._leases: Dict[LockKey, str] = {}
+        # queryset subscriptions, by the id the client gave them
+        self._subscriptions: Dict[SubscriptionId, Subscription] = {}
+        # the same, by model group, when there is no hub to route them
+        self._queries: Dict[str, SubscriptionIndex] = {}
 
     async def connect(self) -> None:
+        if COMPACT_PROTOCOL in self.scope.get("subprotocols", ()):
+            self._codec = CompactCodec()
+            await self.accept(subprotocol=COMPACT_PROTOCOL)
+            return
         await self.accept()
 
-    def _retrieve_instance_values(self, app, model, pk, attrs):
-        Model = apps.get_model(app, model)
-        instance = Model.objects.get(pk=pk)
-        return {attr: getattr(instance, attr) for attr in attrs}
+    async def run_database(self, func: Callable[..., T], **kw: Any) -> T:
+        """
+        Run this blocking function on the shared database thread pool
+        """
+        async with self._database_lock:
+            return await database_executor.run(func, **kw)
+
+    def _retrieve_instance_values(
+        self, app, model, pk, attrs, min_version: Optional[int] = None
+    ) -> Dict[str, str]:
+        """
+        Retrieve the serialised values of these attrs, from the
+        snapshot cache or loading only their columns
+        """
+        Model = get_model(app, model)
+        plan = get_serialisation_plan(Model)
+        attrs = [attr for attr in attrs if attr in plan]
+        if cached := snapshots.get((app, model, pk), attrs, min_version=min_version):
+            return cached[0]
+        generation = snapshots.generation()
+        version_field = get_version_field(Model)
+        instance = Model.objects.only(
+            *attrs, *([version_field.name] if version_field is not None else [])
+        ).get(pk=pk)
+        values = {attr: serialise_model_attr(instance, attr) for attr in attrs}
+        snapshots.store(
+            (app, model, pk),
+            values,
+            getattr(instance, version_field.attname) if version_field else None,
+            since=generation,
+        )
+        return values
 
     async def saved(self, info) -> None:
         message = info["message"]
@@ -40,59 +140,264 @@ class LiveUpdatesConsumer(AsyncWebsocketConsumer):  # type: ignore
         model = message["model"]
         pkey = message["pk"]
         tab_id = message["tab_id"]
-        fields = self.fields_for_instance[(app, model, pkey)]
-        instance = await sync_to_async(self._retrieve_instance_values)(
-            app=app, model=model, pk=pkey, attrs=fields
+        if (index := self._queries.get(info.get("group"))) is not None:
+            snapshots.invalidate([(app, model, pkey)], local_only=True)
+            await self.send_rows(
+                message,
+                [
+                    (subscription.id, kind)
+                    for subscription, kind in index.match(message)
+                ],
+            )
+        fields = self.fields_for_instance.get((app, model, pkey))
+        if fields is None:
+            # from a model group, for an instance the client is not showing
+            return
+        version = message.get("version")
+        if version is not None:
+            if version <= self._versions.get((app, model, pkey), -1):
+                # already superseded by something this client was sent
+                return
+            self._versions[(app, model, pkey)] = version
+        changed = message.get("fields")
+        snapshots.refresh(
+            (app, model, pkey),
+            fields=changed,
+            values=message.get("values") or {},
+            version=version,
         )
-        for attr, original_value in fields.items():
-            new_value = serialise_value(value=instance[attr])
-            if original_value != new_value:
-                message = dict(
-                    action="modify",
-                    message=dict(
+        if changed is not None and fields.keys().isdisjoint(changed):
+            # nothing this client registered was changed
+            return
+        values = dict(message.get("values") or {})
+        # Only go to the database for values the saver did not
+        # include, such as those which are too large to broadcast.
+        if missing := [
+            attr
+            for attr in fields
+            if attr not in values and (changed is None or attr in changed)
+        ]:
+            values.update(
+                await self.run_database(
+                    self._retrieve_instance_values,
+                    app=app,
+                    model=model,
+                    pk=pkey,
+                    attrs=missing,
+                    min_version=version,
+                )
+            )
+        if changes := self._apply_changes(fields=fields, values=values):
+            await self.send_changes(
+                [
+                    dict(
                         app=app,
                         model=model,
                         pk=pkey,
-                        attr=attr,
-                        original_value=original_value,
-                        new_value=new_value,
-                    ),
-                    nangoTabId=tab_id,
+                        nangoTabId=tab_id,
+                        changes=changes,
+                        version=version,
+                    )
+                ]
+            )
+
+    def _apply_changes(
+        self, *, fields: Dict[str, Any], values: Dict[str, str]
+    ) -> List[Dict[str, Any]]:
+        """
+        Compare the registered values of an instance with the new ones,
+        remembering the new values and returning what changed.
+        """
+        changes = []
+        for attr, original_value in fields.items():
+            if attr not in values:
+                # not something which can be retrieved from the database
+                continue
+            new_value = values[attr]
+            if original_value != new_value:
+                changes.append(
+                    dict(attr=attr, original_value=original_value, new_value=new_value)
                 )
-                await self.send(text_data=json.dumps(message))
                 fields[attr] = new_value
+        return changes
+
+    async def send_changes(
+        self, instances: List[Dict[str, Any]], *, delta: bool = True
+    ) -> None:
+        """
+        Tell the client which attrs of these instances have changed.
+        Clients which negotiated "modifyBatch" get a single frame;
+        others get one "modify" frame per attr. Long values are sent
+        as edit scripts to clients which negotiated "delta", unless
+        delta is False.
+        """
+        if delta and "delta" in self._features:
+            instances = [
+                dict(instance, changes=list(map(encode_change, instance["changes"])))
+                for instance in instances
+            ]
+        if "modifyBatch" in self._features:
+            await self.send_message(
+                dict(action="modifyBatch", message=dict(instances=instances))
+            )
+            return
+        for instance in instances:
+            for change in instance["changes"]:
+                await self.send_message(
+                    dict(
+                        action="modify",
+                        message=dict(
+                            app=instance["app"],
+                            model=instance["model"],
+                            pk=instance["pk"],
+                            **change,
+                        ),
+                        nangoTabId=instance["nangoTabId"],
+                    )
+                )
+
+    async def send_message(self, message: Dict[str, Any]) -> None:
+        text_data, bytes_data = self._codec.encode(message)
+        await self.send(text_data=text_data, bytes_data=bytes_data)
 
-    async def receive(self, text_data: bytes) -> None:
-        text_data_json = json.loads(text_data)
+    async def receive(
+        self, text_data: Optional[str] = None, bytes_data: Optional[bytes] = None
+    ) -> None:
+        text_data_json = self._codec.decode(text_data=text_data, bytes_data=bytes_data)
         action = text_data_json["action"]
         if action == "Register":
             await self.register(text_data_json=text_data_json)
             return
-        if action == "Submit":
-            await self.submit(data=text_data_json)
+        if action in ("Clean", "Submit"):
+            await self.enqueue(action=action, data=text_data_json)
+            return
+        if action == "Batch":
+            await self.enqueue_batch(data=text_data_json)
+            return
+        if action == "Lock":
+            await self.lock(data=text_data_json)
             return
-        if action == "Clean":
-            await self.clean(data=text_data_json)
+        if action == "Unlock":
+            await self.unlock(data=text_data_json)
+            return
+        if action == "Subscribe":
+            await self.subscribe(data=text_data_json)
+            return
+        if action == "Unsubscribe":
+            await self.unsubscribe(data=text_data_json)
             return
         assert False, f"unknown {action=}"
 
+    async def enqueue(self, *, action: str, data: Any) -> None:
+        """
+        Queue a Clean or Submit, replacing any older request for the
+        same field which has not been processed yet. A Submit also
+        replaces a pending Clean, but not the other way around.
+        Replaced requests are answered with "superseded".
+        """
+        field_key = await self.supersede(action=action, data=data)
+        self._pending[(*field_key, action)] = data
+        self.start_worker()
+
+    async def enqueue_batch(self, *, data: Any) -> None:
+        """
+        Queue several Clean/Submit operations to be processed together.
+        They replace queued requests for the same fields, and the
+        last operation for a field replaces any earlier one in the batch.
+        """
+        operations: Dict[Tuple[Any, ...], Any] = {}
+        for operation in data["operations"]:
+            operation.setdefault("nangoTabId", data["nangoTabId"])
+            field_key = await self.supersede(action=operation["action"], data=operation)
+            if (superseded := operations.pop(field_key, None)) is not None:
+                await self.send_message(dict(action="superseded", message=superseded))
+            operations[field_key] = operation
+        self._pending[(next(self._batch_ids), "Batch")] = list(operations.values())
+        self.start_worker()
+
+    async def supersede(self, *, action: str, data: Any) -> Tuple[str, str, str, str]:
+        """
+        Drop the queued requests which this one makes pointless,
+        returning the key of the field it is for
+        """
+        dataset = data["dataset"]
+        field_key = (
+            dataset["appLabel"],
+            dataset["modelName"],
+            dataset["instancePk"],
+            dataset["originalName"],
+        )
+        for superseded_action in (
+            ("Clean", "Submit") if action == "Submit" else (action,)
+        ):
+            key = (*field_key, superseded_action)
+            if (superseded := self._pending.pop(key, None)) is not None:
+                increment("nango_requests_superseded_total")
+                await self.send_message(dict(action="superseded", message=superseded))
+        return field_key
+
+    def start_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self.process_pending())
+
+    async def process_pending(self) -> None:
+        while self._pending:
+            key, data = self._pending.popitem(last=False)
+            started = time.perf_counter()
+            try:
+                if key[-1] == "Batch":
+                    await self.batch(operations=data)
+                elif key[-1] == "Submit":
+                    await self.submit(data=data)
+                else:
+                    await self.clean(data=data)
+            except Exception:
+                LOGGER.exception(f"Unable to process {key}")
+            observe(
+                "nango_request_seconds",
+                time.perf_counter() - started,
+                action=key[-1].lower(),
+            )
+
     async def clean(self, data: Any) -> None:
-        await sync_to_async(self.clean_or_submit_sync)(data=data, save=False)
-        await self.send(text_data=json.dumps(dict(action="clean", message=data)))
+        await self.run_database(self.clean_or_submit_sync, data=data, save=False)
+        await self.send_message(dict(action="clean", message=data))
 
     async def submit(self, data: Any) -> None:
-        await sync_to_async(self.clean_or_submit_sync)(
-            data=data,
-            save=True,
+        notifications = await self.run_database(
+            self.clean_or_submit_sync, data=data, save=True
+        )
+        # published from here, rather than hopping back
+        # into the event loop from the database thread
+        await apublish(notifications)
+        await self.send_message(dict(action="submit", message=data))
+
+    async def batch(self, operations: List[Any]) -> None:
+        notifications = await self.run_database(
+            self.apply_operations_sync,
+            operations=[
+                (operation, operation["action"] == "Submit") for operation in operations
+            ],
+        )
+        await apublish(notifications)
+        await self.send_message(
+            dict(
+                action="batch",
+                message=dict(
+                    results=[
+                        dict(action=operation["action"].lower(), message=operation)
+                        for operation in operations
+                    ]
+                ),
+            )
         )
-        await self.send(text_data=json.dumps(dict(action="submit", message=data)))
 
     def clean_or_submit_sync(
         self,
         data: Any,
         *,
         save: bool,
-    ) -> None:
+    ) -> List[Message]:
         """
         Using the new value for this instance attribute,
         make a provisional change and return the cleaned
@@ -100,58 +405,519 @@ class LiveUpdatesConsumer(AsyncWebsocketConsumer):  # type: ignore
 
         If validation fails, instead return the
         validation messages.
+
+        When saving, returns the notifications to publish.
         """
-        dataset = data["dataset"]
-        app_label = dataset["appLabel"]
-        model_name = dataset["modelName"]
-        pkey = decode_pk(dataset["instancePk"])
-        Model = apps.get_model(app_label, model_name)
-        tab_id = data["nangoTabId"]
+        return self.apply_operations_sync(operations=[(data, save)])
+
+    def apply_operations_sync(
+        self, *, operations: List[Tuple[Any, bool]]
+    ) -> List[Message]:
+        """
+        As clean_or_submit_sync, for any number of (data, save)
+        operations. Each instance is retrieved and cleaned once,
+        with all of its fields, and saved once, with all of its
+        submitted fields, so it is only announced once.
+        """
+        by_instance: Dict[Tuple[str, str, str], List[Tuple[Any, bool]]] = defaultdict(
+            list
+        )
+        for data, save in operations:
+            dataset = data["dataset"]
+            by_instance[
+                (dataset["appLabel"], dataset["modelName"], dataset["instancePk"])
+            ].append((data, save))
+        notifications: List[Message] = []
+        for (
+            app_label,
+            model_name,
+            encoded_pk,
+        ), instance_operations in by_instance.items():
+            notifications += self._apply_instance_operations(
+                Model=get_model(app_label, model_name),
+                pkey=decode_pk(encoded_pk),
+                operations=instance_operations,
+            )
+        return notifications
+
+    def _apply_instance_operations(
+        self, *, Model: Any, pkey: Any, operations: List[Tuple[Any, bool]]
+    ) -> List[Message]:
+        """
+        Clean and save the submitted fields of one instance, then clean
+        the fields which are only being cleaned, with the submitted
+        values, in one transaction, so the row stays locked from the
+        comparison of the original values until the save.
+        """
+        submitted = [operation for operation in operations if operation[1]]
+        notifications: List[Message] = []
         try:
-            try:
+            with transaction.atomic(using=router.db_for_write(Model)):
                 instance = Model.objects.get(pk=pkey)
-                instance._original_form_values[dataset["originalName"]] = data[
-                    "originalValue"
-                ].replace("\\n", "\n")
-                setattr(instance, dataset["originalName"], data["currentValue"])
+                if hasattr(instance, "_lock_owner"):
+                    instance._lock_owner = operations[-1][0]["nangoTabId"]
+                if valid := self._clean_fields(instance, submitted):
+                    try:
+                        # a savepoint, so the other fields can still be cleaned
+                        with transaction.atomic(using=instance._state.db):
+                            # published once the transaction has committed
+                            _, notifications = instance._save(
+                                update_fields=[
+                                    data["dataset"]["originalName"] for data, _ in valid
+                                ],
+                                tab_id=operations[-1][0]["nangoTabId"],
+                                hold_back=False,
+                            )
+                    except ValidationError as exception:
+                        # such as a conflict found by the UPDATE itself
+                        by_field = getattr(exception, "error_dict", {})
+                        for data, _ in valid:
+                            attr = data["dataset"]["originalName"]
+                            del data["cleanedValue"]
+                            data["validationErrors"] = (
+                                ValidationError(by_field[attr]).messages
+                                if attr in by_field
+                                else exception.messages
+                            )
+                self._clean_fields(
+                    instance,
+                    [operation for operation in operations if not operation[1]],
+                )
+        except Exception as exception:
+            for data, _ in operations:
+                data["error"] = str(exception)
+            return []
+        # also invalidated by the save, but other processes
+        # could have cached the old row until it was committed
+        snapshots.invalidate(map(instance_key, notifications))
+        return notifications
+
+    @staticmethod
+    def _clean_fields(
+        instance: Any, operations: List[Tuple[Any, bool]]
+    ) -> List[Tuple[Any, bool]]:
+        """
+        Set the current values of these operations' fields and clean the
+        instance, adding the cleanedValue or validationErrors to each.
+        A field with errors of its own is put back as it was, so it does
+        not stop the others being cleaned (and saved). Returns the
+        operations whose fields are valid.
+        """
+        valid = list(operations)
+        previous = {
+            data["dataset"]["originalName"]: getattr(
+                instance, data["dataset"]["originalName"]
+            )
+            for data, _ in operations
+        }
+        while valid:
+            instance._original_form_values = {}
+            for data, _ in valid:
+                attr = data["dataset"]["originalName"]
+                instance._original_form_values[attr] = data["originalValue"].replace(
+                    "\\n", "\n"
+                )
+                setattr(instance, attr, data["currentValue"])
+            try:
                 instance.clean()
-                data["cleanedValue"] = getattr(instance, dataset["originalName"])
-                if save:
-                    instance.save(
-                        update_fields=[dataset["originalName"]], tab_id=tab_id
-                    )
             except ValidationError as exception:
-                data["validationErrors"] = exception.messages
-        except Exception as exception:
-            data["error"] = str(exception)
+                by_field = getattr(exception, "error_dict", {})
+                invalid = [
+                    (data, save)
+                    for data, save in valid
+                    if data["dataset"]["originalName"] in by_field
+                ]
+                if not invalid:
+                    # not down to any one of these fields
+                    for data, _ in valid:
+                        data["validationErrors"] = exception.messages
+                    return []
+                for data, _ in invalid:
+                    attr = data["dataset"]["originalName"]
+                    data["validationErrors"] = ValidationError(by_field[attr]).messages
+                    setattr(instance, attr, previous[attr])
+                valid = [operation for operation in valid if operation not in invalid]
+                continue
+            for data, _ in valid:
+                data["cleanedValue"] = getattr(
+                    instance, data["dataset"]["originalName"]
+                )
+            break
+        return valid
 
     async def register(self, text_data_json: Any) -> None:
         tab_id = text_data_json["nangoTabId"]
+        self._features.update(text_data_json.get("features", ()))
+        self._codec.delta = "delta" in self._features
+        registered: Dict[Tuple[str, str], Set[Any]] = defaultdict(set)
         for instance_ref in text_data_json["fields"]:
             if pkey := decode_pk(instance_ref["pk"]):
                 app_label = instance_ref["appLabel"]
                 model = instance_ref["model"]
-                group_key = instance_ref_to_channel_group_key(
-                    app_label=app_label, model=model, pk=pkey
-                )
                 fields = self.fields_for_instance[(app_label, model, pkey)]
                 fields[instance_ref["attr"]] = instance_ref["value"].replace(
                     "\\n", "\n"
                 )
-                self._my_groups.add(group_key)
+                registered[(app_label, model)].add(pkey)
 
-        for group_key in self._my_groups:
-            await self.channel_layer.group_add(
-                channel=self.channel_name, group=group_key
+        # Pages showing many instances, such as admin changelists, can
+        # join one group per model, whose events are filtered here
+        by_model = text_data_json.get("subscription") == "model"
+        new_groups = {
+            (
+                model_channel_group_key(app_label=app_label, model=model)
+                if by_model and has_model_channel(app_label, model)
+                else instance_ref_to_channel_group_key(
+                    app_label=app_label, model=model, pk=pk
+                )
             )
-            await self.saved(
-                info=dict(
-                    message=dict(app=app_label, model=model, pk=pkey, tab_id=tab_id)
+            for (app_label, model), pks in registered.items()
+            for pk in pks
+        } - self._my_groups
+        self._my_groups.update(new_groups)
+        await self.join_groups(new_groups)
+        await self.reconcile(registered=registered, tab_id=tab_id)
+        await self.report_leases(registered=registered)
+
+    async def reconcile(
+        self, *, registered: Dict[Tuple[str, str], Set[Any]], tab_id: Any
+    ) -> None:
+        """
+        Tell the client about any registered values which are
+        already out of date, in a single reply.
+        """
+        retrieved = await self.run_database(
+            self._retrieve_bulk_values, registered=registered
+        )
+        instances = []
+        for (app, model, pkey), (values, version) in retrieved.items():
+            if version is not None:
+                self._versions[(app, model, pkey)] = version
+            fields = self.fields_for_instance[(app, model, pkey)]
+            if changes := self._apply_changes(fields=fields, values=values):
+                instances.append(
+                    dict(
+                        app=app,
+                        model=model,
+                        pk=pkey,
+                        nangoTabId=tab_id,
+                        changes=changes,
+                        version=version,
+                    )
                 )
+        if instances:
+            # in full, as clients register again when they
+            # cannot apply an edit script
+            await self.send_changes(instances, delta=False)
+
+    def _retrieve_bulk_values(
+        self, *, registered: Dict[Tuple[str, str], Set[Any]]
+    ) -> Dict[MessageType, Tuple[Dict[str, str], Optional[int]]]:
+        """
+        Retrieve the serialised values of all the registered attrs,
+        and the version of each instance if its model has one, from
+        the snapshot cache or using one query per model.
+        """
+        result: Dict[MessageType, Tuple[Dict[str, str], Optional[int]]] = {}
+        for (app, model), pks in registered.items():
+            Model = get_model(app, model)
+            plan = get_serialisation_plan(Model)
+            wanted = {
+                (app, model, pk): [
+                    attr
+                    for attr in self.fields_for_instance[(app, model, pk)]
+                    if attr in plan
+                ]
+                for pk in pks
+            }
+            result.update(snapshots.get_many(wanted))
+            missing = [pk for pk in pks if (app, model, pk) not in result]
+            if not missing:
+                continue
+            attrs = {attr for pk in missing for attr in wanted[(app, model, pk)]}
+            generation = snapshots.generation()
+            version_field = get_version_field(Model)
+            # the version is selected under an alias, in case
+            # the client registered it as an attr too
+            extra = (
+                {"_nango_version": F(version_field.attname)}
+                if version_field is not None
+                else {}
             )
+            for row in Model.objects.filter(pk__in=missing).values(
+                "pk", *attrs, **extra
+            ):
+                pk = row.pop("pk")
+                version = row.pop("_nango_version", None)
+                values = {
+                    attr: plan[attr].serialise(value) for attr, value in row.items()
+                }
+                snapshots.store((app, model, pk), values, version, since=generation)
+                result[(app, model, pk)] = (values, version)
+        return result
 
     async def disconnect(self, close_code: Any) -> None:
-        for my_group in self._my_groups:
+        # nobody is left to show the result of a Clean, but
+        # queued Submits are still saved
+        for key in [key for key in self._pending if key[-1] == "Clean"]:
+            del self._pending[key]
+        for key, owner in list(self._leases.items()):
+            await self.release_lease(key, owner=owner)
+        for id in list(self._subscriptions):
+            await self.unsubscribe(data=dict(id=id))
+        await self.leave_groups(self._my_groups)
+
+    @staticmethod
+    def _lock_key(data: Any) -> LockKey:
+        dataset = data["dataset"]
+        return LockKey(
+            dataset["appLabel"],
+            dataset["modelName"],
+            decode_pk(dataset["instancePk"]),
+            dataset.get("originalName") or None,
+        )
+
+    async def lock(self, data: Any) -> None:
+        """
+        Take or renew a lease on an instance (or one of its fields)
+        for the client's tab, telling the client whether it was granted
+        and, when it is new, everyone else watching the instance
+        """
+        key = self._lock_key(data)
+        try:
+            lockable = issubclass(get_model(key.app, key.model), LockableMixin)
+        except LookupError:
+            lockable = False
+        if not lockable:
+            data["error"] = f"{key.app}.{key.model} cannot be locked"
+            await self.send_message(dict(action="lock", message=data))
+            return
+        owner = data["nangoTabId"]
+        holder = await get_lock_backend().acquire(key, owner=owner, ttl=LOCK_TTL)
+        granted = holder == owner
+        increment("nango_leases_total", result="granted" if granted else "refused")
+        data.update(granted=granted, holder=holder, ttl=LOCK_TTL)
+        await self.send_message(dict(action="lock", message=data))
+        if not granted:
+            # it expired before being renewed, and was taken by someone else
+            self._leases.pop(key, None)
+        elif key not in self._leases:
+            self._leases[key] = owner
+            await self.announce_lease(key, holder=owner)
+
+    async def unlock(self, data: Any) -> None:
+        key = self._lock_key(data)
+        if (owner := self._leases.get(key)) is not None:
+            await self.release_lease(key, owner=owner)
+
+    async def release_lease(self, key: LockKey, *, owner: str) -> None:
+        await get_lock_backend().release(key, owner=owner)
+        del self._leases[key]
+        await self.announce_lease(key, holder=None)
+
+    async def announce_lease(self, key: LockKey, *, holder: Optional[str]) -> None:
+        group = instance_ref_to_channel_group_key(key.app, key.model, key.pk)
+        await self.channel_layer.group_send(
+            group,
+            dict(type="leased", group=group, message=self._lease_message(key, holder)),
+        )
+
+    @staticmethod
+    def _lease_message(key: LockKey, holder: Optional[str]) -> Dict[str, Any]:
+        return dict(
+            app=key.app, model=key.model, pk=key.pk, attr=key.attr, holder=holder
+        )
+
+    async def leased(self, event: Dict[str, Any]) -> None:
+        """
+        Someone took or gave up a lease on a registered instance
+        """
+        await self.send_message(dict(action="leased", message=event["message"]))
+
+    async def report_leases(
+        self, *, registered: Dict[Tuple[str, str], Set[Any]]
+    ) -> None:
+        """
+        Tell the client about the leases already held
+        on the fields it has just registered
+        """
+        backend = get_lock_backend()
+        for (app, model), pks in registered.items():
+            if not issubclass(get_model(app, model), LockableMixin):
+                continue
+            for pk in pks:
+                keys = [
+                    LockKey(app, model, pk, attr)
+                    for attr in self.fields_for_instance[(app, model, pk)]
+                ]
+                for key, holder in zip(keys, await backend.holders(keys)):
+                    if holder is not None:
+                        await self.send_message(
+                            dict(
+                                action="leased",
+                                message=self._lease_message(key, holder),
+                            )
+                        )
+
+    async def subscribe(self, data: Any) -> None:
+        """
+        Start telling the client about the rows of a model which match
+        a filter, as they are inserted, updated and deleted. A
+        subscription with the same id as an existing one replaces it.
+        """
+        if not isinstance(data.get("id"), (str, int)):
+            data["error"] = "Subscription ids must be strings or integers"
+            await self.send_message(dict(action="subscribe", message=data))
+            return
+        try:
+            subscription = make_subscription(
+                subscriber=self,
+                id=data["id"],
+                app=data["appLabel"],
+                model=data["model"],
+                filter=data.get("filter") or {},
+                attrs=data.get("attrs") or [],
+            )
+        except (LookupError, ValueError) as exception:
+            data["error"] = str(exception)
+            await self.send_message(dict(action="subscribe", message=data))
+            return
+        await self.unsubscribe(data=data)
+        self._subscriptions[subscription.id] = subscription
+        group = model_channel_group_key(subscription.app, subscription.model)
+        if ENABLE_FANOUT_HUB:
+            await get_hub(self.channel_layer).subscribe_query(subscription, group)
+        else:
+            if group not in self._my_groups and group not in self._queries:
+                await self.channel_layer.group_add(
+                    channel=self.channel_name, group=group
+                )
+            self._queries.setdefault(group, SubscriptionIndex()).add(subscription)
+        await self.send_message(dict(action="subscribe", message=data))
+
+    async def unsubscribe(self, data: Any) -> None:
+        if not isinstance(data.get("id"), (str, int)):
+            # so never subscribed
+            return
+        subscription = self._subscriptions.pop(data["id"], None)
+        if subscription is None:
+            return
+        group = model_channel_group_key(subscription.app, subscription.model)
+        if ENABLE_FANOUT_HUB:
+            await get_hub(self.channel_layer).unsubscribe_query(subscription, group)
+            return
+        index = self._queries[group]
+        index.remove(subscription)
+        if not index:
+            del self._queries[group]
+            if group not in self._my_groups:
+                await self.channel_layer.group_discard(
+                    group=group, channel=self.channel_name
+                )
+
+    async def rows(self, event: Dict[str, Any]) -> None:
+        """
+        The hub found subscriptions which a save or deletion matches
+        """
+        await self.send_rows(event["message"], event["matches"])
+
+    async def send_rows(self, message: Message, matches: List[Tuple[Any, str]]) -> None:
+        """
+        Tell the client how a save or deletion changed the rows of each
+        of these subscriptions, with the values of the attrs they asked
+        for, in a single frame
+        """
+        app = message["app"]
+        model = message["model"]
+        pkey = message["pk"]
+        changed = message.get("fields")
+        events = []
+        for id, kind in matches:
+            if (subscription := self._subscriptions.get(id)) is None:
+                # unsubscribed since
+                continue
+            values: Dict[str, str] = {}
+            if kind != DELETE:
+                attrs = subscription.attrs
+                if kind == UPDATE:
+                    attrs = tuple(
+                        attr for attr in attrs if changed is None or attr in changed
+                    )
+                    if not attrs:
+                        # nothing the client shows has changed
+                        continue
+                values = {
+                    attr: message["values"][attr]
+                    for attr in attrs
+                    if attr in message.get("values", {})
+                }
+                # new rows need all their values, not just those saved
+                if missing := [attr for attr in attrs if attr not in values]:
+                    try:
+                        values.update(
+                            await self.run_database(
+                                self._retrieve_instance_values,
+                                app=app,
+                                model=model,
+                                pk=pkey,
+                                attrs=missing,
+                                min_version=message.get("version"),
+                            )
+                        )
+                    except ObjectDoesNotExist:
+                        # deleted since, which will be announced
+                        continue
+            events.append(dict(subscription=id, event=kind, values=values))
+        if events:
+            await self.send_message(
+                dict(
+                    action="rows",
+                    message=dict(
+                        app=app,
+                        model=model,
+                        pk=pkey,
+                        nangoTabId=message["tab_id"],
+                        version=message.get("version"),
+                        events=events,
+                    ),
+                )
+            )
+
+    async def join_groups(self, groups: Set[str]) -> None:
+        if ENABLE_FANOUT_HUB:
+            await get_hub(self.channel_layer).subscribe(self, groups)
+            return
+        await asyncio.gather(
+            *(
+                self.channel_layer.group_add(channel=self.channel_name, group=group)
+                for group in groups
+            )
+        )
+
+    async def leave_groups(self, groups: Set[str]) -> None:
+        if ENABLE_FANOUT_HUB:
+            await get_hub(self.channel_layer).unsubscribe(self, groups)
+            return
+        for group in groups:
+            if group in self._queries:
+                # still needed by a queryset subscription
+                continue
             await self.channel_layer.group_discard(
-                group=my_group, channel=self.channel_name
+                group=group, channel=self.channel_name
             )
+        # other consumers of this process may still be in these groups,
+        # but cannot tell, so they refetch their values
+        snapshots.discard(groups)
+
+    async def deliver(self, event: Dict[str, Any]) -> None:
+        """
+        Called by the hub with an event for one of our groups. Events
+        are handled in order, without holding up the hub.
+        """
+        self._hub_events.append(event)
+        if self._delivery is None or self._delivery.done():
+            self._delivery = asyncio.ensure_future(self.dispatch_hub_events())
+
+    async def dispatch_hub_events(self) -> None:
+        while self._hub_events:
+            await self.dispatch(self._hub_events.popleft())
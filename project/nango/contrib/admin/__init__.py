@@ -4,6 +4,9 @@ from typing import Any
 from django import forms
 from django.contrib import admin
 from nango import forms
+from nango.common import mixin_class
+from nango.forms import FormMixin
+from nango.forms import FormSetMixin
 
 from . import site  # noqa
 from .admin import *  # noqa
@@ -25,17 +28,18 @@ def __getattr__(name: str) -> Any:
 
     if Form := getattr(OriginalClass, "form", None):
         Form = OriginalClass.form
-        if not issubclass(Form, forms.FormMixin):
-
-            class NewForm(forms.FormMixin, Form):  # type: ignore
-                pass
-
-            Form = NewForm
-
-        class NewAdmin(AdminMixin, OriginalClass):  # type: ignore
-            form = Form
-
-        return NewAdmin
+        if not issubclass(Form, FormMixin):
+            Form = mixin_class(FormMixin, Form)
+
+        if issubclass(OriginalClass, admin.options.InlineModelAdmin):
+            FormSet = OriginalClass.formset
+            if not issubclass(FormSet, FormSetMixin):
+                FormSet = mixin_class(FormSetMixin, FormSet)
+            return mixin_class(
+                InlineAdminMixin, OriginalClass, form=Form, formset=FormSet
+            )
+
+        return mixin_class(AdminMixin, OriginalClass, form=Form)
 
     # no form attribute, so leave as-is
     return OriginalClass
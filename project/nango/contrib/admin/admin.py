@@ -1,7 +1,13 @@
+from typing import TYPE_CHECKING
+
 from django import forms
 from django.contrib import admin
+from django.db import router
+from django.db import transaction
 from nango import forms
 from nango.common import ENABLE_WEBSOCKET
+from nango.db.models import ConcurrentModificationError
+from nango.db.notifications import enable_model_channel
 
 
 class AdminMixin:
@@ -10,10 +16,67 @@ class AdminMixin:
             js = ["nango/ws.js", "nango/admin.js"]
             css = {"all": ["nango/ws.css"]}
 
+    def __init__(self, model, admin_site):
+        super().__init__(model, admin_site)
+        if self.list_editable:
+            # changelist pages join one group for the model,
+            # rather than one per row
+            enable_model_channel(model)
+
     def save_model(self, request, obj, form, change):
         forms.set_original_form_values_on_instance(form=form, instance=obj)
         return super().save_model(request=request, obj=obj, form=form, change=change)
 
+    def changeform_view(self, request, *args, **kw):
+        try:
+            return super().changeform_view(request, *args, **kw)
+        except ConcurrentModificationError:
+            # With cas_on_save, conflicts are only found by save_model,
+            # when it is too late to show the form again. So (with the
+            # transaction rolled back) go around again, this time
+            # comparing the values in clean() so the form shows them.
+            request._nango_compare_in_clean = True
+            return super().changeform_view(request, *args, **kw)
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != "POST" or not self.list_editable:
+            return super().changelist_view(request, extra_context)
+        # the submitted rows are locked and compared in one
+        # query, which needs a transaction
+        using = router.db_for_write(self.model)
+        try:
+            with transaction.atomic(using=using):
+                return super().changelist_view(request, extra_context)
+        except ConcurrentModificationError:
+            # as in changeform_view
+            request._nango_compare_in_clean = True
+            with transaction.atomic(using=using):
+                return super().changelist_view(request, extra_context)
+
+    def get_changelist_form(self, request, **kw):
+        kw.setdefault("form", forms.ModelForm)
+        return super().get_changelist_form(request, **kw)
+
+    def get_changelist_formset(self, request, **kw):
+        kw.setdefault("formset", forms.BaseModelFormSet)
+        FormSet = super().get_changelist_formset(request, **kw)
+        if getattr(request, "_nango_compare_in_clean", False):
+            return type(FormSet.__name__, (FormSet,), dict(compare_in_clean=True))
+        return FormSet
+
+    def _create_formsets(self, request, obj, change):
+        formsets, inline_instances = super()._create_formsets(request, obj, change)
+        if getattr(request, "_nango_compare_in_clean", False):
+            for formset in formsets:
+                formset.compare_in_clean = True
+        return formsets, inline_instances
+
+    def get_object(self, request, *args, **kw):
+        obj = super().get_object(request, *args, **kw)
+        if obj is not None and getattr(request, "_nango_compare_in_clean", False):
+            obj._compare_in_clean = True
+        return obj
+
     def get_form(self, *args, **kw):
         form = super().get_form(*args, **kw)
 
@@ -33,3 +96,28 @@ class AdminMixin:
 
 class ModelAdmin(AdminMixin, admin.ModelAdmin):
     form = forms.ModelForm
+
+
+if TYPE_CHECKING:
+    # The mixin is only ever combined with an inline,
+    # whose attributes it overrides
+    _InlineBase = admin.options.InlineModelAdmin
+else:
+    _InlineBase = object
+
+
+class InlineAdminMixin(_InlineBase):
+    """
+    Inlines whose formsets compare all their instances at once
+    """
+
+    form = forms.ModelForm
+    formset = forms.BaseInlineFormSet
+
+
+class TabularInline(InlineAdminMixin, admin.TabularInline):
+    pass
+
+
+class StackedInline(InlineAdminMixin, admin.StackedInline):
+    pass
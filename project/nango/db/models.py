@@ -1,10 +1,22 @@
 import logging
+from contextlib import nullcontext
+from contextvars import ContextVar
+from copy import deepcopy
+from functools import lru_cache
 from inspect import isclass
 from typing import Any
+from typing import cast
 from typing import Dict
+from typing import Iterable
 from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Set
+from typing import Tuple
+from typing import Type
+from typing import TYPE_CHECKING
 
-from asgiref.sync import async_to_sync
+from asgiref.sync import sync_to_async
 
 try:
     from channels.layers import get_channel_layer
@@ -15,99 +27,724 @@ from django.core.exceptions import ValidationError
 
 from django.db import models
 from django.db import transaction
+from django.db.models import F
 from django.utils.translation import gettext_lazy as _
 
-from ..common import DELIMITER
+from ..common import can_deserialise
+from ..common import deserialise_value
+from ..common import MAX_INLINE_VALUE_SIZE
+from ..common import serialise_instance_values
 from ..common import serialise_model_attr
+from ..common import get_serialisation_plan
+from ..common import mixin_class
+from ..locks import get_lock_backend
+from ..locks import LockKey
+from ..metrics import increment
+from .notifications import apublish
+from .notifications import defer
+from .notifications import Message
+from .notifications import notify
+from .notifications import publish
 
 LOGGER = logging.getLogger(__file__)
 
+if TYPE_CHECKING:
+    # The mixins below are only ever combined with a model,
+    # whose attributes they use
+    _ModelBase = models.Model
+else:
+    _ModelBase = object
 
-class TrackableMixin:
+
+def snapshot_value(value: Any) -> Any:
+    """
+    Values which can be modified in-place (eg: from a JSONField)
+    are copied, so later changes are still detected
+    """
+    if isinstance(value, (dict, list)):
+        return deepcopy(value)
+    return value
+
+
+class VersionField(models.PositiveBigIntegerField):
+    """
+    Add one of these to a nango model to detect concurrent
+    modifications using a single version number, rather than
+    comparing the original value of every field on the form.
+
+    It is incremented by every save(), which only updates the row
+    if the version is the one the form (or instance) started with.
+    """
+
+    def __init__(self, *args, **kw) -> None:
+        kw.setdefault("default", 0)
+        kw.setdefault("editable", False)
+        super().__init__(*args, **kw)
+
+
+@lru_cache(maxsize=None)
+def get_version_field(model: Type[models.Model]) -> Optional[VersionField]:
+    for field in model._meta.concrete_fields:
+        if isinstance(field, VersionField):
+            return field
+    return None
+
+
+class ConcurrentModificationError(ValidationError):
+    """
+    The instance was changed by someone else after the form
+    was rendered.
+    """
+
+    def __init__(self, errors: List[ValidationError]) -> None:
+        super().__init__(
+            [
+                ValidationError(
+                    _(
+                        "This object has changed while you were editing it. "
+                        "You will need to reload this page and make your changes again, "
+                        "if they are still appropriate."
+                    )
+                )
+            ]
+            + errors
+        )
+
+
+class TrackableMixin(_ModelBase):
     """
     Support value tracking. Required for CAS-style validation on
     submission of a form, as well as realtime WS client updates
     """
 
+    # By default clean() locks the row with select_for_update and
+    # compares it with the original form values. With cas_on_save,
+    # save() instead issues a single UPDATE ... WHERE pk=%s AND
+    # <field>=<original value> ..., raising ConcurrentModificationError
+    # if the row no longer matches.
+    cas_on_save: bool = False
+
+    # The fields which the queryset subscriptions of nango.subscriptions
+    # can filter on, or None if the model cannot be subscribed to. An
+    # empty list allows subscriptions to every row.
+    subscription_fields: Optional[Sequence[str]] = None
+
     def __init__(self, *args, **kw) -> None:
         super().__init__(*args, **kw)
         self._original_form_values: Dict[str, Any] = dict()
+        # raw field values (by attname) as last loaded from or
+        # saved to the database
+        self._loaded_values: Dict[str, Any] = dict()
+        # set when a formset compares the whole set of instances
+        # at once, using find_conflicts()
+        self._defer_conflict_check = False
+        # set when the original form values should be compared by
+        # clean() (or find_conflicts()), even if they would otherwise
+        # only be compared when saved, so conflicts can be shown on
+        # the form
+        self._compare_in_clean = False
 
     class Meta:
         abstract = True
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            attname: snapshot_value(value)
+            for attname, value in zip(field_names, values)
+        }
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        self._take_snapshot(fields=fields)
+
+    def _take_snapshot(self, *, fields: Optional[Iterable[str]] = None) -> None:
+        if fields is None:
+            fields = [field.name for field in self._meta.concrete_fields]
+        for field in map(self._meta.get_field, fields):
+            if field.attname in self.__dict__:
+                self._loaded_values[field.attname] = snapshot_value(
+                    getattr(self, field.attname)
+                )
+
+    def get_changed_fields(self) -> Set[str]:
+        """
+        Returns the names of the loaded concrete fields whose values
+        differ from those last loaded from or saved to the database.
+        """
+        deferred = self.get_deferred_fields()
+        return {
+            field.name
+            for field in self._meta.concrete_fields
+            if field.attname not in deferred
+            and (
+                field.attname not in self._loaded_values
+                or getattr(self, field.attname) != self._loaded_values[field.attname]
+            )
+        }
+
     def save(self, *args, **kw):
+        result, messages = self._save(*args, **kw)
+        publish(messages)
+        return result
+
+    async def asave(self, *args, **kw):
+        """
+        save() in a thread, but publish its notifications
+        from the event loop, rather than via async_to_sync
+        """
+        result, messages = await sync_to_async(self._save)(*args, **kw)
+        await apublish(messages)
+        return result
+
+    def _save(self, *args, **kw) -> Tuple[Any, List[Message]]:
+        """
+        Saves the instance, returning the notifications which should be
+        published now. Those raised in a transaction are held back until
+        it commits, and are not returned, unless hold_back is False, when
+        the caller publishes them once its transaction has committed.
+        """
         tab_id = kw.pop("tab_id", None)
+        hold_back = kw.pop("hold_back", True)
+        update_fields = kw.get("update_fields")
+        if update_fields is not None:
+            update_fields = {self._meta.get_field(name).name for name in update_fields}
+        version_field = get_version_field(self.__class__)
+        snapshot_fields = update_fields
+        if update_fields is not None and version_field is not None:
+            # which _do_update bumps, whatever the fields saved
+            snapshot_fields = update_fields | {version_field.name}
+        created = self._state.adding
         result = super().save(*args, **kw)
-        if get_channel_layer:
-            channel_layer = get_channel_layer()
-            model_identifier = DELIMITER.join(
-                [self._meta.app_label, self._meta.model_name, str(self.pk)]
+        # Compared after saving, so values set by pre_save (such as
+        # auto_now) are included
+        changed = self.get_changed_fields()
+        if update_fields is not None:
+            changed &= update_fields
+        if not changed or not get_channel_layer:
+            self._take_snapshot(fields=snapshot_fields)
+            return result, []
+        # from the snapshot, so before taking a new one
+        keys = self._subscription_keys(changed=changed, created=created)
+        self._take_snapshot(fields=snapshot_fields)
+        message = dict(
+            tab_id=tab_id,
+            app=self._meta.app_label,
+            model=self._meta.model_name,
+            pk=self.pk,
+            # lets subscribers ignore saves of fields they
+            # are not interested in
+            fields=sorted(changed),
+            # Saves the subscribers from each retrieving the
+            # instance again to find out what changed.
+            values=serialise_instance_values(self, attrs=changed),
+        )
+        if version_field is not None:
+            # lets clients discard notifications older than
+            # what they already have
+            message["version"] = getattr(self, version_field.attname)
+        message.update(keys)
+        # Repeated saves within a transaction are coalesced
+        # into a single notification per instance.
+        return result, defer([message], using=self._state.db, hold_back=hold_back)
+
+    def _subscription_keys(
+        self, *, changed: Iterable[str], created: bool = False, deleted: bool = False
+    ) -> Dict[str, Any]:
+        """
+        What a notification of this instance needs for nango.subscriptions
+        to route it: the serialised values of the subscription_fields, and
+        the values they had before if they changed. Fields which are
+        deferred are left out, as they cannot be read without a query.
+        """
+        if self.subscription_fields is None:
+            return {}
+        plan = get_serialisation_plan(self.__class__)
+        deferred = self.get_deferred_fields()
+        keys = {}
+        previous_keys = {}
+        for name in self.subscription_fields:
+            field_plan = plan[name]
+            loaded = field_plan.attname in self._loaded_values
+            if name in changed or not loaded:
+                if field_plan.attname not in deferred:
+                    keys[name] = field_plan.serialise(getattr(self, field_plan.attname))
+            else:
+                # as it is in the database, even if it has been set since
+                keys[name] = field_plan.serialise(
+                    self._loaded_values[field_plan.attname]
+                )
+            if name in changed and loaded:
+                previous_keys[name] = field_plan.serialise(
+                    self._loaded_values[field_plan.attname]
+                )
+        return dict(
+            keys=keys, previous_keys=previous_keys, created=created, deleted=deleted
+        )
+
+    def delete(self, *args, **kw):
+        if self.subscription_fields is None or not get_channel_layer:
+            return super().delete(*args, **kw)
+        # the pk is cleared by deleting
+        message = dict(
+            tab_id=None,
+            app=self._meta.app_label,
+            model=self._meta.model_name,
+            pk=self.pk,
+            fields=[],
+            values={},
+            **self._subscription_keys(changed=(), deleted=True),
+        )
+        using = self._state.db
+        result = super().delete(*args, **kw)
+        notify([message], using=using)
+        return result
+
+    delete.alters_data = True  # type: ignore
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        version_field = get_version_field(self.__class__)
+        if self._state.adding and not (
+            version_field is not None
+            and version_field.name in self._original_form_values
+        ):
+            # A new instance with its pk already set (such as one from
+            # loaddata), which django inserts if this updates nothing
+            return super()._do_update(
+                base_qs, using, pk_val, values, update_fields, forced_update
             )
-            message = dict(
-                type="saved",
-                message=dict(
-                    tab_id=tab_id,
-                    app=self._meta.app_label,
-                    model=self._meta.model_name,
-                    pk=self.pk,
-                ),
+        if version_field is not None:
+            # Compare and bump the version in the same statement
+            if (expected := self._original_form_values.get(version_field.name)) is None:
+                version = getattr(self, version_field.attname)
+            else:
+                version = version_field.to_python(expected)
+            filters = {version_field.attname: version}
+            in_python = []
+            values = [
+                (field, model, value)
+                for field, model, value in values
+                if field is not version_field
+            ] + [(version_field, None, version + 1)]
+        elif self.cas_on_save and self._original_form_values:
+            filters, in_python = self._original_value_filters()
+        else:
+            return super()._do_update(
+                base_qs, using, pk_val, values, update_fields, forced_update
             )
+        # Only update the row if it still has the values the form
+        # started with. Returning False would make django INSERT
+        # the row instead, so raise here. Values which no lookup can
+        # match are compared first, with the row locked until the UPDATE.
+        with transaction.atomic(using=using) if in_python else nullcontext():
+            if in_python:
+                copy = base_qs.select_for_update().filter(pk=pk_val).first()
+                if copy is not None and (
+                    errors := self._find_conflicts(copy, attrs=in_python)
+                ):
+                    increment("nango_conflicts_total", check="save")
+                    raise ConcurrentModificationError(errors)
+            updated = super()._do_update(
+                base_qs.filter(**filters),
+                using,
+                pk_val,
+                values,
+                update_fields,
+                forced_update,
+            )
+        if updated:
+            if version_field is not None:
+                setattr(self, version_field.attname, version + 1)
+            return True
+        increment("nango_conflicts_total", check="save")
+        copy = base_qs.filter(pk=pk_val).first()
+        raise ConcurrentModificationError(
+            self._find_conflicts(copy) if copy is not None else []
+        )
 
-            def on_commit() -> None:
-                async_to_sync(channel_layer.group_send)(model_identifier, message)
+    def _original_value_filters(self) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Lookups matching the original form values, and the attrs
+        whose values no lookup can match, to be compared in python
+        """
+        filters = {}
+        in_python = []
+        for attr, expected_value in self._original_form_values.items():
+            field = self._meta.get_field(attr)
+            if not can_deserialise(self.__class__, attr):
+                in_python.append(attr)
+                continue
+            try:
+                value = deserialise_value(field=field, value=expected_value)
+            except ValidationError:
+                in_python.append(attr)
+                continue
+            if value is None:
+                filters[f"{field.attname}__isnull"] = True
+            else:
+                filters[field.attname] = value
+        return filters, in_python
 
-            transaction.on_commit(on_commit)
-        return result
+    def _find_conflicts(
+        self, copy: models.Model, *, attrs: Optional[Iterable[str]] = None
+    ) -> List[ValidationError]:
+        """
+        Compare the original form values (of these attrs, or all of
+        them) with those of the given copy of this instance
+        """
+        errors: List[ValidationError] = []
+        for attr, expected_value in self._original_form_values.items():
+            if attrs is not None and attr not in attrs:
+                continue
+            current_stored_value = serialise_model_attr(copy, attr)
+            if current_stored_value != expected_value:
+                errors.append(
+                    ValidationError(
+                        _(
+                            "Field %(attr)s was %(original)s when you started editing it, but is %(db)s in the database."
+                        ),
+                        params=dict(
+                            attr=attr,
+                            original=expected_value,
+                            db=current_stored_value,
+                        ),
+                    )
+                )
+        return errors
+
+    def compares_on_save(self) -> bool:
+        """
+        Whether the original form values are checked by the UPDATE
+        in save(), rather than by clean()
+        """
+        if self._compare_in_clean:
+            return False
+        if self.cas_on_save:
+            return True
+        version_field = get_version_field(self.__class__)
+        return (
+            version_field is not None
+            and version_field.name in self._original_form_values
+        )
 
     def clean(self, *args, **kw):
-        # If there is no pkey yet, this is a new object, so can't conflict
-        if self._original_form_values and self.pk:
-            errors: List[ValidationError] = []
+        # If there is no pkey yet, this is a new object, so can't conflict.
+        if (
+            self._original_form_values
+            and self.pk
+            and not self.compares_on_save()
+            and not self._defer_conflict_check
+        ):
             copy = self.__class__.objects.select_for_update().get(pk=self.pk)
-            for attr, expected_value in self._original_form_values.items():
-                current_stored_value = serialise_model_attr(copy, attr)
-                if current_stored_value != expected_value:
-                    errors.append(
-                        ValidationError(
-                            _(
-                                "Field %(attr)s was %(original)s when you started editing it, but is %(db)s in the database."
-                            ),
-                            params=dict(
-                                attr=attr,
-                                original=expected_value,
-                                db=current_stored_value,
-                            ),
-                        )
-                    )
-            if errors:
-                raise ValidationError(
-                    [
-                        ValidationError(
-                            _(
-                                "This object has changed while you were editing it. "
-                                "You will need to reload this page and make your changes again, "
-                                "if they are still appropriate."
-                            )
-                        )
-                    ]
-                    + errors
-                )
+            if errors := self._find_conflicts(copy):
+                increment("nango_conflicts_total", check="clean")
+                raise ConcurrentModificationError(errors)
         super().clean(*args, **kw)
 
 
-class LockableMixin:
+def find_conflicts(
+    instances: Iterable[TrackableMixin],
+) -> List[Tuple[TrackableMixin, List[ValidationError]]]:
+    """
+    Compare the original form values of these instances with their
+    rows, which are locked using one select_for_update query per
+    model, returning every instance which conflicts and why
+    """
+    by_model: Dict[Any, Dict[Any, TrackableMixin]] = {}
+    for instance in instances:
+        by_model.setdefault(instance.__class__, {})[instance.pk] = instance
+    conflicts = []
+    for Model, by_pk in by_model.items():
+        for copy in Model.objects.select_for_update().filter(pk__in=list(by_pk)):
+            instance = by_pk[copy.pk]
+            if errors := instance._find_conflicts(copy):
+                conflicts.append((instance, errors))
+    if conflicts:
+        increment("nango_conflicts_total", len(conflicts), check="clean")
+    return conflicts
+
+
+class InstanceLockedError(ValidationError):
+    """
+    Someone else holds a lease on the instance, or on a field being changed.
+    """
+
+    def __init__(self, attr: Optional[str] = None) -> None:
+        if attr is None:
+            message = _("Someone else is editing this object.")
+        else:
+            message = _("Someone else is editing %(attr)s.") % dict(attr=attr)
+        super().__init__(message, code="locked")
+
+
+class LockableMixin(_ModelBase):
     """
     Support instance locking. Allows views to identify the instance
-    as locked, preventing others from modifying it
-    (buildout: optional per-field granularity)
+    as locked, preventing others from modifying it, either as a whole
+    or field by field, using the leases of nango.locks
     """
 
+    def __init__(self, *args, **kw) -> None:
+        super().__init__(*args, **kw)
+        # the nangoTabId of whoever is changing the instance, whose
+        # own leases do not stop them
+        self._lock_owner: Optional[str] = None
+
     class Meta:
         abstract = True
 
+    def lock_key(self, attr: Optional[str] = None) -> LockKey:
+        return LockKey(
+            self._meta.app_label, cast(str, self._meta.model_name), self.pk, attr
+        )
+
+    def locked_by(self, attr: Optional[str] = None) -> Optional[str]:
+        """
+        The tab holding a lease which stops others changing
+        the instance (or this attr of it), if any
+        """
+        if self.pk is None:
+            return None
+        return get_lock_backend().holder_sync(self.lock_key(attr))
+
+    def check_locks(self, attrs: Iterable[Optional[str]]) -> None:
+        """
+        Raise InstanceLockedError if someone else holds a lease on
+        any of these attrs (None meaning the whole instance)
+        """
+        if self.pk is None:
+            return
+        attrs = list(attrs)
+        holders = get_lock_backend().holders_sync(
+            [self.lock_key(attr) for attr in attrs]
+        )
+        for attr, holder in zip(attrs, holders):
+            if holder is not None and holder != self._lock_owner:
+                raise InstanceLockedError(attr)
+
+    def clean(self, *args, **kw):
+        if self.pk is not None:
+            if isinstance(self, TrackableMixin):
+                # only the fields being changed need to be free
+                self.check_locks(sorted(self.get_changed_fields()))
+            else:
+                self.check_locks([None])
+        super().clean(*args, **kw)
+
+
+_announce_updates: ContextVar[bool] = ContextVar("nango_announce_updates", default=True)
+
+
+class QuerySet(models.QuerySet):
+    """
+    Announces the changes made by bulk operations to live-update
+    subscribers, the same way TrackableMixin.save does.
+    """
+
+    def _message(
+        self, *, pk: Any, fields: Iterable[str], values: Dict[str, str], **extra: Any
+    ) -> Dict[str, Any]:
+        return dict(
+            tab_id=None,
+            app=self.model._meta.app_label,
+            model=self.model._meta.model_name,
+            pk=pk,
+            fields=sorted(fields),
+            values=values,
+            **extra,
+        )
+
+    def _subscription_keys(
+        self, queryset: models.QuerySet
+    ) -> Dict[Any, Dict[str, str]]:
+        """
+        The serialised subscription_fields of each row, by pk
+        """
+        # mypy does not accept Type[Any] as Hashable, for the cache
+        model: Type[models.Model] = self.model
+        names = self.model.subscription_fields
+        plan = get_serialisation_plan(model)
+        return {
+            pk: {name: plan[name].serialise(value) for name, value in zip(names, row)}
+            for pk, *row in queryset.values_list(
+                "pk", *(plan[name].attname for name in names)
+            )
+        }
+
+    def update(self, **kwargs):
+        if not get_channel_layer or not _announce_updates.get():
+            return super().update(**kwargs)
+        fields = {
+            self.model._meta.get_field(name).name: value
+            for name, value in kwargs.items()
+        }
+        plan = get_serialisation_plan(self.model)
+        values = {}
+        for name, value in fields.items():
+            # expressions such as F() can only be evaluated by the database
+            if hasattr(value, "resolve_expression"):
+                continue
+            if isinstance(value, models.Model):
+                value = value.pk
+            serialised = plan[name].serialise(value)
+            if len(serialised) <= MAX_INLINE_VALUE_SIZE:
+                values[name] = serialised
+        if (version_field := get_version_field(self.model)) is not None:
+            kwargs.setdefault(version_field.attname, F(version_field.attname) + 1)
+        names = getattr(self.model, "subscription_fields", None)
+        with transaction.atomic(using=self.db, savepoint=False):
+            # find out which rows will be affected, in the same transaction
+            if names is None:
+                before = dict.fromkeys(self.values_list("pk", flat=True))
+            else:
+                before = self._subscription_keys(self)
+            rows = super().update(**kwargs)
+            updated = self.model._base_manager.using(self.db).filter(
+                pk__in=list(before)
+            )
+            after = before
+            if names is not None and not fields.keys().isdisjoint(names):
+                # they may have been set using expressions
+                after = self._subscription_keys(updated)
+            versions = {}
+            if version_field is not None:
+                # so clients holding the version stay current
+                versions = dict(updated.values_list("pk", version_field.attname))
+            notify(
+                [
+                    self._message(
+                        pk=pk,
+                        fields=fields,
+                        values=dict(values),
+                        **(
+                            {}
+                            if version_field is None
+                            else dict(version=versions.get(pk))
+                        ),
+                        **(
+                            {}
+                            if keys is None
+                            else dict(
+                                keys=after.get(pk, keys),
+                                previous_keys={
+                                    name: value
+                                    for name, value in keys.items()
+                                    if name in fields
+                                },
+                                created=False,
+                                deleted=False,
+                            )
+                        ),
+                    )
+                    for pk, keys in before.items()
+                ],
+                using=self.db,
+            )
+        return rows
+
+    update.alters_data = True  # type: ignore
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        objs = list(objs)
+        if (version_field := get_version_field(self.model)) is not None:
+            fields = [*fields, version_field.name]
+            for obj in objs:
+                setattr(obj, version_field.attname, F(version_field.attname) + 1)
+        with transaction.atomic(using=self.db, savepoint=False):
+            # bulk_update is implemented using update(), which would
+            # otherwise announce every object, changed or not
+            token = _announce_updates.set(False)
+            try:
+                rows = super().bulk_update(objs, fields, batch_size=batch_size)
+            finally:
+                _announce_updates.reset(token)
+            if version_field is not None:
+                for obj in objs:
+                    # the new version is only known by the database,
+                    # so defer it
+                    del obj.__dict__[version_field.attname]
+            fields = {self.model._meta.get_field(name).name for name in fields}
+            messages = []
+            for obj in objs:
+                changed = obj.get_changed_fields() & fields
+                keys = obj._subscription_keys(changed=changed)
+                obj._take_snapshot(fields=fields)
+                if changed:
+                    messages.append(
+                        self._message(
+                            pk=obj.pk,
+                            fields=changed,
+                            values=serialise_instance_values(obj, attrs=changed),
+                            **keys,
+                        )
+                    )
+            notify(messages, using=self.db)
+        return rows
+
+    bulk_update.alters_data = True  # type: ignore
+
+    def bulk_create(self, objs, *args, **kw):
+        with transaction.atomic(using=self.db, savepoint=False):
+            objs = super().bulk_create(objs, *args, **kw)
+            messages = []
+            for obj in objs:
+                obj._take_snapshot()
+                # not every database returns the new primary keys
+                if obj.pk is not None:
+                    messages.append(
+                        self._message(
+                            pk=obj.pk,
+                            fields=(
+                                field.name for field in self.model._meta.concrete_fields
+                            ),
+                            values=serialise_instance_values(obj),
+                            **obj._subscription_keys(changed=(), created=True),
+                        )
+                    )
+            notify(messages, using=self.db)
+        return objs
+
+    bulk_create.alters_data = True  # type: ignore
+
+    def delete(self):
+        if getattr(self.model, "subscription_fields", None) is None or not (
+            get_channel_layer
+        ):
+            return super().delete()
+        with transaction.atomic(using=self.db, savepoint=False):
+            # as TrackableMixin.delete, for each row
+            keys = self._subscription_keys(self)
+            result = super().delete()
+            notify(
+                [
+                    self._message(
+                        pk=pk,
+                        fields=(),
+                        values={},
+                        keys=row_keys,
+                        previous_keys={},
+                        created=False,
+                        deleted=True,
+                    )
+                    for pk, row_keys in keys.items()
+                ],
+                using=self.db,
+            )
+        return result
+
+    delete.alters_data = True  # type: ignore
+    delete.queryset_only = True  # type: ignore
+
+
+class Manager(models.manager.BaseManager.from_queryset(QuerySet)):  # type: ignore
+    pass
+
 
 class Model(TrackableMixin, models.Model):
+    objects = Manager()
+
     class Meta:
         abstract = True
 
@@ -118,7 +755,7 @@ def __getattr__(name: str) -> Any:
         if issubclass(original, models.Model) and not issubclass(
             original, TrackableMixin
         ):
-            return type(original.__name__, (TrackableMixin, original), {})
+            return mixin_class(TrackableMixin, original)
     return original
 
     # raise AttributeError(f"module {__name__} has no attribute {name}")
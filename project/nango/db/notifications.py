@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import weakref
+from functools import partial
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from asgiref.sync import async_to_sync
+
+try:
+    from channels.layers import get_channel_layer
+except ModuleNotFoundError:
+    get_channel_layer = None
+
+from django.conf import settings
+from django.db import transaction
+
+from ..common import instance_ref_to_channel_group_key
+from ..common import model_channel_group_key
+from ..metrics import increment
+from ..snapshots import snapshots
+
+LOGGER = logging.getLogger(__file__)
+
+# How many notifications are handed to the channel layer at once
+NOTIFICATION_CHUNK_SIZE: int = getattr(settings, "NANGO_NOTIFICATION_CHUNK_SIZE", 500)
+
+InstanceKey = Tuple[str, str, Any]
+Message = Dict[str, Any]
+# the ids of the savepoints a notification was raised in
+Savepoint = Tuple[str, ...]
+
+# Models whose saves are also announced to a single group for the whole
+# model, so a page showing many instances can join one group, not one
+# per instance. Each process enables them the same way, on startup.
+_MODEL_CHANNELS: Set[Tuple[str, str]] = set()
+
+
+def enable_model_channel(model: Any) -> None:
+    _MODEL_CHANNELS.add((model._meta.app_label, model._meta.model_name))
+
+
+def has_model_channel(app_label: str, model_name: str) -> bool:
+    return (app_label, model_name) in _MODEL_CHANNELS
+
+
+def instance_key(message: Message) -> InstanceKey:
+    return (message["app"], message["model"], message["pk"])
+
+
+async def apublish(messages: List[Message]) -> None:
+    """
+    Send a "saved" event to the channel group of each instance,
+    and of its model if that has been enabled or can be subscribed to.
+    Messages are sent concurrently, NOTIFICATION_CHUNK_SIZE at a time.
+    """
+    if not messages or not get_channel_layer:
+        return
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    groups = [
+        instance_ref_to_channel_group_key(*instance_key(message))
+        for message in messages
+    ]
+    events = [
+        # the group lets the hub route the event to its subscribers
+        (group, dict(type="saved", group=group, message=message))
+        for group, message in zip(groups, messages)
+    ]
+    events += [
+        (group, dict(type="saved", group=group, message=message))
+        for message in messages
+        # models with subscription_fields have keys
+        if "keys" in message or (message["app"], message["model"]) in _MODEL_CHANNELS
+        for group in [model_channel_group_key(message["app"], message["model"])]
+    ]
+    increment("nango_notifications_published_total", len(events))
+    for start in range(0, len(events), NOTIFICATION_CHUNK_SIZE):
+        await asyncio.gather(
+            *(
+                channel_layer.group_send(group, event)
+                for group, event in events[start : start + NOTIFICATION_CHUNK_SIZE]
+            )
+        )
+
+
+def publish(messages: List[Message]) -> None:
+    """
+    apublish() from synchronous code,
+    using a single trip into the event loop
+    """
+    if messages:
+        async_to_sync(apublish)(messages)
+
+
+def merge(pending: Message, message: Message) -> None:
+    """
+    Fold a later notification for the same instance
+    into a pending one.
+    """
+    pending["tab_id"] = message["tab_id"]
+    if "version" in message:
+        pending["version"] = message["version"]
+    for attr in message["fields"]:
+        # a value which was too large to include must not
+        # be shadowed by one from an earlier save
+        pending["values"].pop(attr, None)
+    pending["values"].update(message["values"])
+    pending["fields"] = sorted(set(pending["fields"]) | set(message["fields"]))
+    if "keys" in message:
+        # routed by where the row was before the first save and
+        # where it is after the last, as if it had been saved once
+        pending["previous_keys"] = {
+            **message["previous_keys"],
+            **pending.get("previous_keys", {}),
+        }
+        pending["keys"] = message["keys"]
+        pending["deleted"] = message["deleted"]
+
+
+class NotificationBuffer:
+    """
+    Collects the notifications raised during a transaction, so an
+    instance which is saved several times is announced once, after
+    the transaction commits.
+
+    The notifications raised in each savepoint are confirmed by one
+    on_commit callback, registered in that savepoint, so django
+    discards it if the savepoint (or the whole transaction) is rolled
+    back. Only weak references to the callbacks are kept, so one which
+    has been discarded is seen to have gone. The last of them to run
+    publishes whatever was confirmed.
+    """
+
+    def __init__(self, using: Optional[str]) -> None:
+        self.using = using
+        # the notifications, in the order they were raised,
+        # with the savepoint they were raised in
+        self.batches: List[Tuple[Savepoint, List[Message]]] = []
+        self.callbacks: Dict[Savepoint, "weakref.ref[Callable[[], None]]"] = {}
+        # the savepoints with callbacks, in the order they were registered
+        self.order: List[Savepoint] = []
+        self.confirmed: Set[Savepoint] = set()
+        self.flushed = False
+
+    def add(self, messages: List[Message]) -> None:
+        savepoint = tuple(transaction.get_connection(self.using).savepoint_ids)
+        callback = self.callbacks.get(savepoint)
+        if callback is None or callback() is None:
+            confirm = partial(self.confirm, savepoint)
+            transaction.on_commit(confirm, using=self.using)
+            self.callbacks[savepoint] = weakref.ref(confirm)
+            self.order.append(savepoint)
+        self.batches.append((savepoint, messages))
+
+    def _last_callback(self) -> Optional[Savepoint]:
+        # callbacks which were discarded are forgotten
+        while self.order and self.callbacks[self.order[-1]]() is None:
+            self.order.pop()
+        return self.order[-1] if self.order else None
+
+    def is_pending(self) -> bool:
+        """
+        Returns False once the notifications have been published,
+        or the transaction has been rolled back
+        """
+        return not self.flushed and self._last_callback() is not None
+
+    def confirm(self, savepoint: Savepoint) -> None:
+        self.confirmed.add(savepoint)
+        # the callback which is running is still referenced
+        if self._last_callback() == savepoint:
+            self.flush()
+
+    def flush(self) -> None:
+        self.flushed = True
+        pending: Dict[InstanceKey, Message] = {}
+        for savepoint, messages in self.batches:
+            if savepoint not in self.confirmed:
+                continue
+            for message in messages:
+                key = instance_key(message)
+                if (previous := pending.get(key)) is None:
+                    pending[key] = message
+                else:
+                    merge(previous, message)
+        # reads made during the transaction may have cached the old values
+        snapshots.invalidate(pending)
+        publish(list(pending.values()))
+
+
+def defer(
+    messages: List[Message], *, using: Optional[str] = None, hold_back: bool = True
+) -> List[Message]:
+    """
+    Hold back the notifications until the current transaction has
+    been committed. When not in a transaction, or not asked to hold
+    them back, they are returned so the caller can publish them
+    immediately (or once it has committed its transaction). Either
+    way, cached snapshots of the instances are invalidated.
+    """
+    snapshots.invalidate(map(instance_key, messages))
+    connection = transaction.get_connection(using)
+    if not hold_back or not connection.in_atomic_block:
+        return messages
+    buffer: Optional[NotificationBuffer] = getattr(
+        connection, "_nango_notifications", None
+    )
+    if buffer is None or not buffer.is_pending():
+        buffer = connection._nango_notifications = NotificationBuffer(using=using)
+    buffer.add(messages)
+    return []
+
+
+def notify(messages: List[Message], *, using: Optional[str] = None) -> None:
+    """
+    Publish the notifications once the current transaction has
+    been committed, or immediately when not in a transaction.
+    """
+    publish(defer(messages, using=using))
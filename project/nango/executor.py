@@ -0,0 +1,81 @@
+import asyncio
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any
+from typing import Callable
+from typing import Optional
+from typing import TypeVar
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db import connection
+
+from .metrics import observe
+from .metrics import QueryCounter
+from .metrics import register_gauge
+
+LOGGER = logging.getLogger(__file__)
+
+# How many threads (and so database connections) consumers share
+# for their ORM work, per process
+DATABASE_POOL_SIZE: int = getattr(settings, "NANGO_DATABASE_POOL_SIZE", 4)
+
+T = TypeVar("T")
+
+
+class DatabaseExecutor:
+    """
+    Runs the blocking (ORM) work of consumers on a dedicated pool
+    of DATABASE_POOL_SIZE threads, rather than on the single thread
+    which sync_to_async uses by default, so one slow clean() does not
+    hold up every other connection.
+    """
+
+    def __init__(self, max_workers: int) -> None:
+        self.max_workers = max_workers
+        # calls which have been submitted but have not finished yet
+        self.queue_depth = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="nango-db"
+            )
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args: Any, **kw: Any) -> T:
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        self.queue_depth += 1
+        try:
+            return await loop.run_in_executor(
+                self.executor, context.run, partial(run_in_thread, func, *args, **kw)
+            )
+        finally:
+            self.queue_depth -= 1
+
+
+def run_in_thread(func: Callable[..., T], *args: Any, **kw: Any) -> T:
+    # as channels' database_sync_to_async does, don't
+    # hold on to connections which are broken or too old
+    close_old_connections()
+    queries = QueryCounter()
+    started = time.perf_counter()
+    try:
+        # the stubs leave out that it is a context manager
+        with connection.execute_wrapper(queries):  # type: ignore
+            return func(*args, **kw)
+    finally:
+        call = getattr(func, "__name__", "call")
+        observe("nango_database_seconds", time.perf_counter() - started, call=call)
+        observe("nango_database_queries", queries.count, call=call)
+        close_old_connections()
+
+
+database_executor = DatabaseExecutor(max_workers=DATABASE_POOL_SIZE)
+register_gauge("nango_database_queue_depth", lambda: database_executor.queue_depth)
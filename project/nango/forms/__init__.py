@@ -1,22 +1,33 @@
 import logging
+from functools import lru_cache
 from functools import partial
 from inspect import isclass
 from inspect import signature
-from types import MethodType
 from typing import Any
 from typing import cast
 from typing import Dict
+from typing import NamedTuple
 from typing import Optional
 from typing import Set
+from typing import Tuple
+from typing import Type
 
 from django import forms
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db.models import Model
-from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+from django.utils.translation import gettext_lazy as _
+from django.utils.translation import ngettext
 
 from ..common import ENABLE_WEBSOCKET
 from ..common import encode_pk
+from ..common import mixin_class
 from ..common import serialise_model_attr
+from ..db.models import ConcurrentModificationError
+from ..db.models import find_conflicts
+from ..db.models import get_version_field
+from ..db.models import LockableMixin
 
 Fields = Set[str]
 
@@ -50,6 +61,67 @@ class Form(FormMixin, forms.Form):
     pass
 
 
+class FormSetMixin:
+    """
+    Compare the original values of every instance in the formset with
+    their rows at once, rather than each instance locking and comparing
+    its own row in clean(), and report all the conflicts together.
+    """
+
+    # Also compare the instances which would otherwise only be compared
+    # when saved (see TrackableMixin.compares_on_save)
+    compare_in_clean: bool = False
+
+    def _construct_form(self, i: int, **kw: Any) -> Any:
+        form = super()._construct_form(i, **kw)  # type: ignore
+        if hasattr(getattr(form, "instance", None), "_defer_conflict_check"):
+            form.instance._defer_conflict_check = True
+        return form
+
+    def clean(self) -> None:
+        super().clean()  # type: ignore
+        forms_by_instance = {}
+        for form in self.forms:  # type: ignore
+            instance = getattr(form, "instance", None)
+            if (
+                instance is None
+                or instance.pk is None
+                or not getattr(instance, "_original_form_values", None)
+            ):
+                continue
+            if self.can_delete and self._should_delete_form(form):  # type: ignore
+                continue
+            if self.compare_in_clean:
+                instance._compare_in_clean = True
+            elif instance.compares_on_save():
+                continue
+            forms_by_instance[id(instance)] = form
+        conflicts = find_conflicts(
+            [form.instance for form in forms_by_instance.values()]
+        )
+        for instance, errors in conflicts:
+            forms_by_instance[id(instance)].add_error(
+                None, ConcurrentModificationError(errors)
+            )
+        if conflicts:
+            raise ValidationError(
+                ngettext(
+                    "%(count)d of these objects has changed while you were editing it.",
+                    "%(count)d of these objects have changed while you were editing them.",
+                    len(conflicts),
+                ),
+                params=dict(count=len(conflicts)),
+            )
+
+
+class BaseModelFormSet(FormSetMixin, forms.BaseModelFormSet):  # type: ignore
+    pass
+
+
+class BaseInlineFormSet(FormSetMixin, forms.BaseInlineFormSet):  # type: ignore
+    pass
+
+
 def set_original_form_values_on_instance(
     form: Form, *, instance: Optional[Model] = None
 ):
@@ -62,6 +134,17 @@ def set_original_form_values_on_instance(
         # form does not (yet) have fields, so nothing to do
         return
 
+    # a model with the nango mixins, whose attributes mypy cannot see
+    target: Any = instance or form.instance  # type: ignore
+    if "__nango_tab" in form.data and hasattr(target, "_lock_owner"):
+        # added by ws.js, so the tab's own leases do not stop it
+        target._lock_owner = form.data["__nango_tab"]
+    version_field = get_version_field(target.__class__)
+    if version_field is not None:
+        version_key = f"__version-{form.prefix}" if form.prefix else "__version"
+        if version_key in form.data:
+            target._original_form_values[version_field.name] = form.data[version_key]
+
     for field_name, field in form.fields.items():
         field_key = (
             f"__original-{form.prefix}-{field_name}"
@@ -71,86 +154,182 @@ def set_original_form_values_on_instance(
         if field_key in form.data:
             original_value = form.data[field_key]
             try:
-                (instance or form.instance)._original_form_values[  # type: ignore
-                    field_name
-                ] = original_value
+                target._original_form_values[field_name] = original_value
             except AttributeError:
-                model = (instance or form.instance).__class__  # type: ignore
+                model = target.__class__
                 LOGGER.error(f"Model {model} is missing the nango mixin.")
                 raise
 
 
-def patch_widgets(form: Form) -> None:
+class HiddenInputPlan(NamedTuple):
     """
-    Modify the widgets so they will display the hidden inputs alongside
-    the normal stuff.
+    The parts of a hidden input which are the same for every
+    instance of a form, either side of those which are not
     """
-    websocket_connection_delay = getattr(
-        settings, "NANGO_WEBSOCKET_CONNECTION_DELAY", -1
+
+    # the attributes before data-instance-pk
+    prefix: str
+    # the attributes after value
+    suffix: str
+
+
+def format_attrs(attrs: Dict[str, Any]) -> str:
+    return "".join(f"\n\t{attr}={str(value)!r}" for attr, value in attrs.items())
+
+
+# model, field name (or None for the version input), and the auto-submit
+# and auto-clean debounce periods of the field in ms -> plan
+PlanKey = Tuple[Type[Model], Optional[str], Optional[int], Optional[int]]
+
+_HIDDEN_INPUT_PLANS: Dict[PlanKey, HiddenInputPlan] = {}
+
+
+def get_debounce_period_ms(form: Any, field_name: str, action: str) -> Optional[int]:
+    """
+    The debounce period in ms for the auto-submit (or auto-clean) of
+    this field, or None if it is not auto-submitted (or auto-cleaned).
+    Views and ModelAdmins set these on the form instance.
+    """
+    if field_name not in (getattr(form, f"auto_{action}_fields", None) or ()):
+        return None
+    return int(
+        getattr(form, f"auto_{action}_debounce_period", DEFAULT_DEBOUNCE_PERIOD) * 1000
     )
-    assert hasattr(form, "fields")
-    for field_name, field in form.fields.items():
-        widget = field.widget
 
-        def _render(
-            self,
-            template,
-            context,
-            *args,
-            _original_render=widget._render,
-            _field_name=field_name,
-            **kw,
-        ):
-            result = _original_render(template, context, *args, **kw)
-            if "widget" not in context:
-                return result
-            attrs: Dict[str, str] = {
-                "data-app-label": form.instance._meta.app_label,
-                "data-model-name": form.instance._meta.model_name,
-                "data-original-name": _field_name,
-                "data-instance-pk": encode_pk(form.instance.pk),
-                "data-related-form-id": context["widget"]["attrs"]["id"],
+
+def get_hidden_input_plan(
+    model: Type[Model],
+    field_name: Optional[str],
+    *,
+    auto_submit_ms: Optional[int] = None,
+    auto_clean_ms: Optional[int] = None,
+) -> HiddenInputPlan:
+    """
+    Build (once per model, field and debounce periods) the parts of
+    the hidden input rendered alongside this field, or alongside every
+    field to carry the version if field_name is None.
+    """
+    key = (model, field_name, auto_submit_ms, auto_clean_ms)
+    if (plan := _HIDDEN_INPUT_PLANS.get(key)) is not None:
+        return plan
+    attrs: Dict[str, Any] = {
+        "data-app-label": model._meta.app_label,
+        "data-model-name": model._meta.model_name,
+    }
+    if field_name is None:
+        plan = _HIDDEN_INPUT_PLANS[key] = HiddenInputPlan(
+            prefix="<input " + format_attrs(attrs)[2:],
+            suffix=">",
+        )
+        return plan
+    attrs["data-original-name"] = field_name
+    if issubclass(model, LockableMixin):
+        # ws.js takes leases on the field only if it can be locked
+        attrs["data-nango-lockable"] = "true"
+    extra: Dict[str, str] = {}
+    if ENABLE_WEBSOCKET:
+        extra["data-connection-delay"] = str(
+            getattr(settings, "NANGO_WEBSOCKET_CONNECTION_DELAY", -1)
+        )
+        if auto_submit_ms is not None:
+            extra["data-auto-submit-debounce-period-ms"] = str(auto_submit_ms)
+        if auto_clean_ms is not None:
+            extra["data-auto-clean-debounce-period-ms"] = str(auto_clean_ms)
+    plan = _HIDDEN_INPUT_PLANS[key] = HiddenInputPlan(
+        prefix="<input " + format_attrs(attrs)[2:],
+        suffix=format_attrs(extra) + ">",
+    )
+    return plan
+
+
+def render_hidden_inputs(
+    *, form: Form, field_name: str, widget_context: Dict[str, Any]
+) -> str:
+    """
+    The hidden inputs rendered after the widget of this field,
+    holding the value the field started with
+    """
+    instance = form.instance  # type: ignore
+    model = instance.__class__
+    pk = encode_pk(instance.pk)
+    plan = get_hidden_input_plan(
+        model,
+        field_name,
+        auto_submit_ms=get_debounce_period_ms(form, field_name, "submit"),
+        auto_clean_ms=get_debounce_period_ms(form, field_name, "clean"),
+    )
+    hidden = (
+        plan.prefix
+        + format_attrs(
+            {
+                "data-instance-pk": pk,
+                "data-related-form-id": widget_context["attrs"]["id"],
                 "type": "hidden",
-                "name": "__original-" + context["widget"]["name"],
-                "value": serialise_model_attr(form.instance, _field_name),
+                "name": "__original-" + widget_context["name"],
+                "value": serialise_model_attr(instance, field_name),
             }
-
-            if ENABLE_WEBSOCKET:
-                attrs["data-connection-delay"] = str(websocket_connection_delay)
-
-                if _field_name in (getattr(form, "auto_submit_fields", None) or {}):
-                    attrs["data-auto-submit-debounce-period-ms"] = str(
-                        int(
-                            getattr(
-                                form,
-                                "auto_submit_debounce_period",
-                                DEFAULT_DEBOUNCE_PERIOD,
-                            )
-                            * 1000
-                        )
-                    )
-
-                if _field_name in (getattr(form, "auto_clean_fields", None) or {}):
-                    form.auto_clean_fields
-                    attrs["data-auto-clean-debounce-period-ms"] = str(
-                        int(
-                            getattr(
-                                form,
-                                "auto_clean_debounce_period",
-                                DEFAULT_DEBOUNCE_PERIOD,
-                            )
-                            * 1000
-                        )
-                    )
-
-            hidden = format_html(
-                "<input "
-                + "\n\t".join(f"{attr}={str(value)!r}" for attr, value in attrs.items())
-                + ">"
+        )
+        + plan.suffix
+    )
+    version_field = get_version_field(model)
+    if version_field is not None and instance.pk is not None:
+        # Each widget carries the version, under the same name,
+        # so it is submitted whichever fields are rendered.
+        plan = get_hidden_input_plan(model, None)
+        hidden += (
+            plan.prefix
+            + format_attrs(
+                {
+                    "data-instance-pk": pk,
+                    "data-nango-version": "",
+                    "type": "hidden",
+                    "name": f"__version-{form.prefix}" if form.prefix else "__version",
+                    "value": str(getattr(instance, version_field.attname)),
+                }
             )
-            return result + hidden
+            + plan.suffix
+        )
+    return mark_safe(hidden)
+
+
+class HiddenInputWidgetMixin:
+    """
+    Renders the hidden inputs for the field after the widget.
+    patch_widgets() swaps widgets to a subclass with this mixin,
+    rather than binding a new _render to each of them.
+    """
+
+    _nango_form: Form
+    _nango_field_name: str
+
+    def _render(self, template, context, *args, **kw):
+        result = super()._render(template, context, *args, **kw)  # type: ignore
+        if "widget" not in context:
+            return result
+        return result + render_hidden_inputs(
+            form=self._nango_form,
+            field_name=self._nango_field_name,
+            widget_context=context["widget"],
+        )
 
-        widget._render = MethodType(_render, widget)
+
+@lru_cache(maxsize=None)
+def patched_widget_class(widget_class: type) -> type:
+    return type(widget_class.__name__, (HiddenInputWidgetMixin, widget_class), {})
+
+
+def patch_widgets(form: Form) -> None:
+    """
+    Modify the widgets so they will display the hidden inputs alongside
+    the normal stuff.
+    """
+    assert hasattr(form, "fields")
+    for field_name, field in form.fields.items():
+        widget = field.widget
+        if not isinstance(widget, HiddenInputWidgetMixin):
+            widget.__class__ = patched_widget_class(widget.__class__)
+        widget._nango_form = form
+        widget._nango_field_name = field_name
 
 
 def __getattr__(name: str) -> Any:
@@ -160,18 +339,37 @@ def __getattr__(name: str) -> Any:
         # modified to have FormMixin too
         if issubclass(original, forms.Form) and not issubclass(original, FormMixin):
 
-            return type(original.__name__, (FormMixin, original), {})
+            return mixin_class(FormMixin, original)
+        # and model formsets get FormSetMixin
+        if issubclass(original, forms.BaseModelFormSet) and not issubclass(
+            original, FormSetMixin
+        ):
+            return mixin_class(FormSetMixin, original)
         return original
 
     if callable(original):
         sig = signature(original)
+        defaults = {}
         # Anything with a 'form' argument which is derived from
         # django's ModelForm gets modified to have FormMixin too
         if form := sig.parameters.get("form"):
             default = form.default
-            if issubclass(default, forms.Form) and not issubclass(default, FormMixin):
-                return partial(
-                    original, form=type(original.__name__, (FormMixin, default), {})
-                )
+            if (
+                isclass(default)
+                and issubclass(default, forms.BaseForm)
+                and not issubclass(default, FormMixin)
+            ):
+                defaults["form"] = mixin_class(FormMixin, default)
+        # and model formset factories make formsets with FormSetMixin
+        if formset := sig.parameters.get("formset"):
+            default = formset.default
+            if (
+                isclass(default)
+                and issubclass(default, forms.BaseModelFormSet)
+                and not issubclass(default, FormSetMixin)
+            ):
+                defaults["formset"] = mixin_class(FormSetMixin, default)
+        if defaults:
+            return partial(original, **defaults)
         return original
     raise AttributeError(f"module {__name__} has no attribute {name}")
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Protocol
+from typing import Set
+from weakref import WeakKeyDictionary
+
+from django.conf import settings
+
+from .db.notifications import instance_key
+from .metrics import observe
+from .metrics import register_gauge
+from .snapshots import snapshots
+from .subscriptions import group_by_subscriber
+from .subscriptions import Subscription
+from .subscriptions import SubscriptionIndex
+
+LOGGER = logging.getLogger(__file__)
+
+# Whether consumers share one channel layer subscription per group
+# in each process, rather than each joining the groups themselves
+ENABLE_FANOUT_HUB: bool = getattr(settings, "NANGO_ENABLE_FANOUT_HUB", False)
+
+# Seconds the hub waits before reading again after a failure
+HUB_RESTART_DELAY: float = getattr(settings, "NANGO_HUB_RESTART_DELAY", 1)
+
+
+class Subscriber(Protocol):
+    async def deliver(self, event: Dict[str, Any]) -> None: ...
+
+
+class Hub:
+    """
+    Joins each channel group once per process, using a channel of its
+    own, and hands the events it receives to every local subscriber of
+    the group in memory. A group is left when its last local subscriber
+    goes, and the hub stops reading when there are none at all.
+
+    Group membership expires in the channel layer (after its
+    group_expiry), so the hub adds its channel to the groups again
+    twice in each expiry period. Reading starts again after a failure.
+
+    The queryset subscriptions of nango.subscriptions are kept in an
+    index for each model group, and only their subscribers are given
+    the "rows" events of the saves which match them.
+    """
+
+    def __init__(self, channel_layer: Any) -> None:
+        self.channel_layer = channel_layer
+        self.subscribers: Dict[str, Set[Subscriber]] = defaultdict(set)
+        self.queries: Dict[str, SubscriptionIndex] = {}
+        self.channel_name: Optional[str] = None
+        self._reader: Optional["asyncio.Task[None]"] = None
+        self._refresher: Optional["asyncio.Task[None]"] = None
+
+    def _in_use(self, group: str) -> bool:
+        return bool(self.subscribers.get(group)) or bool(self.queries.get(group))
+
+    async def subscribe(self, subscriber: Subscriber, groups: Iterable[str]) -> None:
+        new_groups = []
+        for group in groups:
+            if not self._in_use(group):
+                new_groups.append(group)
+            self.subscribers[group].add(subscriber)
+        await self._join(new_groups)
+
+    async def subscribe_query(self, subscription: Subscription, group: str) -> None:
+        new_groups = [] if self._in_use(group) else [group]
+        self.queries.setdefault(group, SubscriptionIndex()).add(subscription)
+        await self._join(new_groups)
+
+    async def _join(self, new_groups: List[str]) -> None:
+        if not new_groups:
+            return
+        if self.channel_name is None:
+            self.channel_name = await self.channel_layer.new_channel(prefix="nango-hub")
+        await self._add(new_groups)
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.ensure_future(self._supervise())
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.ensure_future(self._refresh())
+
+    async def _add(self, groups: Iterable[str]) -> None:
+        await asyncio.gather(
+            *(
+                self.channel_layer.group_add(group=group, channel=self.channel_name)
+                for group in groups
+            )
+        )
+
+    async def unsubscribe(self, subscriber: Subscriber, groups: Iterable[str]) -> None:
+        old_groups = []
+        for group in groups:
+            subscribers = self.subscribers.get(group)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.subscribers[group]
+                if not self._in_use(group):
+                    old_groups.append(group)
+        await self._leave(old_groups)
+
+    async def unsubscribe_query(self, subscription: Subscription, group: str) -> None:
+        index = self.queries.get(group)
+        if index is None:
+            return
+        index.remove(subscription)
+        if not index:
+            del self.queries[group]
+            if not self._in_use(group):
+                await self._leave([group])
+
+    async def _leave(self, old_groups: List[str]) -> None:
+        await asyncio.gather(
+            *(
+                self.channel_layer.group_discard(group=group, channel=self.channel_name)
+                for group in old_groups
+            )
+        )
+        snapshots.discard(old_groups)
+        if not self.subscribers and not self.queries:
+            for task in (self._reader, self._refresher):
+                if task is not None:
+                    task.cancel()
+            self._reader = self._refresher = None
+
+    async def _refresh(self) -> None:
+        interval = getattr(self.channel_layer, "group_expiry", 86400) / 2
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._add(set(self.subscribers) | set(self.queries))
+            except Exception:
+                LOGGER.exception("Unable to add the hub to its groups again")
+
+    async def _supervise(self) -> None:
+        while True:
+            try:
+                await self.read()
+            except Exception:
+                LOGGER.exception("The hub stopped reading events, restarting")
+            await asyncio.sleep(HUB_RESTART_DELAY)
+
+    async def read(self) -> None:
+        while True:
+            event = await self.channel_layer.receive(self.channel_name)
+            group = event.get("group")
+            deliveries = [
+                (subscriber, event) for subscriber in self.subscribers.get(group, ())
+            ]
+            if event.get("type") == "saved" and (index := self.queries.get(group)):
+                # this process may not be in the instance's own group,
+                # whose events would refresh its snapshot
+                snapshots.invalidate([instance_key(event["message"])], local_only=True)
+                deliveries += [
+                    (
+                        subscriber,
+                        dict(
+                            type="rows",
+                            group=group,
+                            message=event["message"],
+                            matches=matches,
+                        ),
+                    )
+                    for subscriber, matches in group_by_subscriber(
+                        index.match(event["message"])
+                    ).items()
+                ]
+            observe("nango_notification_fanout", len(deliveries))
+            for subscriber, subscriber_event in deliveries:
+                try:
+                    await subscriber.deliver(subscriber_event)
+                except Exception:
+                    LOGGER.exception(
+                        f"Unable to deliver {subscriber_event} to {subscriber}"
+                    )
+
+
+# one hub for each event loop and channel layer
+_HUBS: "WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Any, Hub]]" = (
+    WeakKeyDictionary()
+)
+
+
+def get_hub(channel_layer: Any) -> Hub:
+    hubs = _HUBS.setdefault(asyncio.get_running_loop(), {})
+    if (hub := hubs.get(channel_layer)) is None:
+        hub = hubs[channel_layer] = Hub(channel_layer)
+    return hub
+
+
+register_gauge(
+    "nango_hub_groups",
+    lambda: sum(
+        len(hub.subscribers)
+        for hubs in list(_HUBS.values())
+        for hub in list(hubs.values())
+    ),
+)
@@ -0,0 +1,318 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Protocol
+from typing import Sequence
+from weakref import WeakKeyDictionary
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+try:
+    import aioredis
+except ModuleNotFoundError:
+    aioredis = None
+
+"""
+Leases which stop two people editing the same thing at once.
+
+A lease is held by a tab (its nangoTabId) on an instance, or on a
+single field of an instance, for LOCK_TTL seconds, and is renewed by
+taking it again. A field lease conflicts with a lease on its instance
+held by another tab, and the other way around. ws.js takes leases over
+the LiveUpdatesConsumer websocket, which gives them up when the socket
+closes.
+
+Leases are cooperative: tab ids are chosen by the browser, so they keep
+colleagues out of each other's way rather than enforce any permission.
+"""
+
+LOGGER = logging.getLogger(__file__)
+
+LOCK_BACKEND: str = getattr(
+    settings, "NANGO_LOCK_BACKEND", "nango.locks.InMemoryLockBackend"
+)
+# How long a lease lasts unless it is renewed, in seconds
+LOCK_TTL: float = getattr(settings, "NANGO_LOCK_TTL", 30)
+# Used by RedisLockBackend
+LOCK_REDIS_URL: str = getattr(settings, "NANGO_LOCK_REDIS_URL", "redis://127.0.0.1")
+
+
+class LockKey(NamedTuple):
+    app: str
+    model: str
+    pk: Any
+    # None for the whole instance
+    attr: Optional[str] = None
+
+    @property
+    def instance(self) -> "LockKey":
+        return self._replace(attr=None)
+
+
+class Lease(NamedTuple):
+    owner: str
+    expires: float
+
+
+class LockBackend(Protocol):
+    """
+    Backends take, give up and look up leases. holders() is how
+    they are checked, and must not depend on how many are held.
+    """
+
+    async def acquire(self, key: LockKey, *, owner: str, ttl: float) -> str:
+        """
+        Take or renew the lease, returning its holder:
+        the owner if it was granted
+        """
+        ...
+
+    async def release(self, key: LockKey, *, owner: str) -> None: ...
+
+    async def holder(self, key: LockKey) -> Optional[str]:
+        """
+        Who holds a lease which stops others changing this key, if anyone
+        """
+        ...
+
+    async def holders(self, keys: Sequence[LockKey]) -> List[Optional[str]]:
+        """
+        holder() for each of these keys, which are of the same instance
+        """
+        ...
+
+    def holder_sync(self, key: LockKey) -> Optional[str]: ...
+
+    def holders_sync(self, keys: Sequence[LockKey]) -> List[Optional[str]]: ...
+
+
+class InMemoryLockBackend:
+    """
+    Leases held by this process only, for a single server and tests
+    """
+
+    def __init__(self) -> None:
+        # used from the event loop and from the threads running clean()
+        self.lock = threading.Lock()
+        self.leases: Dict[LockKey, Lease] = {}
+        # the field leases of each instance
+        self.fields: Dict[LockKey, Dict[str, Lease]] = {}
+
+    def _live(self, key: LockKey, now: float) -> Optional[Lease]:
+        if key.attr is None:
+            lease = self.leases.get(key)
+        else:
+            lease = self.fields.get(key.instance, {}).get(key.attr)
+        return lease if lease is not None and lease.expires > now else None
+
+    def _holder(self, key: LockKey, now: float) -> Optional[str]:
+        if (lease := self._live(key.instance, now)) is not None:
+            return lease.owner
+        if key.attr is not None:
+            lease = self._live(key, now)
+            return lease.owner if lease is not None else None
+        for lease in self.fields.get(key, {}).values():
+            if lease.expires > now:
+                return lease.owner
+        return None
+
+    async def acquire(self, key: LockKey, *, owner: str, ttl: float) -> str:
+        now = time.monotonic()
+        with self.lock:
+            if (lease := self._live(key.instance, now)) is not None:
+                if lease.owner != owner:
+                    return lease.owner
+            if key.attr is None:
+                for lease in self.fields.get(key, {}).values():
+                    if lease.expires > now and lease.owner != owner:
+                        return lease.owner
+                self.leases[key] = Lease(owner, now + ttl)
+                return owner
+            if (lease := self._live(key, now)) is not None and lease.owner != owner:
+                return lease.owner
+            fields = self.fields.setdefault(key.instance, {})
+            # drop the leases nobody renewed
+            for attr in [
+                attr for attr, lease in fields.items() if lease.expires <= now
+            ]:
+                del fields[attr]
+            fields[key.attr] = Lease(owner, now + ttl)
+            return owner
+
+    async def release(self, key: LockKey, *, owner: str) -> None:
+        with self.lock:
+            if key.attr is None:
+                if (lease := self.leases.get(key)) is not None and lease.owner == owner:
+                    del self.leases[key]
+                return
+            fields = self.fields.get(key.instance, {})
+            if (lease := fields.get(key.attr)) is not None and lease.owner == owner:
+                del fields[key.attr]
+                if not fields:
+                    del self.fields[key.instance]
+
+    async def holder(self, key: LockKey) -> Optional[str]:
+        return self.holder_sync(key)
+
+    async def holders(self, keys: Sequence[LockKey]) -> List[Optional[str]]:
+        return self.holders_sync(keys)
+
+    def holder_sync(self, key: LockKey) -> Optional[str]:
+        return self.holders_sync([key])[0]
+
+    def holders_sync(self, keys: Sequence[LockKey]) -> List[Optional[str]]:
+        now = time.monotonic()
+        with self.lock:
+            return [self._holder(key, now) for key in keys]
+
+
+# The keys of an instance share a hash tag, so they are on the same
+# node of a cluster. Field leases also have a sorted set of their
+# attrs by expiry, so an instance lease can find them.
+ACQUIRE = """
+local owner, ttl, now = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3])
+local instance = redis.call("GET", KEYS[2])
+if instance and instance ~= owner then return instance end
+if KEYS[1] == KEYS[2] then
+    redis.call("ZREMRANGEBYSCORE", KEYS[3], "-inf", now)
+    for _, attr in ipairs(redis.call("ZRANGE", KEYS[3], 0, -1)) do
+        local holder = redis.call("GET", KEYS[2] .. "." .. attr)
+        if holder and holder ~= owner then return holder end
+    end
+    redis.call("SET", KEYS[1], owner, "PX", ttl)
+    return owner
+end
+if not redis.call("SET", KEYS[1], owner, "PX", ttl, "NX") then
+    local holder = redis.call("GET", KEYS[1])
+    if holder ~= owner then return holder end
+    redis.call("PEXPIRE", KEYS[1], ttl)
+end
+redis.call("ZADD", KEYS[3], now + ttl, ARGV[4])
+redis.call("PEXPIRE", KEYS[3], ttl)
+return owner
+"""
+
+RELEASE = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    redis.call("DEL", KEYS[1])
+    if KEYS[1] ~= KEYS[2] then redis.call("ZREM", KEYS[3], ARGV[2]) end
+end
+return 0
+"""
+
+# The holder of each attr in ARGV[2:], "" for the instance itself,
+# or "" if nobody holds a lease stopping others changing it
+HOLDERS = """
+local instance = redis.call("GET", KEYS[1])
+local holders = {}
+for i = 2, #ARGV do
+    local attr, holder = ARGV[i], instance
+    if not holder and attr ~= "" then
+        holder = redis.call("GET", KEYS[1] .. "." .. attr)
+    elseif not holder then
+        for _, other in ipairs(
+            redis.call("ZRANGEBYSCORE", KEYS[2], ARGV[1], "+inf")
+        ) do
+            holder = redis.call("GET", KEYS[1] .. "." .. other)
+            if holder then break end
+        end
+    end
+    holders[#holders + 1] = holder or ""
+end
+return holders
+"""
+
+
+class RedisLockBackend:
+    """
+    Leases shared by every process, kept in redis at LOCK_REDIS_URL.
+    Leases are SET with NX and a PX expiry, in scripts which also
+    check for conflicting leases of the instance or its fields.
+
+    Leases are checked from the threads running clean() through one
+    event loop of their own, which keeps its connections open.
+    """
+
+    def __init__(self, url: str = LOCK_REDIS_URL) -> None:
+        if aioredis is None:
+            raise ImportError("RedisLockBackend requires aioredis")
+        self.url = url
+        # connections cannot be shared between event loops
+        self._pools: "WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = (
+            WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _redis(self) -> Any:
+        loop = asyncio.get_running_loop()
+        if (pool := self._pools.get(loop)) is None:
+            pool = self._pools[loop] = await aioredis.create_redis_pool(self.url)
+        return pool
+
+    @staticmethod
+    def _keys(key: LockKey):
+        instance = f"nango.lock.{{{key.app}.{key.model}.{key.pk}}}"
+        lease = instance if key.attr is None else f"{instance}.{key.attr}"
+        return [lease, instance, f"{instance}:fields"]
+
+    @staticmethod
+    def _now() -> int:
+        return int(time.time() * 1000)
+
+    async def acquire(self, key: LockKey, *, owner: str, ttl: float) -> str:
+        redis = await self._redis()
+        holder = await redis.eval(
+            ACQUIRE,
+            keys=self._keys(key),
+            args=[owner, int(ttl * 1000), self._now(), key.attr or ""],
+        )
+        return holder.decode()
+
+    async def release(self, key: LockKey, *, owner: str) -> None:
+        redis = await self._redis()
+        await redis.eval(RELEASE, keys=self._keys(key), args=[owner, key.attr or ""])
+
+    async def holder(self, key: LockKey) -> Optional[str]:
+        return (await self.holders([key]))[0]
+
+    async def holders(self, keys: Sequence[LockKey]) -> List[Optional[str]]:
+        if not keys:
+            return []
+        redis = await self._redis()
+        _, instance, fields = self._keys(keys[0])
+        holders = await redis.eval(
+            HOLDERS,
+            keys=[instance, fields],
+            args=[self._now(), *(key.attr or "" for key in keys)],
+        )
+        return [holder.decode() or None for holder in holders]
+
+    def holder_sync(self, key: LockKey) -> Optional[str]:
+        return self.holders_sync([key])[0]
+
+    def holders_sync(self, keys: Sequence[LockKey]) -> List[Optional[str]]:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever, name="nango-locks", daemon=True
+                ).start()
+        return asyncio.run_coroutine_threadsafe(self.holders(keys), self._loop).result()
+
+
+_backend: Optional[LockBackend] = None
+
+
+def get_lock_backend() -> LockBackend:
+    global _backend
+    if _backend is None:
+        _backend = import_string(LOCK_BACKEND)()
+    return _backend
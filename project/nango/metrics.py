@@ -0,0 +1,191 @@
+import logging
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Protocol
+from typing import Tuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+"""
+Counters and histograms describing what nango is doing, such as how
+many consumers each notification is delivered to, and how long
+Clean/Submit requests take.
+
+They are recorded by the backend named by NANGO_METRICS_BACKEND, which
+by default keeps them in memory, for nango.views.metrics to expose in
+the plain text format understood by Prometheus.
+"""
+
+LOGGER = logging.getLogger(__file__)
+
+METRICS_BACKEND: str = getattr(
+    settings, "NANGO_METRICS_BACKEND", "nango.metrics.InMemoryBackend"
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# the histograms which do not measure seconds
+BUCKETS: Dict[str, Tuple[float, ...]] = {
+    "nango_database_queries": COUNT_BUCKETS,
+    "nango_notification_fanout": COUNT_BUCKETS,
+}
+
+
+class Backend(Protocol):
+    def increment(self, name: str, value: float, labels: Labels) -> None: ...
+
+    def observe(self, name: str, value: float, labels: Labels) -> None: ...
+
+    def render(self) -> str: ...
+
+
+class NullBackend:
+    """
+    Records nothing
+    """
+
+    def increment(self, name: str, value: float, labels: Labels) -> None:
+        pass
+
+    def observe(self, name: str, value: float, labels: Labels) -> None:
+        pass
+
+    def render(self) -> str:
+        return ""
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        # the last one is for values above every bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class InMemoryBackend:
+    """
+    Keeps the metrics of this process in memory
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[Labels, float]] = defaultdict(dict)
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = defaultdict(dict)
+
+    def increment(self, name: str, value: float, labels: Labels) -> None:
+        with self.lock:
+            counters = self.counters[name]
+            counters[labels] = counters.get(labels, 0) + value
+
+    def observe(self, name: str, value: float, labels: Labels) -> None:
+        with self.lock:
+            histograms = self.histograms[name]
+            if (histogram := histograms.get(labels)) is None:
+                histogram = histograms[labels] = Histogram(
+                    BUCKETS.get(name, SECONDS_BUCKETS)
+                )
+            histogram.observe(value)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self.lock:
+            for name, counters in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in counters.items():
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+            for name, histograms in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in histograms.items():
+                    cumulative = 0
+                    for bound, count in zip(
+                        (*histogram.buckets, "+Inf"), histogram.counts
+                    ):
+                        cumulative += count
+                        bucket_labels = (*labels, ("le", str(bound)))
+                        lines.append(
+                            f"{name}_bucket{format_labels(bucket_labels)} {cumulative}"
+                        )
+                    lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+                    lines.append(
+                        f"{name}_count{format_labels(labels)} {histogram.count}"
+                    )
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+class QueryCounter:
+    """
+    A database execute wrapper counting the queries run through it
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _escape(value: str) -> str:
+    # as the text exposition format requires of label values
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+_backend: Optional[Backend] = None
+
+# gauges are only measured when the metrics are rendered
+_gauges: Dict[str, Callable[[], float]] = {}
+
+
+def get_backend() -> Backend:
+    global _backend
+    if _backend is None:
+        _backend = import_string(METRICS_BACKEND)()
+    return _backend
+
+
+def increment(name: str, value: float = 1, **labels: str) -> None:
+    get_backend().increment(name, value, tuple(labels.items()))
+
+
+def observe(name: str, value: float, **labels: str) -> None:
+    get_backend().observe(name, value, tuple(labels.items()))
+
+
+def register_gauge(name: str, measure: Callable[[], float]) -> None:
+    _gauges[name] = measure
+
+
+def render() -> str:
+    """
+    All the metrics, in the Prometheus text exposition format
+    """
+    lines = [get_backend().render()]
+    for name, measure in sorted(_gauges.items()):
+        try:
+            value = measure()
+        except Exception:
+            LOGGER.exception(f"Unable to measure {name}")
+            continue
+        lines.append(f"# TYPE {name} gauge\n{name} {value}\n")
+    return "".join(lines)
@@ -0,0 +1,348 @@
+import json
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any
+from typing import cast
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from django.conf import settings
+
+"""
+The framing of messages between ws.js and LiveUpdatesConsumer.
+
+Clients which offer the COMPACT_PROTOCOL websocket subprotocol
+exchange messages with short keys, and the server does not echo
+back the whole of a Clean/Submit request, only its id. Server
+frames are binary: a flag byte followed by the JSON, deflated if
+it is longer than COMPRESSION_THRESHOLD bytes.
+
+Everyone else gets the original, verbose JSON protocol.
+
+Clients which negotiate the "delta" feature are sent changes to long
+values as an edit script against the value they already hold, with
+the CRC-32 of that value and of the result, so they can tell when they
+hold something else and ask for the whole value again (by registering
+the field) instead.
+"""
+
+COMPACT_PROTOCOL = "nango.compact.v1"
+
+# Compact frames at least this long are compressed
+COMPRESSION_THRESHOLD: int = getattr(settings, "NANGO_COMPRESSION_THRESHOLD", 1024)
+
+# Changes to values at least this long are sent as edit scripts to
+# clients which understand them, 0 to always send whole values
+DELTA_MIN_SIZE: int = getattr(settings, "NANGO_DELTA_MIN_SIZE", 0)
+# The edit scripts of recent changes are kept, so a saved value is
+# compared once for all the clients it is sent to, up to this many
+# characters of the values they are between
+DELTA_CACHE_SIZE: int = getattr(settings, "NANGO_DELTA_CACHE_SIZE", 1 << 22)
+
+PLAIN = 0
+DEFLATED = 1
+
+Message = Dict[str, Any]
+# what to pass to AsyncWebsocketConsumer.send()
+Frame = Tuple[Optional[str], Optional[bytes]]
+
+# client action codes
+COMPACT_ACTIONS = {
+    "r": "Register",
+    "c": "Clean",
+    "s": "Submit",
+    "B": "Batch",
+    "l": "Lock",
+    "u": "Unlock",
+    "q": "Subscribe",
+    "Q": "Unsubscribe",
+}
+# server action codes
+COMPACT_REPLIES = {
+    "clean": "c",
+    "submit": "s",
+    "superseded": "x",
+    "lock": "l",
+    "subscribe": "q",
+}
+# the results added to a Clean/Submit/Lock/Subscribe request
+COMPACT_RESULTS = {
+    "cleanedValue": "cv",
+    "validationErrors": "ve",
+    "error": "e",
+    "granted": "g",
+    "holder": "h",
+    "ttl": "ttl",
+}
+
+
+def load_frame(*, text_data: Optional[str], bytes_data: Optional[bytes]) -> Any:
+    # channels passes one or the other
+    return json.loads(text_data if text_data is not None else cast(bytes, bytes_data))
+
+
+class JsonCodec:
+    # whether replies may use edit scripts
+    delta = False
+
+    def decode(self, *, text_data: Optional[str], bytes_data: Optional[bytes]) -> Any:
+        return load_frame(text_data=text_data, bytes_data=bytes_data)
+
+    def encode(self, message: Message) -> Frame:
+        return json.dumps(message), None
+
+
+class CompactCodec:
+    delta = False
+
+    def decode(self, *, text_data: Optional[str], bytes_data: Optional[bytes]) -> Any:
+        data = load_frame(text_data=text_data, bytes_data=bytes_data)
+        action = COMPACT_ACTIONS[data["a"]]
+        if action == "Register":
+            return dict(
+                action=action,
+                nangoTabId=data["t"],
+                features=data.get("f", []),
+                subscription=data.get("s", "instance"),
+                fields=[
+                    dict(appLabel=app, model=model, pk=pk, attr=attr, value=value)
+                    for app, model, pk, attr, value in data["r"]
+                ],
+            )
+        if action == "Batch":
+            return dict(
+                action=action,
+                nangoTabId=data["t"],
+                operations=[
+                    expand_request(dict(operation, t=data["t"]))
+                    for operation in data["o"]
+                ],
+            )
+        if action in ("Lock", "Unlock"):
+            app, model, pk, attr = data["d"]
+            return dict(
+                action=action,
+                id=data.get("i"),
+                nangoTabId=data["t"],
+                dataset=dict(
+                    appLabel=app, modelName=model, instancePk=pk, originalName=attr
+                ),
+            )
+        if action in ("Subscribe", "Unsubscribe"):
+            message = dict(action=action, id=data["i"])
+            if action == "Subscribe":
+                app, model = data["d"]
+                message.update(
+                    appLabel=app,
+                    model=model,
+                    filter=data.get("w", {}),
+                    attrs=data.get("f", []),
+                )
+            return message
+        return expand_request(data)
+
+    def encode(self, message: Message) -> Frame:
+        payload = json.dumps(
+            compact(message, delta=self.delta), separators=(",", ":")
+        ).encode()
+        if len(payload) >= COMPRESSION_THRESHOLD:
+            return None, bytes([DEFLATED]) + zlib.compress(payload)
+        return None, bytes([PLAIN]) + payload
+
+
+def expand_request(data: Any) -> Message:
+    """
+    The long form of a compact Clean or Submit
+    """
+    app, model, pk, attr = data["d"]
+    return dict(
+        action=COMPACT_ACTIONS[data["a"]],
+        id=data["i"],
+        nangoTabId=data["t"],
+        dataset=dict(appLabel=app, modelName=model, instancePk=pk, originalName=attr),
+        currentValue=data["cv"],
+        originalValue=data["ov"],
+    )
+
+
+def value_hash(value: str) -> int:
+    """
+    The CRC-32 of the UTF-16 code units of a value,
+    which is how ws.js sees strings
+    """
+    return zlib.crc32(value.encode("utf-16-le", "surrogatepass"))
+
+
+def _utf16_length(value: str) -> int:
+    return len(value.encode("utf-16-le", "surrogatepass")) // 2
+
+
+def _common_prefix_length(a: str, b: str, chunk: int = 4096) -> int:
+    # whole chunks are compared as slices, then the characters
+    # of the first which differs, so each is only looked at once
+    length = min(len(a), len(b))
+    start = 0
+    while start < length and a[start : start + chunk] == b[start : start + chunk]:
+        start += chunk
+    end = min(start + chunk, length)
+    while start < end and a[start] == b[start]:
+        start += 1
+    return min(start, length)
+
+
+class DeltaCache:
+    """
+    Edit scripts by the values they are between, evicting the least
+    recently used once the values add up to more than max_size
+    characters
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        # used from the event loop and the database threads
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[Tuple[str, str], Optional[Message]]" = OrderedDict()
+        self.size = 0
+
+    def get(self, original: str, new: str) -> Optional[Message]:
+        key = (original, new)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        delta = _make_delta(original, new)
+        size = len(original) + len(new)
+        if size > self.max_size:
+            return delta
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = delta
+                self.size += size
+            while self.size > self.max_size:
+                (evicted, evicted_new), _ = self.entries.popitem(last=False)
+                self.size -= len(evicted) + len(evicted_new)
+        return delta
+
+
+_deltas = DeltaCache(DELTA_CACHE_SIZE)
+
+
+def make_delta(original: str, new: str) -> Optional[Message]:
+    """
+    An edit script turning original into new: replace the "deleted"
+    UTF-16 code units at "start" with "text". Typing changes a single
+    run of characters, so that is all it describes. None if it would
+    not be much shorter than the new value.
+    """
+    return _deltas.get(original, new)
+
+
+def _make_delta(original: str, new: str) -> Optional[Message]:
+    prefix = _common_prefix_length(original, new)
+    suffix = _common_prefix_length(original[prefix:][::-1], new[prefix:][::-1])
+    text = new[prefix : len(new) - suffix]
+    if len(text) + 64 >= len(new):
+        return None
+    return dict(
+        base=value_hash(original),
+        start=_utf16_length(original[:prefix]),
+        deleted=_utf16_length(original[prefix : len(original) - suffix]),
+        text=text,
+        hash=value_hash(new),
+    )
+
+
+def encode_change(change: Message) -> Message:
+    """
+    A change from a modify message, as an edit script if
+    the new value is long enough and that is shorter
+    """
+    original_value = change["original_value"]
+    new_value = change["new_value"]
+    if (
+        not DELTA_MIN_SIZE
+        or not isinstance(original_value, str)
+        or not isinstance(new_value, str)
+        or len(new_value) < DELTA_MIN_SIZE
+    ):
+        return change
+    if (delta := make_delta(original_value, new_value)) is None:
+        return change
+    return dict(attr=change["attr"], delta=delta)
+
+
+def _compact_delta(delta: Message) -> List[Any]:
+    return [
+        delta["base"],
+        delta["start"],
+        delta["deleted"],
+        delta["text"],
+        delta["hash"],
+    ]
+
+
+def compact(message: Message, *, delta: bool = False) -> Any:
+    """
+    The short form of a message from the consumer. With delta, long
+    cleaned values are sent as edit scripts against the request's value.
+    """
+    action = message["action"]
+    if action == "modifyBatch":
+        return dict(
+            a="b",
+            n=[
+                dict(
+                    a=instance["app"],
+                    o=instance["model"],
+                    p=instance["pk"],
+                    t=instance["nangoTabId"],
+                    c=[
+                        (
+                            [change["attr"], _compact_delta(change["delta"])]
+                            if "delta" in change
+                            else [
+                                change["attr"],
+                                change["original_value"],
+                                change["new_value"],
+                            ]
+                        )
+                        for change in instance["changes"]
+                    ],
+                    **(
+                        {"v": instance["version"]}
+                        if instance.get("version") is not None
+                        else {}
+                    ),
+                )
+                for instance in message["message"]["instances"]
+            ],
+        )
+    if action == "batch":
+        return dict(
+            a="B",
+            r=[
+                compact(result, delta=delta) for result in message["message"]["results"]
+            ],
+        )
+    if code := COMPACT_REPLIES.get(action):
+        data = message["message"]
+        # the client remembers what it asked, so only the results are sent
+        results = {
+            short: data[key] for key, short in COMPACT_RESULTS.items() if key in data
+        }
+        if delta and "cv" in results:
+            change = encode_change(
+                dict(
+                    attr=None,
+                    original_value=data.get("currentValue"),
+                    new_value=results["cv"],
+                )
+            )
+            if "delta" in change:
+                results["cd"] = _compact_delta(change["delta"])
+                del results["cv"]
+        return dict(a=code, i=data["id"], **results)
+    return message
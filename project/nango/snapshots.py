@@ -0,0 +1,320 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from itertools import count
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Mapping
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .common import instance_ref_to_channel_group_key
+from .metrics import increment
+
+"""
+A cache of the serialised values of instances, so the consumers of a
+process do not each go to the database for the same row when
+reconciling registrations or fetching values too large to broadcast.
+
+The first tier is an LRU in each process. The optional second tier is
+the django cache named by NANGO_SNAPSHOT_CACHE, shared by every worker.
+Saves go through nango.db.notifications.defer, which invalidates both
+tiers when the save is made and again when its transaction commits.
+The first tier only keeps instances whose channel groups the process
+has joined, and applies the notifications of saves made by other
+processes as they arrive. Entries live for at most
+NANGO_SNAPSHOT_CACHE_TTL seconds, which bounds how long saves made
+without nango (or the shared tier's races) can go unnoticed.
+
+Checks for concurrent modification never use this cache: they read
+the locked row.
+"""
+
+LOGGER = logging.getLogger(__file__)
+
+# How many instances each process keeps, 0 to disable the cache
+SNAPSHOT_CACHE_SIZE: int = getattr(settings, "NANGO_SNAPSHOT_CACHE_SIZE", 10000)
+# How long an entry is trusted for, in seconds
+SNAPSHOT_CACHE_TTL: float = getattr(settings, "NANGO_SNAPSHOT_CACHE_TTL", 60)
+# The alias of a django cache to share entries between workers
+SNAPSHOT_CACHE: Optional[str] = getattr(settings, "NANGO_SNAPSHOT_CACHE", None)
+
+SnapshotKey = Tuple[str, str, Any]
+
+
+class Snapshot(NamedTuple):
+    # None once invalidated
+    values: Optional[Dict[str, str]]
+    version: Optional[int]
+    expires: float
+    # the generation at which it was stored or invalidated
+    generation: int
+
+
+class SnapshotCache:
+    """
+    Values are looked up per attr, so an entry can be filled in by
+    lookups of different attrs of the same instance. Lookups note the
+    generation before reading the database, and their results are not
+    stored if the instance has been invalidated since.
+    """
+
+    def __init__(
+        self, *, max_size: int, ttl: float, alias: Optional[str] = None
+    ) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.alias = alias
+        # used from the event loop and the database threads
+        self.lock = threading.Lock()
+        # by channel group, so entries can be dropped with their group
+        self.entries: "OrderedDict[str, Snapshot]" = OrderedDict()
+        self._generations = count(1)
+        self._generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @property
+    def shared(self) -> Any:
+        return caches[self.alias] if self.alias else None
+
+    def generation(self) -> int:
+        """
+        Call before reading the database, and pass to store()
+        """
+        return self._generation
+
+    def get(
+        self,
+        key: SnapshotKey,
+        attrs: Iterable[str],
+        *,
+        min_version: Optional[int] = None,
+    ) -> Optional[Tuple[Dict[str, str], Optional[int]]]:
+        """
+        The values of these attrs and the version of the instance, or
+        None unless they are all cached (at this version or later)
+        """
+        if not self.enabled:
+            return None
+        found = self._get_local(key, attrs, min_version=min_version)
+        if found is not None:
+            increment("nango_snapshot_cache_total", result="local")
+            return found
+        if self.alias:
+            generation = self.generation()
+            snapshot = self.shared.get(self._shared_key(key))
+            if snapshot is not None:
+                values, version = snapshot
+                if self._covers(values, version, attrs, min_version=min_version):
+                    increment("nango_snapshot_cache_total", result="shared")
+                    self._store_local(key, values, version, since=generation)
+                    return {attr: values[attr] for attr in attrs}, version
+        increment("nango_snapshot_cache_total", result="miss")
+        return None
+
+    def get_many(
+        self, keys: Mapping[SnapshotKey, Iterable[str]]
+    ) -> Dict[SnapshotKey, Tuple[Dict[str, str], Optional[int]]]:
+        """
+        get() for several instances, with a single trip to the shared tier
+        """
+        if not self.enabled:
+            return {}
+        found = {}
+        missing = {}
+        for key, attrs in keys.items():
+            if (snapshot := self._get_local(key, attrs)) is not None:
+                found[key] = snapshot
+            else:
+                missing[self._shared_key(key)] = key
+        increment("nango_snapshot_cache_total", len(found), result="local")
+        if missing and self.alias:
+            shared = len(missing)
+            generation = self.generation()
+            for shared_key, (values, version) in self.shared.get_many(
+                list(missing)
+            ).items():
+                key = missing[shared_key]
+                if self._covers(values, version, keys[key]):
+                    found[key] = ({attr: values[attr] for attr in keys[key]}, version)
+                    self._store_local(key, values, version, since=generation)
+                    del missing[shared_key]
+            increment(
+                "nango_snapshot_cache_total", shared - len(missing), result="shared"
+            )
+        increment("nango_snapshot_cache_total", len(missing), result="miss")
+        return found
+
+    def store(
+        self,
+        key: SnapshotKey,
+        values: Dict[str, str],
+        version: Optional[int],
+        *,
+        since: int,
+    ) -> None:
+        """
+        Remember values read from the database, unless the instance
+        has been invalidated since the generation the read began at
+        """
+        if not self.enabled:
+            return
+        stored = self._store_local(key, values, version, since=since)
+        if stored is not None and self.alias:
+            self.shared.set(self._shared_key(key), (stored, version), self.ttl)
+
+    def refresh(
+        self,
+        key: SnapshotKey,
+        *,
+        fields: Optional[Iterable[str]],
+        values: Dict[str, str],
+        version: Optional[int],
+    ) -> None:
+        """
+        Apply a notification of a save made by another process
+        to the local tier
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            group = instance_ref_to_channel_group_key(*key)
+            snapshot = self.entries.get(group)
+            if snapshot is None or snapshot.values is None:
+                return
+            if version is not None and (snapshot.version or 0) >= version:
+                return
+            if fields is None:
+                new_values = {}
+            else:
+                # values too large to broadcast have to be fetched again
+                new_values = {
+                    attr: value
+                    for attr, value in snapshot.values.items()
+                    if attr not in fields
+                }
+            new_values.update(values)
+            # reads which began before this save must not overwrite it
+            generation = self._generation = next(self._generations)
+            self.entries[group] = snapshot._replace(
+                values=new_values, version=version, generation=generation
+            )
+
+    def invalidate(
+        self, keys: Iterable[SnapshotKey], *, local_only: bool = False
+    ) -> None:
+        """
+        Forget these instances, for example when they are saved.
+        local_only when the saver has already invalidated the shared tier.
+        """
+        if not self.enabled:
+            return
+        keys = list(keys)
+        if not keys:
+            return
+        with self.lock:
+            generation = self._generation = next(self._generations)
+            expires = time.monotonic() + self.ttl
+            for key in keys:
+                # remembered, so slower reads which began before
+                # the save do not store what they found
+                self._put(
+                    instance_ref_to_channel_group_key(*key),
+                    Snapshot(None, None, expires, generation),
+                )
+        if self.alias and not local_only:
+            self.shared.delete_many([self._shared_key(key) for key in keys])
+
+    def discard(self, groups: Iterable[str]) -> None:
+        """
+        Forget the instances of channel groups this process has left,
+        as it will no longer hear about their saves
+        """
+        with self.lock:
+            for group in groups:
+                snapshot = self.entries.get(group)
+                if snapshot is not None and snapshot.values is not None:
+                    del self.entries[group]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def _get_local(
+        self,
+        key: SnapshotKey,
+        attrs: Iterable[str],
+        *,
+        min_version: Optional[int] = None,
+    ) -> Optional[Tuple[Dict[str, str], Optional[int]]]:
+        group = instance_ref_to_channel_group_key(*key)
+        with self.lock:
+            snapshot = self.entries.get(group)
+            if snapshot is None or snapshot.values is None:
+                return None
+            if snapshot.expires < time.monotonic():
+                del self.entries[group]
+                return None
+            if not self._covers(
+                snapshot.values, snapshot.version, attrs, min_version=min_version
+            ):
+                return None
+            self.entries.move_to_end(group)
+            return {attr: snapshot.values[attr] for attr in attrs}, snapshot.version
+
+    def _store_local(
+        self,
+        key: SnapshotKey,
+        values: Dict[str, str],
+        version: Optional[int],
+        *,
+        since: int,
+    ) -> Optional[Dict[str, str]]:
+        group = instance_ref_to_channel_group_key(*key)
+        with self.lock:
+            snapshot = self.entries.get(group)
+            now = time.monotonic()
+            if snapshot is not None and snapshot.expires >= now:
+                if snapshot.generation > since:
+                    # saved after this read began
+                    return None
+                if snapshot.values is not None and snapshot.version == version:
+                    values = {**snapshot.values, **values}
+            self._put(group, Snapshot(values, version, now + self.ttl, since))
+            return values
+
+    def _put(self, group: str, snapshot: Snapshot) -> None:
+        self.entries[group] = snapshot
+        self.entries.move_to_end(group)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    @staticmethod
+    def _covers(
+        values: Dict[str, str],
+        version: Optional[int],
+        attrs: Iterable[str],
+        *,
+        min_version: Optional[int] = None,
+    ) -> bool:
+        if min_version is not None and (version is None or version < min_version):
+            return False
+        return all(attr in values for attr in attrs)
+
+    @staticmethod
+    def _shared_key(key: SnapshotKey) -> str:
+        return "nango.snapshot." + instance_ref_to_channel_group_key(*key)
+
+
+snapshots = SnapshotCache(
+    max_size=SNAPSHOT_CACHE_SIZE, ttl=SNAPSHOT_CACHE_TTL, alias=SNAPSHOT_CACHE
+)
@@ -12,3 +12,11 @@ function nangoShowValidationError(inputId, validationErrors) {
   const input = document.getElementById(inputId);
   input.parentNode.insertBefore(div, input.nextSibling);
 }
+
+document.addEventListener("DOMContentLoaded", () => {
+  // a list_editable changelist shows many rows of one model, so
+  // it joins the model's group rather than one group per row
+  if (document.getElementById("changelist-form")) {
+    nangoSubscription = "model";
+  }
+});
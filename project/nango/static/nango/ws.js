@@ -11,15 +11,80 @@ function uuidv4() {
 
 const nangoTabId = uuidv4();
 
-const debounce = (callback, wait) => {
-  let timeoutId = null;
-  return (...args) => {
-    window.clearTimeout(timeoutId);
-    timeoutId = window.setTimeout(() => {
-      callback.apply(null, args);
-    }, wait);
+// optional protocol features this script understands, negotiated
+// with the server when registering
+const nangoFeatures = ["modifyBatch", "delta"];
+
+// the websocket subprotocol with short keys and binary, optionally
+// compressed, server frames. Without it, plain JSON is used.
+const nangoProtocol = "nango.compact.v1";
+// Clean/Submit requests sent using the compact protocol, by id,
+// as the replies only carry the results
+const nangoPendingRequests = new Map();
+let nangoLastRequestId = 0;
+
+// "model" to be told about the registered instances by a single
+// subscription to their model, where the server allows it
+let nangoSubscription = "instance";
+
+// the latest version seen of each instance with a version field,
+// so notifications which arrive out of order can be discarded
+const nangoVersions = new Map();
+
+// leases held by this tab, by field, with the timers renewing them
+const nangoLeases = new Map();
+
+// the elements listing the rows of queryset subscriptions, by subscription id
+const nangoQuerySubscriptions = new Map();
+
+// for the CRC-32 of values sent as edit scripts
+const nangoCrcTable = Array.from({ length: 256 }, (_, n) => {
+  let c = n;
+  for (let k = 0; k < 8; k++) c = c & 1 ? 0xedb88320 ^ (c >>> 1) : c >>> 1;
+  return c >>> 0;
+});
+
+function nangoHash(value) {
+  /**
+   * The CRC-32 of the UTF-16 code units of a value, little-endian,
+   * matching nango.protocol.value_hash
+   **/
+  let crc = 0xffffffff;
+  for (let i = 0; i < value.length; i++) {
+    const unit = value.charCodeAt(i);
+    crc = nangoCrcTable[(crc ^ unit) & 0xff] ^ (crc >>> 8);
+    crc = nangoCrcTable[(crc ^ (unit >>> 8)) & 0xff] ^ (crc >>> 8);
+  }
+  return (crc ^ 0xffffffff) >>> 0;
+}
+
+function nangoApplyDelta(base, delta) {
+  /**
+   * Apply an edit script to the value it was made against,
+   * or return null if this is not that value
+   **/
+  if (nangoHash(base) !== delta.base) return null;
+  const value =
+    base.slice(0, delta.start) +
+    delta.text +
+    base.slice(delta.start + delta.deleted);
+  return nangoHash(value) === delta.hash ? value : null;
+}
+
+function nangoExpandDelta([base, start, deleted, text, hash]) {
+  return { base, start, deleted, text, hash };
+}
+
+function nangoRegisteredField(element) {
+  return {
+    appLabel: element.dataset.appLabel,
+    model: element.dataset.modelName,
+    pk: element.dataset.instancePk,
+    attr: element.dataset.originalName,
+    id: element.dataset.relatedFormId,
+    value: element.value
   };
-};
+}
 
 function nangoUnmarkInputAsOutdated(element) {
   element.classList.remove("nango-outdated");
@@ -36,6 +101,22 @@ function setupDebounces(ws) {
    **/
   // FIXME: what if an element has clean and submit???
   const actions = ["Clean", "Submit"];
+  // Debounced operations which have not been sent yet. When any of
+  // them is due, they are all sent together, as a single Batch.
+  const pending = new Map();
+  const flush = () => {
+    const operations = [];
+    pending.forEach(({ timeoutId, operation }) => {
+      window.clearTimeout(timeoutId);
+      operations.push(operation());
+    });
+    pending.clear();
+    if (operations.length === 1) {
+      nangoSend(ws, operations[0]);
+    } else if (operations.length > 1) {
+      nangoSend(ws, { action: "Batch", nangoTabId, operations });
+    }
+  };
   actions.forEach(action => {
     const elements = document.querySelectorAll(
       `input[data-auto-${action.toLowerCase()}-debounce-period-ms]`
@@ -49,33 +130,182 @@ function setupDebounces(ws) {
         element.dataset[`auto${action}DebouncePeriodMs`],
         10
       );
-      const debounced = debounce(() => {
+      const key = `${action}-${element.dataset.relatedFormId}`;
+      const operation = () => {
         const currentInput = document.getElementById(
           element.dataset.relatedFormId
         );
         const currentValue = currentInput.value;
         const originalValue = element.value;
-        ws.send(
-          JSON.stringify({
-            action,
-            dataset: element.dataset,
-            currentValue,
-            originalValue,
-            nangoTabId
-          })
-        );
-      }, debouncePeriodMs);
+        return {
+          action,
+          dataset: { ...element.dataset },
+          currentValue,
+          originalValue,
+          nangoTabId
+        };
+      };
       visibleInput.addEventListener("input", () => {
         visibleInput.dataset.nangoState = "unknown";
-        debounced();
+        if (pending.has(key)) window.clearTimeout(pending.get(key).timeoutId);
+        pending.set(key, {
+          timeoutId: window.setTimeout(flush, debouncePeriodMs),
+          operation
+        });
+      });
+    });
+  });
+}
+
+function nangoLockMessage(action, element) {
+  return {
+    action,
+    nangoTabId,
+    dataset: {
+      appLabel: element.dataset.appLabel,
+      modelName: element.dataset.modelName,
+      instancePk: element.dataset.instancePk,
+      originalName: element.dataset.originalName,
+      relatedFormId: element.dataset.relatedFormId
+    }
+  };
+}
+
+function setupLeases(ws) {
+  /**
+   * Take a lease on a field while its input has the focus, so
+   * nobody else changes it at the same time. The server gives it
+   * up when this tab goes away. Only the fields of models which
+   * can be locked are rendered with data-nango-lockable.
+   **/
+  document
+    .querySelectorAll("input[data-related-form-id][data-nango-lockable]")
+    .forEach(element => {
+      const visibleInput = document.getElementById(
+        element.dataset.relatedFormId
+      );
+      if (!visibleInput) return;
+      visibleInput.addEventListener("focus", () => {
+        nangoSend(ws, nangoLockMessage("Lock", element));
       });
+      visibleInput.addEventListener("blur", () => {
+        const key = element.dataset.relatedFormId;
+        if (!nangoLeases.has(key)) return;
+        window.clearInterval(nangoLeases.get(key));
+        nangoLeases.delete(key);
+        nangoSend(ws, nangoLockMessage("Unlock", element));
+      });
+    });
+}
+
+function setupQuerySubscriptions(ws, lists) {
+  /**
+   * Subscribe to the rows listed by each element with a
+   * data-nango-subscribe attribute. Inserts, updates and deletes
+   * of its rows are dispatched to it as "nango:rows" events, for
+   * the page to show however it lists them.
+   **/
+  lists.forEach(element => {
+    const id = ++nangoLastRequestId;
+    nangoQuerySubscriptions.set(id, element);
+    nangoSend(ws, {
+      action: "Subscribe",
+      id,
+      appLabel: element.dataset.appLabel,
+      model: element.dataset.modelName,
+      filter: JSON.parse(element.dataset.nangoFilter || "{}"),
+      attrs: (element.dataset.nangoAttrs || "").split(",").filter(Boolean)
     });
   });
 }
 
+function nangoOnSubscribe(data) {
+  if (data.error) {
+    console.error(`Unable to subscribe: ${data.error}`);
+    nangoQuerySubscriptions.delete(data.id);
+  }
+}
+
+function nangoOnRows(data) {
+  data.events.forEach(event => {
+    const element = nangoQuerySubscriptions.get(event.subscription);
+    if (!element) return;
+    element.dispatchEvent(
+      new CustomEvent("nango:rows", {
+        detail: {
+          event: event.event,
+          app: data.app,
+          model: data.model,
+          pk: data.pk,
+          version: data.version,
+          values: event.values
+        }
+      })
+    );
+  });
+}
+
+function nangoMarkInputAsLocked(visibleInput, locked) {
+  visibleInput.readOnly = locked;
+  visibleInput.classList.toggle("nango-locked", locked);
+}
+
+function nangoOnLock(ws, data) {
+  /**
+   * The server's answer to taking (or renewing) a lease
+   **/
+  if (data.error) {
+    console.error(`Unable to lock: ${data.error}`);
+    return;
+  }
+  const key = data.dataset.relatedFormId;
+  const visibleInput = document.getElementById(key);
+  if (!data.granted) {
+    if (nangoLeases.has(key)) {
+      window.clearInterval(nangoLeases.get(key));
+      nangoLeases.delete(key);
+    }
+    nangoMarkInputAsLocked(visibleInput, true);
+    visibleInput.blur();
+    return;
+  }
+  if (!nangoLeases.has(key) && document.activeElement === visibleInput) {
+    const element = document.querySelector(
+      `input[data-related-form-id=${key}]`
+    );
+    nangoLeases.set(
+      key,
+      window.setInterval(
+        () => nangoSend(ws, nangoLockMessage("Lock", element)),
+        (1000 * data.ttl) / 3
+      )
+    );
+  }
+}
+
+function nangoOnLeased(data) {
+  /**
+   * Someone took or gave up a lease on an instance on this page
+   **/
+  if (data.holder === nangoTabId) return;
+  document
+    .querySelectorAll(
+      `input[data-app-label="${data.app}"][data-model-name="${data.model}"][data-instance-pk="${data.pk}"]`
+    )
+    .forEach(element => {
+      if (data.attr !== null && element.dataset.originalName !== data.attr) {
+        return;
+      }
+      const visibleInput = document.getElementById(
+        element.dataset.relatedFormId
+      );
+      nangoMarkInputAsLocked(visibleInput, data.holder !== null);
+    });
+}
+
 function nangoDecideWhetherToReload(
   upstreamTabId,
-  data,
+  changes,
   elements,
   changedFormElements
 ) {
@@ -103,7 +333,15 @@ function nangoDecideWhetherToReload(
    *        - otherwise, clobber the local change and maybe warn/reload the page
    **/
 
-  let message = `Since you began editing this form, the value of ${data.attr} has changed from ${data.original_value} to ${data.new_value}.`;
+  const descriptions = [];
+  changes.forEach(change => {
+    descriptions.push(
+      `the value of ${change.attr} has changed from ${change.original_value} to ${change.new_value}`
+    );
+  });
+  let message = `Since you began editing this form, ${descriptions.join(
+    ", and "
+  )}.`;
   if (changedFormElements.length > 0 && upstreamTabId !== nangoTabId) {
     message = `${message}
 You have already modified some of these. Select 'OK' to reload the page.`;
@@ -129,9 +367,10 @@ You have not modified any of these form elements, so the values will be automati
       }
       */
       // TODO: we need to set the 'original value' to the new value too don't we?? Or was that done somewhere else already?
+      const change = changes.get(element.dataset.originalName);
       nangoUnmarkInputAsOutdated(visibleInput);
-      element.value = data.new_value;
-      visibleInput.value = data.new_value;
+      element.value = change.new_value;
+      visibleInput.value = change.new_value;
     });
     if (showMessage) window.alert(message);
   }
@@ -237,47 +476,356 @@ function nangoShowValidationError(inputId, validationErrors) {
   input.parentNode.insertBefore(span, input.nextSibling);
 }
 
-function nangoOnUpstreamChange(upstreamTabId, data) {
+function nangoOnUpstreamChange(upstreamTabId, data, ws) {
   /**
-   * This is the handler for messages coming from the server
+   * This is the handler for single-attr "modify" messages
    **/
   //  app, attr, model, new_value, original_value, pk
-  // Find form elements referencing this attribute.
-  const elements = document.querySelectorAll(
-    `input[data-app-label="${data.app}"][data-model-name="${data.model}"][data-instance-pk="${data.pk}"][data-original-name="${data.attr}"]`
+  nangoOnUpstreamChanges(
+    {
+      app: data.app,
+      model: data.model,
+      pk: data.pk,
+      nangoTabId: upstreamTabId,
+      changes: [data]
+    },
+    ws
   );
-  // Work out whether any of them have changed.
-  const changedFormElements = [];
-  elements.forEach(element => {
-    const visibleInput = document.getElementById(element.dataset.relatedFormId);
-    const currentValue = visibleInput.value;
-    if (currentValue !== element.value) {
-      console.log(`"${currentValue}" !== "${element.value}"`);
-      console.log(currentValue);
-      console.log(element.value);
-      changedFormElements.push(element);
+}
+
+function nangoResolveDeltas(instance, ws) {
+  /**
+   * Turn the edit scripts of these changes back into whole values,
+   * using the values this page holds. If it holds something else,
+   * register the instance's fields again, so the server sends them in
+   * full, and return false. Our own saves are already applied.
+   **/
+  const selector = `input[data-app-label="${instance.app}"][data-model-name="${instance.model}"][data-instance-pk="${instance.pk}"]`;
+  const resolved = [];
+  let mismatched = false;
+  instance.changes.forEach(change => {
+    if (!change.delta) {
+      resolved.push(change);
+      return;
+    }
+    const element = document.querySelector(
+      `${selector}[data-original-name="${change.attr}"]`
+    );
+    const value = element && nangoApplyDelta(element.value, change.delta);
+    if (value !== null) {
+      resolved.push({
+        attr: change.attr,
+        original_value: element.value,
+        new_value: value
+      });
+    } else if (instance.nangoTabId !== nangoTabId) {
+      mismatched = true;
     }
-    nangoMarkInputAsOutdated(visibleInput);
   });
+  if (mismatched) {
+    nangoSend(ws, {
+      action: "Register",
+      nangoTabId,
+      features: nangoFeatures,
+      subscription: nangoSubscription,
+      fields: Array.from(document.querySelectorAll(selector)).map(
+        nangoRegisteredField
+      )
+    });
+    return false;
+  }
+  instance.changes = resolved;
+  return true;
+}
+
+function nangoOnUpstreamChanges(instance, ws) {
+  /**
+   * This is the handler for messages coming from the server,
+   * applying every changed attr of one instance in a single pass
+   **/
+  // before the version is noted, so the values sent in full are not
+  // discarded as out of date
+  if (!nangoResolveDeltas(instance, ws) || instance.changes.length === 0) {
+    return;
+  }
+  if (instance.version !== undefined && instance.version !== null) {
+    const key = `${instance.app}.${instance.model}.${instance.pk}`;
+    if (nangoVersions.has(key) && instance.version <= nangoVersions.get(key)) {
+      return;
+    }
+    nangoVersions.set(key, instance.version);
+  }
+  const changes = new Map();
+  instance.changes.forEach(change => changes.set(change.attr, change));
+  // Find form elements referencing the changed attributes.
+  const elements = [];
+  // Work out whether any of them have changed.
+  const changedFormElements = [];
+  document
+    .querySelectorAll(
+      `input[data-app-label="${instance.app}"][data-model-name="${instance.model}"][data-instance-pk="${instance.pk}"]`
+    )
+    .forEach(element => {
+      if (!changes.has(element.dataset.originalName)) return;
+      elements.push(element);
+      const visibleInput = document.getElementById(
+        element.dataset.relatedFormId
+      );
+      const currentValue = visibleInput.value;
+      if (currentValue !== element.value) {
+        console.log(`"${currentValue}" !== "${element.value}"`);
+        changedFormElements.push(element);
+      }
+      nangoMarkInputAsOutdated(visibleInput);
+    });
   nangoDecideWhetherToReload(
-    upstreamTabId,
-    data,
+    instance.nangoTabId,
+    changes,
     elements,
     changedFormElements
   );
 }
 
+function nangoSend(ws, message) {
+  /**
+   * Send a message to the server, in its short form if
+   * the compact protocol was negotiated
+   **/
+  if (ws.protocol !== nangoProtocol) {
+    ws.send(JSON.stringify(message));
+    return;
+  }
+  if (message.action === "Register") {
+    ws.send(
+      JSON.stringify({
+        a: "r",
+        t: message.nangoTabId,
+        f: message.features,
+        s: message.subscription,
+        r: message.fields.map(field => [
+          field.appLabel,
+          field.model,
+          field.pk,
+          field.attr,
+          field.value
+        ])
+      })
+    );
+    return;
+  }
+  if (message.action === "Lock" || message.action === "Unlock") {
+    const dataset = message.dataset;
+    const compactMessage = {
+      a: message.action === "Lock" ? "l" : "u",
+      t: message.nangoTabId,
+      d: [
+        dataset.appLabel,
+        dataset.modelName,
+        dataset.instancePk,
+        dataset.originalName
+      ]
+    };
+    if (message.action === "Lock") {
+      compactMessage.i = ++nangoLastRequestId;
+      nangoPendingRequests.set(compactMessage.i, message);
+    }
+    ws.send(JSON.stringify(compactMessage));
+    return;
+  }
+  if (message.action === "Subscribe") {
+    nangoPendingRequests.set(message.id, message);
+    ws.send(
+      JSON.stringify({
+        a: "q",
+        i: message.id,
+        d: [message.appLabel, message.model],
+        w: message.filter,
+        f: message.attrs
+      })
+    );
+    return;
+  }
+  if (message.action === "Unsubscribe") {
+    ws.send(JSON.stringify({ a: "Q", i: message.id }));
+    return;
+  }
+  if (message.action === "Batch") {
+    ws.send(
+      JSON.stringify({
+        a: "B",
+        t: message.nangoTabId,
+        o: message.operations.map(nangoCompactRequest)
+      })
+    );
+    return;
+  }
+  ws.send(
+    JSON.stringify({ ...nangoCompactRequest(message), t: message.nangoTabId })
+  );
+}
+
+function nangoCompactRequest(message) {
+  /**
+   * The short form of a Clean or Submit, remembering
+   * the request so the reply can be matched up with it
+   **/
+  const id = ++nangoLastRequestId;
+  nangoPendingRequests.set(id, message);
+  const dataset = message.dataset;
+  return {
+    a: message.action === "Clean" ? "c" : "s",
+    i: id,
+    d: [
+      dataset.appLabel,
+      dataset.modelName,
+      dataset.instancePk,
+      dataset.originalName
+    ],
+    cv: message.currentValue,
+    ov: message.originalValue
+  };
+}
+
+async function nangoDecode(raw) {
+  /**
+   * Convert a frame from the server back into a message.
+   * Binary frames are the compact protocol: a flag byte saying
+   * whether the JSON which follows is deflated.
+   **/
+  if (typeof raw === "string") return JSON.parse(raw);
+  const bytes = new Uint8Array(raw);
+  let payload = bytes.subarray(1);
+  if (bytes[0] === 1) {
+    const stream = new Blob([payload])
+      .stream()
+      .pipeThrough(new DecompressionStream("deflate"));
+    payload = new Uint8Array(await new Response(stream).arrayBuffer());
+  }
+  return nangoExpand(JSON.parse(new TextDecoder().decode(payload)));
+}
+
+function nangoExpand(data) {
+  /**
+   * The long form of a compact message
+   **/
+  switch (data.a) {
+    case "b":
+      return {
+        action: "modifyBatch",
+        message: {
+          instances: data.n.map(instance => ({
+            app: instance.a,
+            model: instance.o,
+            pk: instance.p,
+            nangoTabId: instance.t,
+            version: instance.v,
+            changes: instance.c.map(([attr, originalValue, newValue]) =>
+              // an edit script, or the whole values
+              newValue === undefined
+                ? { attr, delta: nangoExpandDelta(originalValue) }
+                : { attr, original_value: originalValue, new_value: newValue }
+            )
+          }))
+        }
+      };
+    case "B":
+      return {
+        action: "batch",
+        message: { results: data.r.map(nangoExpand) }
+      };
+    case "c":
+    case "s":
+    case "x":
+    case "l":
+    case "q": {
+      const message = { ...nangoPendingRequests.get(data.i) };
+      nangoPendingRequests.delete(data.i);
+      if ("cv" in data) message.cleanedValue = data.cv;
+      if ("cd" in data) {
+        // an edit script against the value which was sent
+        message.cleanedValue = nangoApplyDelta(
+          message.currentValue,
+          nangoExpandDelta(data.cd)
+        );
+        if (message.cleanedValue === null) {
+          console.error("Unable to apply the cleaned value", data);
+          message.cleanedValue = message.currentValue;
+        }
+      }
+      if ("ve" in data) message.validationErrors = data.ve;
+      if ("e" in data) message.error = data.e;
+      if ("g" in data) message.granted = data.g;
+      if ("h" in data) message.holder = data.h;
+      if ("ttl" in data) message.ttl = data.ttl;
+      return {
+        action: {
+          c: "clean",
+          s: "submit",
+          x: "superseded",
+          l: "lock",
+          q: "subscribe"
+        }[data.a],
+        message
+      };
+    }
+    default:
+      return data;
+  }
+}
+
+function nangoDispatch(data, ws) {
+  switch (data.action) {
+    case "modify":
+      nangoOnUpstreamChange(data.nangoTabId, data.message, ws);
+      break;
+    case "modifyBatch":
+      data.message.instances.forEach(instance =>
+        nangoOnUpstreamChanges(instance, ws)
+      );
+      break;
+    case "submit":
+      nangoOnSubmit(data.message);
+      break;
+    case "clean":
+      nangoOnClean(data.message);
+      break;
+    case "batch":
+      data.message.results.forEach(result => nangoDispatch(result, ws));
+      break;
+    case "lock":
+      nangoOnLock(ws, data.message);
+      break;
+    case "leased":
+      nangoOnLeased(data.message);
+      break;
+    case "subscribe":
+      nangoOnSubscribe(data.message);
+      break;
+    case "rows":
+      nangoOnRows(data.message);
+      break;
+    case "superseded":
+      // a later Clean/Submit of the same input replaced this one,
+      // and its result will follow
+      break;
+    default:
+      console.error(`Unknown action. Original message follows:`);
+      console.error(data);
+  }
+}
+
 /**
  * Scan the current page, working out whether there are inputs
  * we should be monitoring via websocket
  **/
 window.addEventListener("load", () => {
   const elements = document.querySelectorAll("input[data-related-form-id]");
-  if (elements.length === 0) return; // nothing to do
+  const lists = document.querySelectorAll("[data-nango-subscribe]");
+  if (elements.length === 0 && lists.length === 0) return; // nothing to do
 
   // -1 means to keep the websocket disabled
   const connectionDelay = parseInt(
-    elements[0].dataset.connectionDelay || "-1",
+    (elements[0] || lists[0]).dataset.connectionDelay || "-1",
     10
   );
 
@@ -286,26 +834,19 @@ window.addEventListener("load", () => {
       const scheme =
         window.location.origin.split(":")[0] === "https" ? "wss" : "ws";
       const ws = new WebSocket(
-        `${scheme}://${window.location.host}/ws/liveupdates/`
+        `${scheme}://${window.location.host}/ws/liveupdates/`,
+        [nangoProtocol]
       );
+      ws.binaryType = "arraybuffer";
 
+      // decompressing is asynchronous, so chain the messages
+      // to handle them in the order they arrived
+      let received = Promise.resolve();
       ws.onmessage = e => {
-        const data = JSON.parse(e.data);
-        switch (data.action) {
-          case "modify":
-            nangoOnUpstreamChange(data.nangoTabId, data.message);
-            break;
-          case "submit":
-            nangoOnSubmit(data.message);
-            break;
-          case "clean":
-            nangoOnClean(data.message);
-            break;
-          default:
-            console.error(`Unknown action. Original message follows:`);
-            console.error(data);
-        }
-        // document.querySelector("#chat-log").value += data.message + "\n";
+        received = received
+          .then(() => nangoDecode(e.data))
+          .then(data => nangoDispatch(data, ws))
+          .catch(console.error);
       };
 
       ws.onclose = e => {
@@ -316,26 +857,31 @@ window.addEventListener("load", () => {
       // inform the server which model/attrs we care about, ensuring
       // we will be told when any of them change
       ws.onopen = e => {
-        const fields = [];
-        elements.forEach(element => {
-          fields.push({
-            appLabel: element.dataset.appLabel,
-            model: element.dataset.modelName,
-            pk: element.dataset.instancePk,
-            attr: element.dataset.originalName,
-            id: element.dataset.relatedFormId,
-            value: element.value
-          });
+        setupQuerySubscriptions(ws, lists);
+        if (elements.length === 0) return;
+        const fields = Array.from(elements).map(nangoRegisteredField);
+        nangoSend(ws, {
+          fields,
+          nangoTabId,
+          action: "Register",
+          features: nangoFeatures,
+          subscription: nangoSubscription
         });
-        ws.send(JSON.stringify({ fields, nangoTabId, action: "Register" }));
       };
       // todo: add keepalives (ping/pong)?
-      window.addEventListener("submit", () => {
+      window.addEventListener("submit", e => {
+        // so the server knows which leases are this tab's own
+        const tab = document.createElement("input");
+        tab.type = "hidden";
+        tab.name = "__nango_tab";
+        tab.value = nangoTabId;
+        e.target.appendChild(tab);
         // if we don't do this we might get messages back during form submission,
         // which would not be helpful and may disrupt the flow
         ws.close();
       });
       setupDebounces(ws);
+      setupLeases(ws);
     }, 1000 * connectionDelay);
   }
 });
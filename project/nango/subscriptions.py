@@ -0,0 +1,180 @@
+import logging
+from collections import defaultdict
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Set
+from typing import Tuple
+from typing import Union
+
+from django.core.exceptions import FieldDoesNotExist
+
+from .common import get_model
+from .common import get_serialisation_plan
+from .db.notifications import Message
+
+"""
+Subscriptions to the rows of a model which match a simple filter,
+such as company=7, for pages listing them.
+
+Models opt in by naming the fields which can be filtered on in
+subscription_fields. The notifications of their saves and deletions
+are also sent to the model's channel group, with the serialised values
+of those fields ("keys") and, where they changed, their previous values.
+A row which starts matching a filter is an insert, one which stops
+matching it is a delete, and anything else which matches is an update.
+
+Each process keeps its subscriptions in a SubscriptionIndex, keyed by
+the fields filtered on and then by their values, so a notification is
+routed with a lookup per combination of fields in use, rather than by
+testing every filter.
+"""
+
+LOGGER = logging.getLogger(__file__)
+
+INSERT = "insert"
+UPDATE = "update"
+DELETE = "delete"
+
+# chosen by the client, so only types which can be hashed are accepted
+SubscriptionId = Union[str, int]
+
+
+class Subscription(NamedTuple):
+    # the consumer the events are for
+    subscriber: Any
+    # chosen by the client, unique for the subscriber
+    id: SubscriptionId
+    app: str
+    model: str
+    # (field name, serialised value), sorted by field name
+    filter: Tuple[Tuple[str, str], ...]
+    # the attrs the client wants the values of
+    attrs: Tuple[str, ...]
+
+    @property
+    def fields(self) -> Tuple[str, ...]:
+        return tuple(name for name, _ in self.filter)
+
+    @property
+    def values(self) -> Tuple[str, ...]:
+        return tuple(value for _, value in self.filter)
+
+
+def make_subscription(
+    *,
+    subscriber: Any,
+    id: SubscriptionId,
+    app: str,
+    model: str,
+    filter: Dict[str, Any],
+    attrs: List[str],
+) -> Subscription:
+    """
+    A subscription to the rows of this model matching the filter, which
+    may name each field in its subscription_fields once, by name or
+    attname. Raises LookupError or ValueError if it is not allowed.
+    """
+    Model = get_model(app, model)
+    allowed = getattr(Model, "subscription_fields", None)
+    if allowed is None:
+        raise ValueError(f"{app}.{model} cannot be subscribed to")
+    normalised = {}
+    for name, value in filter.items():
+        try:
+            name = Model._meta.get_field(name).name
+        except FieldDoesNotExist:
+            raise ValueError(f"{app}.{model} has no field {name}")
+        if name not in allowed:
+            raise ValueError(f"{app}.{model} cannot be filtered on {name}")
+        normalised[name] = str(value)
+    plan = get_serialisation_plan(Model)
+    if unknown := [attr for attr in attrs if attr not in plan]:
+        raise ValueError(f"{app}.{model} has no fields {unknown}")
+    return Subscription(
+        subscriber=subscriber,
+        id=id,
+        app=app,
+        model=model,
+        filter=tuple(sorted(normalised.items())),
+        attrs=tuple(attrs),
+    )
+
+
+class SubscriptionIndex:
+    """
+    The subscriptions to the rows of one model, by the
+    fields they filter on and then by their values
+    """
+
+    def __init__(self) -> None:
+        self.index: Dict[Tuple[str, ...], Dict[Tuple[str, ...], Set[Subscription]]] = (
+            defaultdict(lambda: defaultdict(set))
+        )
+
+    def __bool__(self) -> bool:
+        # emptied entries are removed
+        return bool(self.index)
+
+    def add(self, subscription: Subscription) -> None:
+        self.index[subscription.fields][subscription.values].add(subscription)
+
+    def remove(self, subscription: Subscription) -> None:
+        by_values = self.index.get(subscription.fields)
+        if by_values is None:
+            return
+        subscriptions = by_values.get(subscription.values)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del by_values[subscription.values]
+            if not by_values:
+                del self.index[subscription.fields]
+
+    def match(self, message: Message) -> List[Tuple[Subscription, str]]:
+        """
+        The subscriptions the row in this notification matches,
+        or matched before it, and the kind of event each should get
+        """
+        if (keys := message.get("keys")) is None:
+            # not a model with subscription_fields
+            return []
+        before = {**keys, **message.get("previous_keys", {})}
+        matches = []
+        for fields, by_values in self.index.items():
+            if any(name not in keys for name in fields):
+                # deferred when it was saved, so it cannot be routed
+                continue
+            matched_before: Set[Subscription] = set()
+            if not message.get("created"):
+                matched_before = by_values.get(
+                    tuple(before[name] for name in fields), set()
+                )
+            matched_after: Set[Subscription] = set()
+            if not message.get("deleted"):
+                matched_after = by_values.get(
+                    tuple(keys[name] for name in fields), set()
+                )
+            for subscription in matched_before | matched_after:
+                if subscription not in matched_before:
+                    kind = INSERT
+                elif subscription not in matched_after:
+                    kind = DELETE
+                else:
+                    kind = UPDATE
+                matches.append((subscription, kind))
+        return matches
+
+
+def group_by_subscriber(
+    matches: List[Tuple[Subscription, str]],
+) -> Dict[Any, List[Tuple[Any, str]]]:
+    """
+    The ids and kinds of event of the matching subscriptions, by subscriber
+    """
+    by_subscriber: Dict[Any, List[Tuple[Any, str]]] = defaultdict(list)
+    for subscription, kind in matches:
+        by_subscriber[subscription.subscriber].append((subscription.id, kind))
+    return by_subscriber
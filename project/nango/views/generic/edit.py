@@ -3,6 +3,8 @@ from types import MethodType
 from typing import Any
 
 from django.views.generic import edit
+from nango.common import mixin_class
+from nango.db.models import ConcurrentModificationError
 from nango.db.models import TrackableMixin
 from nango.forms import patch_widgets
 from nango.forms import set_original_form_values_on_instance
@@ -54,16 +56,17 @@ class Mixin:
 
         return form
 
+    def form_valid(self, form):
+        try:
+            return super().form_valid(form)
+        except ConcurrentModificationError as exception:
+            # raised by save() when the model uses cas_on_save
+            form.add_error(None, exception)
+            return self.form_invalid(form)
+
 
 def __getattr__(name: str) -> Any:
     original_class = getattr(edit, name)
     if not isclass(original_class):
         raise AttributeError(f"module {__name__} has no attribute {name}")
-    return type(
-        original_class.__name__,
-        (
-            Mixin,
-            original_class,
-        ),
-        {},
-    )
+    return mixin_class(Mixin, original_class)
@@ -0,0 +1,62 @@
+import json
+from inspect import isclass
+from typing import Any
+from typing import Dict
+from typing import Sequence
+
+from django.conf import settings
+from django.forms.utils import flatatt
+from django.views.generic import list as generic_list
+from nango.common import ENABLE_WEBSOCKET
+from nango.common import mixin_class
+
+"""
+List views whose pages are told about the rows which are inserted,
+updated and deleted while they are open, using a queryset subscription
+(see nango.subscriptions) on a model with subscription_fields.
+
+Templates put {{ nango_subscription }} in the tag of the element
+listing the rows, which receives them as "nango:rows" events.
+"""
+
+
+class Mixin:
+    # the attrs whose values are sent with the events of each row
+    subscription_attrs: Sequence[str] = ()
+
+    def get_subscription_filter(self) -> Dict[str, Any]:
+        """
+        The subscription_fields the queryset is filtered on,
+        and their values
+        """
+        return {}
+
+    def get_context_data(self, **kw):
+        context = super().get_context_data(**kw)
+        model = self.object_list.model
+        if ENABLE_WEBSOCKET and getattr(model, "subscription_fields", None) is not None:
+            context["nango_subscription"] = flatatt(
+                {
+                    "data-nango-subscribe": "",
+                    "data-app-label": model._meta.app_label,
+                    "data-model-name": model._meta.model_name,
+                    "data-nango-filter": json.dumps(
+                        {
+                            name: str(value)
+                            for name, value in self.get_subscription_filter().items()
+                        }
+                    ),
+                    "data-nango-attrs": ",".join(self.subscription_attrs),
+                    "data-connection-delay": str(
+                        getattr(settings, "NANGO_WEBSOCKET_CONNECTION_DELAY", -1)
+                    ),
+                }
+            )
+        return context
+
+
+def __getattr__(name: str) -> Any:
+    original_class = getattr(generic_list, name)
+    if not isclass(original_class):
+        raise AttributeError(f"module {__name__} has no attribute {name}")
+    return mixin_class(Mixin, original_class)
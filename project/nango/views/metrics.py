@@ -0,0 +1,17 @@
+from django.http import HttpRequest
+from django.http import HttpResponse
+
+from .. import metrics as nango_metrics
+
+
+def metrics(request: HttpRequest) -> HttpResponse:
+    """
+    Expose the metrics of this process to Prometheus. They describe the
+    site's traffic, so route to this view behind some access control.
+    For example:
+
+        path("metrics/", staff_member_required(nango.views.metrics.metrics))
+    """
+    return HttpResponse(
+        nango_metrics.render(), content_type="text/plain; version=0.0.4"
+    )
@@ -15,10 +15,16 @@ Including another URLconf
 """
 from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
 from django.urls import include
 from django.urls import path
+from nango.views.metrics import metrics
 
-urlpatterns = [path("demo/", include("demo.urls")), path("admin/", admin.site.urls)]
+urlpatterns = [
+    path("demo/", include("demo.urls")),
+    path("admin/", admin.site.urls),
+    path("metrics/", staff_member_required(metrics), name="metrics"),
+]
 
 if "debug_toolbar" in settings.INSTALLED_APPS:
     urlpatterns.append(path("__debug__/", include("debug_toolbar.urls")))